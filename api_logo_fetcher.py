@@ -8,12 +8,21 @@ and integrates with the existing logo management system.
 import os
 import requests
 from dotenv import load_dotenv
-from const import CLUBS
+from clubs import get_registry
+from const import ELITESERIEN, SEASONS
+from metrics import METRICS, record_response
 
 
-def get_team_logos_from_api():
+def get_team_logos_from_api(league=ELITESERIEN, season=SEASONS[-1],
+                            registry=None):
     """
     Fetch team logos from API-Football.
+
+    Args:
+        league: api-football league id, e.g. League.api_id
+        season: Season whose teams are fetched
+        registry: Club registry mapping the names (default: the shared
+                  registry), e.g. League.registry
     
     Returns:
         dict: Mapping of team names to logo URLs
@@ -31,26 +40,25 @@ def get_team_logos_from_api():
         "X-RapidAPI-Host": "api-football-v1.p.rapidapi.com",
     }
     
-    # Eliteserien league ID is 103
-    querystring = {"league": "103", "season": "2025"}
+    querystring = {"league": str(league), "season": str(season)}
     
     try:
-        response = requests.get(url, headers=headers, params=querystring)
+        with METRICS.timer("ingest_request_seconds", source="api-football"):
+            response = requests.get(url, headers=headers, params=querystring)
+        record_response(response, "api-football")
         response.raise_for_status()
         data = response.json()
         
         team_logos = {}
+        if registry is None:
+            registry = get_registry()
         
         for team_data in data["response"]:
             team_name = team_data["team"]["name"]
             logo_url = team_data["team"]["logo"]
             
             # Map API team name to our standard name
-            standard_name = None
-            for standard, variants in CLUBS.items():
-                if team_name in variants:
-                    standard_name = standard
-                    break
+            standard_name = registry.standard_name(team_name, source="api")
             
             if standard_name:
                 team_logos[standard_name] = logo_url
@@ -65,14 +73,17 @@ def get_team_logos_from_api():
         return {}
 
 
-def update_logo_manager_with_api_logos():
+def update_logo_manager_with_api_logos(league=ELITESERIEN, season=SEASONS[-1],
+                                       registry=None):
     """
     Update the logo_manager.py with logos from the football API.
+
+    Args are as for get_team_logos_from_api().
     
     Returns:
         dict: Updated logo URLs
     """
-    api_logos = get_team_logos_from_api()
+    api_logos = get_team_logos_from_api(league, season, registry)
     
     if not api_logos:
         print("No logos fetched from API, using existing URLs")
@@ -81,7 +92,7 @@ def update_logo_manager_with_api_logos():
     # Update the existing logo_manager.py get_logo_urls function
     try:
         from logo_manager import get_logo_urls
-        existing_urls = get_logo_urls()
+        existing_urls = get_logo_urls(league, season, registry)
         
         # Merge API logos with existing ones (API takes priority)
         updated_urls = {**existing_urls, **api_logos}
@@ -0,0 +1,262 @@
+"""
+Backtesting of season forecasts.
+
+Replays past seasons from every matchday cutoff: ratings and tilts are
+rebuilt from the fixtures played before the cutoff, the rest of the season
+is simulated, and the forecast is scored against the final table with
+Brier score, log-loss and calibration curves. Cutoffs are simulated in
+parallel across a process pool.
+
+The starting ratings must predate the first cutoff (by default the ClubELO
+ratings of the day before the first backtested season), otherwise the
+forecasts would see the results they are scored against.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from elo import SimulationContext
+from fetch_elo import fetch_elo_on_date
+from elo_update import replay_fixtures
+from fixtures import fit_tilts
+from simulation import simulate_season
+from table import build_league_table, zone_probabilities
+
+BACKTEST_SEASONS = [2022, 2023, 2024, 2025]
+
+# Events scored with Brier score and calibration curves: (first, last)
+# final position, negative positions count from the bottom
+EVENTS = {
+    "title": (1, 1),
+    "top3": (1, 3),
+    "relegation": (-2, -1),
+}
+
+
+def matchday_cutoffs(fixtures_df, season, step=1):
+    """
+    Forecast cutoffs for a season: before the first matchday and after each
+    matchday except the last.
+
+    Returns:
+        list: Timestamps; fixtures played before a cutoff count as played
+    """
+    dates = fixtures_df.loc[fixtures_df.season == season, "date"].dropna()
+    days = pd.to_datetime(dates, utc=True).dt.normalize().drop_duplicates()
+    days = days.sort_values().tolist()
+    cutoffs = days[:1] + [day + pd.Timedelta(days=1) for day in days[:-1]]
+    return cutoffs[::step]
+
+
+def as_of_fixtures(fixtures_df, cutoff):
+    """Fixtures as they were known at cutoff: later games are unplayed."""
+    fixtures_df = fixtures_df.copy()
+    later = pd.to_datetime(fixtures_df["date"], utc=True) >= cutoff
+    fixtures_df.loc[later, "status"] = "NS"
+    fixtures_df.loc[later, ["home_goals", "away_goals"]] = pd.NA
+    return fixtures_df
+
+
+def as_of_ratings(elo_df, fixtures_df):
+    """
+    Ratings after replaying the played fixtures in fixtures_df on top of
+    elo_df. Only fixtures after a club's EloDate are applied, so results
+    already in a rating are not counted twice. Clubs without a rating start
+    at the lowest rating in elo_df.
+    """
+    clubs = pd.concat([fixtures_df["home"], fixtures_df["away"]]).unique()
+    missing = [club for club in clubs if club not in set(elo_df["Club"])]
+    start = pd.concat([
+        elo_df[["Club", "Elo", "EloDate"]],
+        pd.DataFrame({"Club": missing, "Elo": elo_df["Elo"].min(),
+                      "EloDate": elo_df["EloDate"].min()}),
+    ], ignore_index=True)
+    ratings, _ = replay_fixtures(start, fixtures_df, respect_elo_dates=True)
+    return ratings
+
+
+def starting_ratings(fixtures_df, seasons, registry=None):
+    """ClubELO ratings of the day before the first fixture of seasons."""
+    dates = fixtures_df.loc[fixtures_df.season.isin(seasons), "date"].dropna()
+    opener = pd.to_datetime(dates, utc=True).min()
+    return fetch_elo_on_date(opener.normalize() - pd.Timedelta(days=1),
+                             registry=registry)
+
+
+def check_starting_ratings(elo_df, start, what="the first cutoff"):
+    """
+    Raise a ValueError unless every rating in elo_df is dated before start.
+
+    Ratings dated on or after start may already include the results that
+    are replayed from start on.
+    """
+    if "EloDate" not in elo_df.columns:
+        raise ValueError("elo_df needs an EloDate column to check that the "
+                         "ratings predate the replayed fixtures")
+    latest = pd.to_datetime(elo_df["EloDate"], utc=True).max()
+    if latest >= start:
+        raise ValueError(
+            f"elo_df has ratings from {latest.date()}, not before {what} "
+            f"{start.date()}; use ratings from before it, e.g. "
+            f"starting_ratings()"
+        )
+
+
+def _simulate_cutoff(task):
+    season, cutoff, fixtures_df, elo_df, tilts, n_simulations, seed = task
+    _, position_counts = simulate_season(
+        fixtures_df, n_simulations=n_simulations, season=season, verbose=False,
+        seed=seed, context=SimulationContext(elo_df, tilts),
+    )
+    counts = pd.DataFrame(position_counts).T.fillna(0)
+    return season, cutoff, counts / n_simulations
+
+
+def _prepare_tasks(fixtures_df, elo_df, seasons, n_simulations, step, seed):
+    tasks = []
+    for season in seasons:
+        for cutoff in matchday_cutoffs(fixtures_df, season, step):
+            known = as_of_fixtures(fixtures_df, cutoff)
+            history = known[known.season <= season]
+            tasks.append((
+                season,
+                cutoff,
+                known[known.season == season],
+                as_of_ratings(elo_df, history),
+                fit_tilts(history),
+                n_simulations,
+                seed + len(tasks),
+            ))
+    return tasks
+
+
+def score_forecast(probabilities, final_table, events=EVENTS):
+    """
+    Score a position probability forecast against the final table.
+
+    Args:
+        probabilities: DataFrame, teams x positions, rows summing to 1
+        final_table: Final league table (Team, Position)
+        events: Dict of event name -> (first, last) position
+
+    Returns:
+        tuple: (scores dict, DataFrame of (event, team, probability,
+               outcome) rows for calibration)
+    """
+    actual = final_table.set_index("Team")["Position"]
+    teams = probabilities.index
+    positions = range(1, len(actual) + 1)
+    probabilities = probabilities.reindex(index=teams, columns=positions,
+                                          fill_value=0.0)
+    matrix = probabilities.to_numpy(dtype=float)
+    observed = np.zeros_like(matrix)
+    observed[np.arange(len(teams)), actual.loc[teams].to_numpy() - 1] = 1
+
+    p_actual = (matrix * observed).sum(axis=1)
+    scores = {
+        "log_loss": float(-np.log(np.maximum(p_actual, 1e-4)).mean()),
+        "position_brier": float(((matrix - observed) ** 2).sum(axis=1).mean()),
+    }
+
+    p_events = zone_probabilities(matrix, events)
+    hits = zone_probabilities(observed, events)
+    outcomes = []
+    for i, event in enumerate(events):
+        p_event, hit = p_events[:, i], hits[:, i]
+        scores[f"{event}_brier"] = float(((p_event - hit) ** 2).mean())
+        outcomes.append(pd.DataFrame({"event": event, "team": teams,
+                                      "probability": p_event, "outcome": hit}))
+
+    return scores, pd.concat(outcomes, ignore_index=True)
+
+
+def calibration_curve(outcomes, bins=10):
+    """
+    Observed frequency per predicted probability bin.
+
+    Returns:
+        DataFrame: event, bin, mean predicted probability, observed
+                   frequency and count
+    """
+    outcomes = outcomes.copy()
+    edges = np.linspace(0, 1, bins + 1)
+    outcomes["bin"] = np.clip(np.digitize(outcomes["probability"], edges) - 1,
+                              0, bins - 1)
+    curve = outcomes.groupby(["event", "bin"]).agg(
+        predicted=("probability", "mean"),
+        observed=("outcome", "mean"),
+        count=("outcome", "size"),
+    )
+    return curve.reset_index()
+
+
+def run_backtest(fixtures_df, elo_df=None, seasons=BACKTEST_SEASONS,
+                 n_simulations=1000, cutoff_step=1, max_workers=None,
+                 events=EVENTS, seed=0):
+    """
+    Backtest season forecasts from every matchday cutoff.
+
+    Args:
+        fixtures_df: DataFrame with fixtures for all seasons
+        elo_df: Starting ELO ratings from before the first cutoff, replayed
+                forward through the fixtures before each cutoff (default:
+                ClubELO ratings of the day before the first season)
+        seasons: Seasons to backtest
+        n_simulations: Simulated seasons per cutoff
+        cutoff_step: Use every n-th matchday cutoff
+        max_workers: Worker processes (default: number of CPUs)
+        events: Dict of event name -> (first, last) position to score
+        seed: Base random seed; each cutoff gets its own
+
+    Returns:
+        tuple: (scores DataFrame per season and cutoff, calibration curve
+                DataFrame, forecasts DataFrame of position probabilities)
+    """
+    unfinished = fixtures_df.loc[
+        ~fixtures_df["status"].isin(["FT", "PEN"]), "season"
+    ].unique()
+    skipped = [season for season in seasons if season in set(unfinished)]
+    if skipped:
+        print(f"Skipping unfinished seasons: {skipped}")
+    seasons = [season for season in seasons if season not in skipped]
+
+    if not seasons:
+        raise ValueError("No finished seasons to backtest")
+    if elo_df is None:
+        elo_df = starting_ratings(fixtures_df, seasons)
+    first_cutoff = min(matchday_cutoffs(fixtures_df, season)[0]
+                       for season in seasons)
+    check_starting_ratings(elo_df, first_cutoff)
+
+    tasks = _prepare_tasks(fixtures_df, elo_df, seasons, n_simulations,
+                           cutoff_step, seed)
+    print(f"Backtesting {len(tasks)} cutoffs in {len(seasons)} seasons "
+          f"with {n_simulations} simulations each")
+
+    final_tables = {
+        season: build_league_table(fixtures_df.loc[fixtures_df.season == season])
+        for season in seasons
+    }
+
+    scores, outcomes, forecasts = [], [], []
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        for season, cutoff, probabilities in pool.map(_simulate_cutoff, tasks):
+            point_scores, point_outcomes = score_forecast(
+                probabilities, final_tables[season], events
+            )
+            scores.append({"season": season, "cutoff": cutoff, **point_scores})
+            outcomes.append(point_outcomes)
+
+            forecast = probabilities.copy()
+            forecast.index.name = "team"
+            forecast = forecast.reset_index()
+            forecast.insert(0, "cutoff", cutoff)
+            forecast.insert(0, "season", season)
+            forecasts.append(forecast)
+
+    calibration = calibration_curve(pd.concat(outcomes, ignore_index=True))
+    return (pd.DataFrame(scores), calibration,
+            pd.concat(forecasts, ignore_index=True))
@@ -0,0 +1,115 @@
+"""
+Club name registry shared by every data source.
+
+ClubELO, api-football and the logo fetcher all spell club names differently.
+The registry is built once from const.CLUBS and gives every club a stable
+integer id, the per-source aliases and vectorized name normalization.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from const import CLUB_SOURCES, CLUBS
+
+
+class ClubRegistry:
+
+    def __init__(self, clubs=None, sources=CLUB_SOURCES):
+        self.sources = tuple(sources)
+        self.names = []
+        self.ids = {}
+        self._variants = {source: {} for source in self.sources}
+        self._aliases = {source: {} for source in self.sources}
+        self._lookup = {}
+        self._index = pd.Index([], dtype=object)
+        if clubs:
+            self.register(clubs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def register(self, clubs):
+        """
+        Add clubs to the registry.
+
+        Args:
+            clubs: Dict of standard name -> list of variants, one per source
+                   (None when a source does not cover the club)
+
+        New clubs are appended, so the ids of existing clubs never change.
+        A source name that already belongs to another club raises a
+        ValueError instead of silently remapping it.
+        """
+        for standard, variants in clubs.items():
+            if standard not in self.ids:
+                self.ids[standard] = len(self.names)
+                self.names.append(standard)
+            self._lookup[standard] = standard
+            for source, variant in zip(self.sources, variants):
+                if variant is None:
+                    continue
+                known = self._aliases[source].get(variant, standard)
+                if known != standard:
+                    raise ValueError(f"{source} name {variant!r} is used for "
+                                     f"both {known} and {standard}")
+                self._variants[source][standard] = variant
+                self._aliases[source][variant] = standard
+                self._lookup.setdefault(variant, standard)
+
+        self._index = pd.Index(self.names, dtype=object)
+        return self
+
+    def variants(self, source):
+        """Standard name -> variant used by `source`, for clubs it covers."""
+        return dict(self._variants[source])
+
+    def aliases(self, source=None):
+        """Variant -> standard name, for one source or all of them."""
+        if source is None:
+            return dict(self._lookup)
+        return {**{name: name for name in self.names}, **self._aliases[source]}
+
+    def standard_name(self, name, source=None):
+        """Standard name for a single variant, or None if it is unknown."""
+        if source is None:
+            return self._lookup.get(name)
+        return self._aliases[source].get(name, name if name in self.ids else None)
+
+    def normalize(self, values, source=None):
+        """
+        Map club name variants to standard names.
+
+        Unknown names are kept as they are. The lookup is done once per
+        distinct name, not once per row.
+        """
+        values = pd.Series(values)
+        codes, uniques = pd.factorize(values)
+        lookup = self.aliases(source)
+        standard = np.array([lookup.get(name, name) for name in uniques] + [None],
+                            dtype=object)
+        return pd.Series(standard[codes], index=values.index, name=values.name)
+
+    def codes(self, names):
+        """Integer club ids for standard names, -1 for unknown clubs."""
+        return self._index.get_indexer(pd.Index(names, dtype=object))
+
+    def categorical(self, names):
+        """Standard names as a Categorical whose codes are the club ids."""
+        return pd.Categorical(names, categories=self.names)
+
+    def add_codes(self, df, columns=("home", "away")):
+        """Add `<column>_id` integer id columns for the given name columns."""
+        for column in columns:
+            df[f"{column}_id"] = self.codes(df[column])
+        return df
+
+
+@lru_cache(maxsize=None)
+def get_registry():
+    """The shared registry built from const.CLUBS."""
+    return ClubRegistry(CLUBS)
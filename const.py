@@ -1,4 +1,5 @@
-# Key: standard. Value (variants): [ClubELO, API]
+# Key: standard. Value (variants): [ClubELO, API], None when a source lacks the club
+CLUB_SOURCES = ("clubelo", "api")
 CLUBS = {
     "Aalesund": ["Aalesund", "Aalesund"],
     "Bodø/Glimt": ["Bodoe Glimt", "Bodo/Glimt"],
@@ -7,12 +8,12 @@ CLUBS = {
     "Fredrikstad": ["Fredrikstad", "Fredrikstad"],
     "Ham-Kam": ["Ham-Kam", "Ham-kam"],
     "Haugesund": ["Haugesund", "Haugesund"],
-    "Jerv": ["XX", "jerv"],
+    "Jerv": [None, "jerv"],
     "KFUM Oslo": ["KFUM Oslo", "KFUM Oslo"],
     "Kristiansund": ["Kristiansund", "Kristiansund BK"],
     "Lillestrøm": ["Lillestrom", "Lillestrom"],
     "Molde": ["Molde", "Molde"],
-    "Odd": ["XX", "ODD Ballklubb"],
+    "Odd": [None, "ODD Ballklubb"],
     "Rosenborg": ["Rosenborg", "Rosenborg"],
     "Sandefjord": ["Sandefjord", "Sandefjord"],
     "Sarpsborg 08": ["Sarpsborg", "Sarpsborg 08 FF"],
@@ -25,5 +26,32 @@ CLUBS = {
 
 HFA = 61.2  # Home Field Advantage Norway (from ClubELO)
 MEAN_GOALS = 3.07  # mean scored goals from 2022-2025 in Eliteserien
+K_FACTOR = 20  # Points exchange per game (from ClubELO)
+ELO_NOISE = 15  # Std. dev. of the ELO noise in each simulated match
+DRAW_MODEL = {"base": 0.29, "slope": 0.0006, "floor": 0.12, "cap": 0.35}
 
-SEASONS = ["2022", "2023", "2024", "2025"]  # Seasons to fetch fixtures for
\ No newline at end of file
+# Table zones: column -> (first, last) position, negative counts from the bottom
+ZONES = {
+    "Vinner (%)": (1, 1),
+    "CL (%)": (1, 2),
+    "Europa League (%)": (1, 3),
+    "Conference League (%)": (1, 4),
+    "Nedrykk (%)": (-2, -1),
+}
+
+ELITESERIEN = 103  # api-football league id
+
+SEASONS = ["2022", "2023", "2024", "2025"]  # Seasons to fetch fixtures for
+
+# League configurations: key -> settings, see league.League
+LEAGUES = {
+    "eliteserien": {
+        "name": "Eliteserien",
+        "api_id": ELITESERIEN,
+        "hfa": HFA,
+        "mean_goals": MEAN_GOALS,
+        "zones": ZONES,
+        "clubs": CLUBS,
+        "seasons": SEASONS,
+    },
+}
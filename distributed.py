@@ -0,0 +1,310 @@
+"""
+Season simulation across several hosts.
+
+A coordinator splits simulation jobs (a league or scenario each) into
+chunks and hands them out over plain TCP to workers, which can run on any
+host that reaches the coordinator. Workers send back mergeable aggregates
+instead of raw simulations. A chunk whose worker disconnects or times out
+is put back in the queue for another worker.
+
+Connections use multiprocessing.connection, authenticated with a shared
+key (SIMULATION_AUTHKEY in .env or passed explicitly). Messages are pickled,
+so only run workers against coordinators you trust.
+
+Chunk i of a job is simulated on the random stream spawned from
+SeedSequence(seed) with spawn key i, as in simulation_cache, so the result
+does not depend on which worker ran which chunk.
+"""
+
+import os
+import queue
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from elo import get_context
+from simulation import STATS, season_inputs, simulate_season_batch
+from simulation_cache import CHUNK_SIZE
+
+DEFAULT_ADDRESS = ("localhost", 6000)
+
+
+def _authkey(authkey=None):
+    if authkey is not None:
+        return authkey.encode() if isinstance(authkey, str) else authkey
+    load_dotenv()
+    key = os.getenv("SIMULATION_AUTHKEY")
+    if not key:
+        raise ValueError("No authkey given and SIMULATION_AUTHKEY is not set")
+    return key.encode()
+
+
+class SeasonAggregate:
+    """
+    Mergeable summary of simulated seasons: number of simulations, sums and
+    sums of squares of every stat and the position counts per team.
+    """
+
+    def __init__(self, teams):
+        self.teams = list(teams)
+        n_teams = len(self.teams)
+        self.n = 0
+        self.sums = {stat: np.zeros(n_teams) for stat in STATS}
+        self.squares = {stat: np.zeros(n_teams) for stat in STATS}
+        self.position_counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+
+    @classmethod
+    def from_batch(cls, teams, batch):
+        aggregate = cls(teams)
+        n_simulations, n_teams = batch["Position"].shape
+        aggregate.n = n_simulations
+        for stat in STATS:
+            values = batch[stat].astype(float)
+            aggregate.sums[stat] = values.sum(axis=0)
+            aggregate.squares[stat] = (values ** 2).sum(axis=0)
+        np.add.at(aggregate.position_counts,
+                  (np.tile(np.arange(n_teams), n_simulations),
+                   batch["Position"].ravel() - 1), 1)
+        return aggregate
+
+    def merge(self, other):
+        """Add the simulations of another aggregate of the same teams."""
+        if other.teams != self.teams:
+            raise ValueError("Cannot merge aggregates of different teams")
+        self.n += other.n
+        for stat in STATS:
+            self.sums[stat] += other.sums[stat]
+            self.squares[stat] += other.squares[stat]
+        self.position_counts += other.position_counts
+        return self
+
+    def summary(self):
+        """Mean and standard deviation of every stat per team."""
+        columns = {}
+        for stat in STATS:
+            mean = self.sums[stat] / self.n
+            columns[f"Exp {stat}"] = mean
+            columns[f"{stat} std"] = np.sqrt(
+                np.maximum(self.squares[stat] / self.n - mean ** 2, 0)
+            )
+        summary = pd.DataFrame(columns, index=pd.Index(self.teams, name="Team"))
+        return summary.sort_values("Exp Points", ascending=False)
+
+    def position_probabilities(self):
+        """DataFrame of teams x positions."""
+        return pd.DataFrame(self.position_counts / self.n, index=self.teams,
+                            columns=range(1, len(self.teams) + 1))
+
+
+class SeasonJob:
+    """One season simulation (a league or scenario) to spread over workers."""
+
+    def __init__(self, name, inputs, params, n_simulations, seed=0,
+                 chunk_size=CHUNK_SIZE):
+        self.name = name
+        self.inputs = inputs
+        self.params = params
+        self.n_simulations = n_simulations
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_fixtures(cls, name, fixtures_df, n_simulations, season=2025,
+                      context=None, seed=0, chunk_size=CHUNK_SIZE,
+                      cutoff_date=None, **params):
+        """
+        Job from fixtures and a SimulationContext (default: the default
+        context). params are passed on to simulate_season_batch().
+        """
+        context = get_context(context)
+        inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+        params = {
+            "hfa": context.hfa,
+            "base_goals": context.base_goals,
+            "noise": context.noise,
+            "k": context.k,
+            **params,
+        }
+        return cls(name, inputs, params, n_simulations, seed, chunk_size)
+
+    def chunks(self):
+        """(name, chunk index, size) of every chunk."""
+        n_chunks = -(-self.n_simulations // self.chunk_size)
+        return [
+            (self.name, chunk,
+             min(self.chunk_size, self.n_simulations - chunk * self.chunk_size))
+            for chunk in range(n_chunks)
+        ]
+
+
+def simulate_chunk(job, chunk, size):
+    """Simulate one chunk of a job and aggregate it."""
+    rng = np.random.default_rng(np.random.SeedSequence(job.seed,
+                                                       spawn_key=(chunk,)))
+    inputs = job.inputs
+    batch = simulate_season_batch(
+        inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+        inputs["base_table"], size, rng=rng, **job.params,
+    )
+    return SeasonAggregate.from_batch(inputs["teams"], batch)
+
+
+def run_worker(address=DEFAULT_ADDRESS, authkey=None, retry=10):
+    """
+    Simulate chunks from a coordinator until it says stop.
+
+    Args:
+        address: (host, port) of the coordinator
+        authkey: Shared key (default: SIMULATION_AUTHKEY)
+        retry: Seconds to keep retrying while the coordinator is not up yet
+
+    Returns:
+        int: Number of chunks simulated
+    """
+    authkey = _authkey(authkey)
+    deadline = time.monotonic() + retry
+    while True:
+        try:
+            conn = Client(tuple(address), authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+    jobs, done = {}, 0
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            name, chunk, size, job = message
+            if job is not None:
+                jobs[name] = job
+            conn.send((name, chunk, simulate_chunk(jobs[name], chunk, size)))
+            done += 1
+    return done
+
+
+def _serve_worker(conn, jobs, pending, results, lock, all_done,
+                  chunk_timeout, verbose):
+    # Hands chunks to one connected worker until all chunks are done
+    sent_jobs = set()
+    with conn:
+        while not all_done.is_set():
+            try:
+                name, chunk, size = pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with lock:
+                if (name, chunk) in results:
+                    continue
+            try:
+                job = None if name in sent_jobs else jobs[name]
+                conn.send((name, chunk, size, job))
+                sent_jobs.add(name)
+                if not conn.poll(chunk_timeout):
+                    raise TimeoutError(f"chunk {chunk} of {name} timed out")
+                _, _, aggregate = conn.recv()
+            except (EOFError, OSError, TimeoutError) as e:
+                if verbose:
+                    print(f"Lost worker ({e!r}), requeueing chunk {chunk} of {name}")
+                pending.put((name, chunk, size))
+                return
+
+            with lock:
+                results.setdefault((name, chunk), aggregate)
+                if len(results) == sum(len(job.chunks()) for job in jobs.values()):
+                    all_done.set()
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+
+
+def run_coordinator(jobs, address=DEFAULT_ADDRESS, authkey=None,
+                    chunk_timeout=600, verbose=True):
+    """
+    Distribute the chunks of jobs over connecting workers and merge results.
+
+    Args:
+        jobs: List of SeasonJob objects with unique names
+        address: (host, port) to listen on, e.g. ("0.0.0.0", 6000)
+        authkey: Shared key (default: SIMULATION_AUTHKEY)
+        chunk_timeout: Seconds before a chunk is given to another worker
+        verbose: Print progress
+
+    Returns:
+        dict: Mapping of job names to SeasonAggregate
+    """
+    jobs = {job.name: job for job in jobs}
+    pending = queue.Queue()
+    for job in jobs.values():
+        for chunk in job.chunks():
+            pending.put(chunk)
+    n_chunks = pending.qsize()
+
+    results, lock, all_done = {}, threading.Lock(), threading.Event()
+    listener = Listener(tuple(address), authkey=_authkey(authkey))
+    if verbose:
+        print(f"Coordinating {n_chunks} chunks of {len(jobs)} jobs on "
+              f"{listener.address}")
+
+    def accept():
+        while not all_done.is_set():
+            try:
+                conn = listener.accept()
+            except Exception:
+                # Failed handshake, or the wake-up connection below
+                continue
+            if all_done.is_set():
+                conn.close()
+                return
+            threading.Thread(
+                target=_serve_worker,
+                args=(conn, jobs, pending, results, lock, all_done,
+                      chunk_timeout, verbose),
+                daemon=True,
+            ).start()
+
+    accept_thread = threading.Thread(target=accept, daemon=True)
+    accept_thread.start()
+    all_done.wait()
+
+    # Wake the accept() call with a throwaway connection so it can return
+    host, port = listener.address
+    try:
+        socket.create_connection(
+            ("localhost" if host in ("", "0.0.0.0") else host, port), timeout=1
+        ).close()
+    except OSError:
+        pass
+    accept_thread.join(timeout=5)
+    listener.close()
+
+    aggregates = {}
+    for (name, chunk), aggregate in sorted(results.items()):
+        if name in aggregates:
+            aggregates[name].merge(aggregate)
+        else:
+            aggregates[name] = aggregate
+    if verbose:
+        print(f"Finished {n_chunks} chunks")
+    return aggregates
+
+
+if __name__ == "__main__":
+    # Start a worker: python distributed.py [host] [port]
+    import sys
+
+    host = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS[0]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ADDRESS[1]
+    print(f"Simulated {run_worker((host, port))} chunks")
@@ -1,32 +1,119 @@
-import random
+from functools import lru_cache
+from types import MappingProxyType
 
 import numpy as np
 
-from const import HFA, MEAN_GOALS
+from const import DRAW_MODEL, ELO_NOISE, HFA, K_FACTOR, MEAN_GOALS
 from fetch_elo import fetch_elo_data
 
 DEBUG = False
 
-elo_df = None
+class SimulationContext:
+    """
+    Ratings, tilts and model parameters of a simulation run.
+
+    A context is never modified after it is created (replace() returns a new
+    one): tilts is a read-only mapping and elo_df returns a copy, so
+    concurrent runs with their own contexts share nothing mutable.
+    """
+
+    def __init__(self, elo_df=None, tilts=None, hfa=HFA, k=K_FACTOR,
+                 noise=ELO_NOISE, base_goals=MEAN_GOALS):
+        self._elo_df = None if elo_df is None else elo_df.copy()
+        self.tilts = MappingProxyType(dict(tilts or {}))
+        self.hfa = hfa
+        self.k = k
+        self.noise = noise
+        self.base_goals = base_goals
+        self._ratings = (
+            {} if elo_df is None
+            else dict(zip(elo_df["Club"], elo_df["Elo"].astype(float)))
+        )
+
+    @property
+    def elo_df(self):
+        """Copy of the ratings DataFrame (None if not set)."""
+        return None if self._elo_df is None else self._elo_df.copy()
+
+    def _fields(self):
+        return {
+            "elo_df": self._elo_df,
+            "tilts": dict(self.tilts),
+            "hfa": self.hfa,
+            "k": self.k,
+            "noise": self.noise,
+            "base_goals": self.base_goals,
+        }
+
+    def __reduce__(self):
+        # MappingProxyType cannot be pickled, rebuild from the fields
+        return _context_from_fields, (self._fields(),)
+
+    def replace(self, **changes):
+        """Copy of the context with some fields changed."""
+        fields = self._fields()
+        fields.update(changes)
+        return SimulationContext(**fields)
+
+    def rating(self, club):
+        if self._elo_df is None:
+            raise ValueError("elo_df is not set. Use set_elo_df() or a "
+                             "SimulationContext with elo_df.")
+        if club not in self._ratings:
+            raise ValueError(f"No ELO rating for: {club}")
+        return self._ratings[club]
+
+    def ratings(self, clubs):
+        """Ratings of clubs as a float array, without copying elo_df."""
+        if self._elo_df is None:
+            raise ValueError("elo_df is not set. Use set_elo_df() or a "
+                             "SimulationContext with elo_df.")
+        missing = [club for club in clubs if club not in self._ratings]
+        if missing:
+            raise ValueError(f"No ELO rating for: {', '.join(missing)}")
+        return np.array([self._ratings[club] for club in clubs], dtype=float)
+
+    def tilt(self, club):
+        return self.tilts.get(club, 1)
+
+
+def _context_from_fields(fields):
+    return SimulationContext(**fields)
+
+
+# Context used when none is passed, set through set_elo_df()/set_tilts()
+_default_context = SimulationContext()
+
+
+def get_context(context=None):
+    """context, or the default context if it is None."""
+    return _default_context if context is None else context
+
 
 def set_elo_df(df):
-    global elo_df
-    elo_df = df
+    global _default_context
+    _default_context = _default_context.replace(elo_df=df)
 
 
 def set_tilts(tilts_dict):
-    global tilts
-    tilts = tilts_dict
+    global _default_context
+    _default_context = _default_context.replace(tilts=tilts_dict)
+
+
+def __getattr__(name):
+    # elo.elo_df and elo.tilts read from the default context
+    if name in ("elo_df", "tilts"):
+        return getattr(_default_context, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Club:
 
-    def __init__(self, name, tilt_lookup=True):
+    def __init__(self, name, tilt_lookup=True, context=None):
+        context = get_context(context)
         self.name = name
-        if elo_df is None:
-            raise ValueError("elo_df is not set. Use set_elo_df() before creating Club objects.")
-        self.elo = elo_df.loc[elo_df["Club"] == self.name]["Elo"].values[0]
-        self.tilt = tilts.get(name, 1) if tilt_lookup else 1
+        self.elo = context.rating(name)
+        self.tilt = context.tilt(name) if tilt_lookup else 1
 
 
 class Match:
@@ -37,12 +124,16 @@ class Match:
         away,
         home_goals=None,
         away_goals=None,
-        home_advantage=HFA,
+        home_advantage=None,
         noise=True,
+        context=None,
+        rng=None,
     ):
-        self.hfa = home_advantage
-        self.home = Club(home)
-        self.away = Club(away)
+        self.context = get_context(context)
+        self.rng = np.random if rng is None else rng
+        self.hfa = self.context.hfa if home_advantage is None else home_advantage
+        self.home = Club(home, context=self.context)
+        self.away = Club(away, context=self.context)
 
         self.home_goals = home_goals
         self.away_goals = away_goals
@@ -50,7 +141,7 @@ class Match:
         self.dr = self.home.elo + self.hfa - self.away.elo
 
         if noise:
-            self.dr += np.random.normal(0, 15)  # ~15 ELO points
+            self.dr += self.rng.normal(0, self.context.noise)  # ~15 ELO points
 
         self.elo = 1 / (10 ** (-self.dr / 400) + 1)
 
@@ -86,7 +177,7 @@ class Match:
         else:
             self.result = "away"
 
-    def expected_elo_exchange(self, k=20):
+    def expected_elo_exchange(self, k=None):
         """
         Updates the elo after a game
         Points exchange (from http://clubelo.com/System)
@@ -100,9 +191,10 @@ class Match:
         elif self.result == "away":
             R = 0
 
+        k = self.context.k if k is None else k
         self.expected_elo_exchange = (R - self.elo) * k
 
-    def apply_elo_exchange(self, k=20):
+    def apply_elo_exchange(self, k=None):
         if self.result == "draw":
             R = 0.5
         elif self.result == "home":
@@ -110,6 +202,8 @@ class Match:
         else:
             R = 0.0
 
+        k = self.context.k if k is None else k
+
         # Calculate expected result again if not cached
         expected_home = self.elo
         exchange = (R - expected_home) * k
@@ -136,7 +230,7 @@ class Match:
         p_away = max(0, min(1, p_away))
 
         # Step 4: Simulate result
-        roll = random.random()
+        roll = self.rng.random()
         if roll < p_home:
             self.result = "home"
         elif roll < p_home + p_draw:
@@ -151,8 +245,11 @@ class Match:
             )
             print(f"Random draw: {round(roll, 3)} → Result: {self.result.capitalize()}")
 
-    def simulate_goals(self, base_goals=MEAN_GOALS):
+    def simulate_goals(self, base_goals=None):
         """Simulate realistic scorelines using tilt logic"""
+        if base_goals is None:
+            base_goals = self.context.base_goals
+
         # Step 1: Expected total goals
         exp_total_goals = self.home.tilt * self.away.tilt * base_goals
 
@@ -164,8 +261,8 @@ class Match:
         exp_away_goals = exp_total_goals * away_share
 
         # Step 3: Simulate actual goals using Poisson distribution
-        self.home_goals = np.random.poisson(exp_home_goals)
-        self.away_goals = np.random.poisson(exp_away_goals)
+        self.home_goals = self.rng.poisson(exp_home_goals)
+        self.away_goals = self.rng.poisson(exp_away_goals)
 
         self.set_result_from_goals()
 
@@ -174,44 +271,142 @@ class Match:
                 f"Simulated score: {self.home.name} {self.home_goals} - {self.away_goals} {self.away.name}"
             )
 
-    ## NOT IN USE YET
-    def elo_exchange_margin(self, p_margin):
+    def elo_exchange_margin(self, k=None, base_goals=None):
         """
-        Weighting goal difference
-        p_margin: likelyhood for a specific margin
-        p_1X2: the likelyhood to win (or lose) by any margin.
+        Goal-margin weighted ELO exchange for the home team
+        (from http://clubelo.com/System)
+        The exchange of a win is scaled by the square root of the margin,
+        normalised so the expected exchange for a win is unchanged.
         """
-        elo_1goal = self.expected_elo_exchange / sum(
-            margin ** (1 / 2) * p_margin / p_1X2
+        k = self.context.k if k is None else k
+        if base_goals is None:
+            base_goals = self.context.base_goals
+        exp_total_goals = self.home.tilt * self.away.tilt * base_goals
+        weight = margin_weight(
+            self.home_goals,
+            self.away_goals,
+            exp_total_goals * self.elo,
+            exp_total_goals * (1 - self.elo),
         )
+        R = {"home": 1.0, "draw": 0.5, "away": 0.0}[self.result]
+        self.elo_points_margin = (R - self.elo) * k * weight
 
-        self.elo_points_margin = elo_1goal * margin ** (1 / 2)
+        if DEBUG:
+            print(
+                f"ELO exchange points for home team due to margin: {self.elo_points_margin}"
+            )
 
-        return print(
-            f"ELO exchange points for home team due to margin: {self.elo_points_margin}"
-        )
+        return self.elo_points_margin
 
-    ## NOT IN USE YET
     def update_tilt(self, exp_game_total_goals, game_total_goals):
         """
         Updates tilt after a game
         Tilt is designed to be a measure of offensiveness
         from http://clubelo.com/System
         """
-        self.home.tilt = (
-            0.98 * self.home.tilt
-            + 0.02 * game_total_goals / self.away.tilt / exp_game_total_goals
-        )
-        self.away.tilt = (
-            0.98 * self.away.tilt
-            + 0.02 * game_total_goals / self.home.tilt / exp_game_total_goals
-        )
-        return print(
-            f"The tilts have been updated, new home team tilt: {self.home.tilt}, new away team tilt: {self.away.tilt}"
+        self.home.tilt, self.away.tilt = updated_tilts(
+            self.home.tilt, self.away.tilt, game_total_goals, exp_game_total_goals
         )
 
+        if DEBUG:
+            print(
+                f"The tilts have been updated, new home team tilt: {self.home.tilt}, new away team tilt: {self.away.tilt}"
+            )
+
 
-def draw_probability(delta_elo):
+def expected_score(delta_elo):
+    """Expected result for the home team, for scalars and arrays"""
+    return 1 / (10 ** (-delta_elo / 400) + 1)
+
+
+def updated_tilts(home_tilt, away_tilt, total_goals, base_goals=MEAN_GOALS,
+                  weight=0.02):
+    """
+    Tilts after a game, for scalars and arrays
+    Each tilt moves towards total_goals / opponent tilt / base_goals, the
+    estimate implied by total_goals = tilt_home * tilt_away * base_goals
+    (from http://clubelo.com/System)
+    """
+    new_home = (1 - weight) * home_tilt + weight * total_goals / away_tilt / base_goals
+    new_away = (1 - weight) * away_tilt + weight * total_goals / home_tilt / base_goals
+    return new_home, new_away
+
+
+def _poisson_pmf(goals, mu):
+    log_factorial = np.cumsum(np.log(np.maximum(np.arange(goals.max() + 1), 1)))
+    mu = np.maximum(mu, 1e-12)
+    return np.exp(goals * np.log(mu) - mu - log_factorial[goals])
+
+
+def margin_normalizers(exp_home_goals, exp_away_goals, max_goals=10):
+    """
+    Expected square root of the winning margin given a home win and given
+    an away win, under independent Poisson goals. Works on arrays.
+    """
+    goals = np.arange(max_goals + 1)
+    pmf_home = _poisson_pmf(goals, np.asarray(exp_home_goals, dtype=float)[..., None])
+    pmf_away = _poisson_pmf(goals, np.asarray(exp_away_goals, dtype=float)[..., None])
+    joint = pmf_home[..., :, None] * pmf_away[..., None, :]
+
+    margin = goals[:, None] - goals[None, :]
+    sqrt_margin = np.sqrt(np.abs(margin))
+    normalizers = []
+    for won in [margin > 0, margin < 0]:
+        p_win = (joint * won).sum(axis=(-2, -1))
+        weighted = (joint * won * sqrt_margin).sum(axis=(-2, -1))
+        normalizers.append(np.where(p_win > 0, weighted / np.maximum(p_win, 1e-300), 1.0))
+    return normalizers[0], normalizers[1]
+
+
+@lru_cache(maxsize=None)
+def _margin_table(max_total=12.0, n_totals=97, n_shares=101):
+    totals = np.linspace(0, max_total, n_totals)
+    shares = np.linspace(0, 1, n_shares)
+    exp_home = totals[:, None] * shares[None, :]
+    home, away = margin_normalizers(exp_home, totals[:, None] - exp_home)
+    return totals, shares, np.stack([home, away])
+
+
+def margin_weight(home_goals, away_goals, exp_home_goals, exp_away_goals):
+    """
+    Weight of the ELO exchange for the goal margin, for scalars and arrays.
+
+    sqrt(margin) divided by the expected sqrt(margin) for that winner, so the
+    expected exchange is the same as without margin weighting. Draws have
+    weight 1. The normalizers are interpolated from a precomputed table so
+    this is cheap on large simulation batches.
+    """
+    totals, shares, table = _margin_table()
+    exp_total = np.asarray(exp_home_goals) + np.asarray(exp_away_goals)
+    share = np.asarray(exp_home_goals) / np.maximum(exp_total, 1e-12)
+
+    # Bilinear interpolation in (expected total goals, home share)
+    t = np.clip(exp_total / totals[-1], 0, 1) * (len(totals) - 1)
+    s = np.clip(share, 0, 1) * (len(shares) - 1)
+    t0 = np.minimum(t.astype(int), len(totals) - 2)
+    s0 = np.minimum(s.astype(int), len(shares) - 2)
+    dt, ds = t - t0, s - s0
+
+    side = (np.asarray(home_goals) < np.asarray(away_goals)).astype(int)
+    normalizer = (
+        table[side, t0, s0] * (1 - dt) * (1 - ds)
+        + table[side, t0 + 1, s0] * dt * (1 - ds)
+        + table[side, t0, s0 + 1] * (1 - dt) * ds
+        + table[side, t0 + 1, s0 + 1] * dt * ds
+    )
+
+    margin = np.abs(np.asarray(home_goals) - np.asarray(away_goals))
+    return np.where(margin == 0, 1.0, np.sqrt(margin) / normalizer)
+
+
+def draw_probability(
+    delta_elo,
+    base=DRAW_MODEL["base"],
+    slope=DRAW_MODEL["slope"],
+    floor=DRAW_MODEL["floor"],
+    cap=DRAW_MODEL["cap"],
+):
     # Higher draws near 0, lower draws when one team is much stronger
-    p_draw = 0.29 - 0.0006 * abs(delta_elo)
-    return max(0.12, min(p_draw, 0.35))
+    # Works on scalars and arrays of ELO differences
+    p_draw = base - slope * np.abs(delta_elo)
+    return np.clip(p_draw, floor, cap)
@@ -0,0 +1,230 @@
+"""
+Persistent, event-sourced ELO state.
+
+The state is the ClubELO ratings it was seeded with plus a log of every
+fixture that has been applied on top of them. A refresh only replays
+fixtures that are not in the log yet, and a corrected result rolls the log
+back to that fixture so everything after it is replayed.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from const import HFA, K_FACTOR
+from elo_update import PLAYED_STATUSES, played_fixture_arrays, replay_elo
+
+LOG_COLUMNS = ["id", "date", "home", "away", "home_goals", "away_goals",
+               "exchange"]
+
+
+class EloState:
+
+    def __init__(self, base_elo, log=None, k=K_FACTOR, hfa=HFA):
+        """
+        Args:
+            base_elo: DataFrame with Club, Elo and EloDate columns
+            log: DataFrame with the applied fixtures (LOG_COLUMNS). The
+                 exchange is NaN for fixtures that were already included in
+                 the base rating or involve an unknown club.
+            k: K-factor of the exchange
+            hfa: Home field advantage in Elo points
+        """
+        self.base = base_elo[["Club", "Elo", "EloDate"]].reset_index(drop=True)
+        self.clubs = self.base["Club"].tolist()
+        self.k = k
+        self.hfa = hfa
+
+        if log is None:
+            log = pd.DataFrame({column: [] for column in LOG_COLUMNS})
+        self.log = log[LOG_COLUMNS].reset_index(drop=True)
+
+        base_dates = pd.to_datetime(self.base["EloDate"], utc=True)
+        self._base_dates = (base_dates.dt.tz_localize(None)
+                            .to_numpy(dtype="datetime64[ns]").astype(np.int64))
+        self._rebuild()
+
+    @classmethod
+    def load(cls, state_file="elo_state.parquet", log_file="elo_log.parquet",
+             **kwargs):
+        """Load a saved state, or return None if there is none."""
+        if not os.path.exists(state_file):
+            return None
+        log = pd.read_parquet(log_file) if os.path.exists(log_file) else None
+        return cls(pd.read_parquet(state_file), log, **kwargs)
+
+    def save(self, state_file="elo_state.parquet", log_file="elo_log.parquet"):
+        self.base.to_parquet(state_file)
+        self.log.to_parquet(log_file)
+
+    @property
+    def ratings(self):
+        """Current ratings as a DataFrame with Club, Elo and EloDate."""
+        return pd.DataFrame({
+            "Club": self.clubs,
+            "Elo": self._ratings,
+            "EloDate": pd.to_datetime(self._dates),
+        })
+
+    def pending(self, fixtures_df):
+        """Played fixtures that are not in the log yet."""
+        played = fixtures_df[fixtures_df["status"].isin(PLAYED_STATUSES)]
+        return played[~played["id"].isin(self.log["id"])]
+
+    def apply(self, fixtures_df):
+        """
+        Apply all played fixtures that are not in the log yet.
+
+        If a new fixture was played before fixtures that are already applied
+        (e.g. a postponed game), the log is rolled back to that date first so
+        the exchanges are replayed in date order.
+
+        Returns:
+            int: Number of fixtures that changed ratings
+        """
+        pending = self.pending(fixtures_df)
+        if pending.empty:
+            return 0
+
+        first_pending = pd.to_datetime(pending["date"], utc=True).min()
+        applied_dates = pd.to_datetime(self.log["date"], utc=True)
+        later = self.log.loc[applied_dates > first_pending, "id"]
+        if len(later):
+            self.rollback(later)
+            pending = self.pending(fixtures_df)
+
+        fixtures = played_fixture_arrays(pending, self.clubs)
+        ratings, dates, trajectory = replay_elo(
+            self._ratings, fixtures, self._dates, k=self.k, hfa=self.hfa
+        )
+        self._ratings, self._dates = ratings, dates
+
+        names = np.array(self.clubs + [None], dtype=object)
+        events = pd.DataFrame({
+            "id": fixtures["id"],
+            "date": pd.to_datetime(fixtures["date"], utc=True),
+            "home": names[fixtures["home"]],
+            "away": names[fixtures["away"]],
+            "home_goals": fixtures["home_goals"],
+            "away_goals": fixtures["away_goals"],
+            "exchange": trajectory[:, 2],
+        })
+        if self.log.empty:
+            self.log = events
+        else:
+            self.log = pd.concat([self.log, events], ignore_index=True)
+
+        return int(events["exchange"].notna().sum())
+
+    def rollback(self, fixture_ids):
+        """
+        Undo the given fixtures and every fixture applied after them.
+
+        Fixtures that were undone only because they came later stay played in
+        the fixture data, so the next apply() replays them.
+
+        Returns:
+            list: Ids of all fixtures removed from the log
+        """
+        hit = np.flatnonzero(self.log["id"].isin(list(fixture_ids)).to_numpy())
+        if len(hit) == 0:
+            return []
+
+        removed = self.log.iloc[hit[0]:]
+        self.log = self.log.iloc[:hit[0]].reset_index(drop=True)
+
+        exchange = removed["exchange"].fillna(0).to_numpy()
+        club_index = pd.Index(self.clubs, dtype=object)
+        home = club_index.get_indexer(pd.Index(removed["home"], dtype=object))
+        away = club_index.get_indexer(pd.Index(removed["away"], dtype=object))
+        known = (home >= 0) & (away >= 0)
+        np.subtract.at(self._ratings, home[known], exchange[known])
+        np.add.at(self._ratings, away[known], exchange[known])
+        self._dates = self._applied_dates()
+
+        return removed["id"].tolist()
+
+    def sync(self, fixtures_df):
+        """
+        Bring the state in line with fixtures_df.
+
+        Logged fixtures whose result was corrected, or which are no longer
+        played (e.g. set back to status 'NS'), are rolled back before the
+        pending fixtures are applied.
+
+        Returns:
+            int: Number of fixtures that changed ratings
+        """
+        current = fixtures_df.set_index("id")
+        logged = self.log[self.log["id"].isin(current.index)]
+        now = current.loc[logged["id"]]
+
+        still_played = now["status"].isin(PLAYED_STATUSES).to_numpy()
+        same_score = np.ones(len(logged), dtype=bool)
+        for column in ["home_goals", "away_goals"]:
+            same_score &= (
+                now[column].to_numpy(dtype=float, na_value=np.nan)
+                == logged[column].to_numpy(dtype=float, na_value=np.nan)
+            )
+        changed = logged.loc[~(still_played & same_score), "id"]
+        if len(changed):
+            print(f"Rolling back {len(changed)} corrected fixtures.")
+            self.rollback(changed)
+
+        return self.apply(fixtures_df)
+
+    def _rebuild(self):
+        self._ratings = self.base["Elo"].to_numpy(dtype=float).copy()
+        applied = self.log[self.log["exchange"].notna()]
+        club_index = pd.Index(self.clubs, dtype=object)
+        home = club_index.get_indexer(pd.Index(applied["home"], dtype=object))
+        away = club_index.get_indexer(pd.Index(applied["away"], dtype=object))
+        exchange = applied["exchange"].to_numpy(dtype=float)
+        np.add.at(self._ratings, home, exchange)
+        np.subtract.at(self._ratings, away, exchange)
+        self._dates = self._applied_dates()
+
+    def _applied_dates(self):
+        dates = self._base_dates.copy()
+        applied = self.log[self.log["exchange"].notna()]
+        if applied.empty:
+            return dates
+        club_index = pd.Index(self.clubs, dtype=object)
+        event_dates = (pd.to_datetime(applied["date"], utc=True)
+                       .dt.tz_localize(None)
+                       .to_numpy(dtype="datetime64[ns]").astype(np.int64))
+        for column in ["home", "away"]:
+            clubs = club_index.get_indexer(pd.Index(applied[column], dtype=object))
+            np.maximum.at(dates, clubs, event_dates)
+        return dates
+
+
+def load_elo_state(elo_df, fixtures_df, state_file="elo_state.parquet",
+                   log_file="elo_log.parquet", force_refresh=False):
+    """
+    Load the saved ELO state (or seed it from elo_df), apply new results
+    from fixtures_df and save it again.
+
+    Args:
+        elo_df: ClubELO ratings used to seed a new state
+        fixtures_df: DataFrame with fixtures
+        state_file: Parquet file with the base ratings
+        log_file: Parquet file with the applied fixture log
+        force_refresh: Re-seed from elo_df even if a saved state exists
+
+    Returns:
+        EloState: The synced state; use .ratings for the ELO DataFrame
+    """
+    state = None if force_refresh else EloState.load(state_file, log_file)
+    if state is None:
+        print("Seeding a new ELO state from the ClubELO ratings")
+        state = EloState(elo_df)
+    else:
+        print(f"Loading ELO state from cache: {state_file}")
+
+    updated = state.sync(fixtures_df)
+    print(f"{updated} new results applied to the ELO state.")
+    state.save(state_file, log_file)
+
+    return state
@@ -1,50 +1,209 @@
+import numpy as np
 import pandas as pd
-from elo import Match, set_tilts
 
+from const import HFA, K_FACTOR, MEAN_GOALS
+from elo import get_context, margin_weight, updated_tilts
 
-def update_elo_with_fixtures(elo_df, fixtures_df, tilts=None):
+PLAYED_STATUSES = ["FT", "PEN"]
+
+
+def played_fixture_arrays(fixtures_df, clubs):
+    """
+    Pre-parse played fixtures into plain arrays for replay_elo.
+
+    Args:
+        fixtures_df: DataFrame with fixtures (status, date, home, away, goals)
+        clubs: List of club names; home/away become indices into this list
+               (-1 for clubs not in it)
+
+    Returns:
+        dict: Arrays "id", "date" (int64 ns, tz-naive UTC), "home", "away",
+              "home_goals" and "away_goals", sorted by date
+    """
+    played = fixtures_df[fixtures_df["status"].isin(PLAYED_STATUSES)]
+    played = played.sort_values("date", kind="stable")
+
+    club_index = pd.Index(clubs, dtype=object)
+    dates = pd.to_datetime(played["date"], utc=True).dt.tz_localize(None)
+
+    return {
+        "id": played["id"].to_numpy(dtype=np.int64),
+        "date": dates.to_numpy(dtype="datetime64[ns]").astype(np.int64),
+        "home": club_index.get_indexer(pd.Index(played["home"], dtype=object)),
+        "away": club_index.get_indexer(pd.Index(played["away"], dtype=object)),
+        "home_goals": played["home_goals"].to_numpy(dtype=np.int64),
+        "away_goals": played["away_goals"].to_numpy(dtype=np.int64),
+    }
+
+
+def replay_elo(
+    ratings,
+    fixtures,
+    rating_dates=None,
+    k=K_FACTOR,
+    hfa=HFA,
+    margin=False,
+    tilts=None,
+    base_goals=MEAN_GOALS,
+):
+    """
+    Replay played fixtures through the ClubELO points exchange.
+
+    Args:
+        ratings: Array of starting ratings, indexed like the fixture arrays
+        fixtures: Arrays from played_fixture_arrays()
+        rating_dates: Optional int64 array with the date each rating is
+                      valid from. A fixture is only applied if it was played
+                      after the rating date of at least one of the clubs.
+        k: K-factor of the exchange
+        hfa: Home field advantage in Elo points
+        margin: Weight the exchange by the goal margin (see margin_weight)
+        tilts: Optional array of team tilts. The tilts set the expected
+               goals for margin weighting and are evolved in place after
+               every applied fixture.
+        base_goals: Mean total goals per match
+
+    Returns:
+        tuple: (final ratings, final rating dates, trajectory) where the
+               trajectory is an (n_fixtures, 3) array with the pre-match home
+               and away Elo and the exchange of every fixture (NaN for
+               fixtures that were skipped)
+    """
+    ratings = np.asarray(ratings, dtype=float).tolist()
+    if rating_dates is None:
+        dates_by_club = None
+    else:
+        dates_by_club = np.asarray(rating_dates, dtype=np.int64).tolist()
+
+    tilt = None if tilts is None else np.asarray(tilts, dtype=float).tolist()
+
+    trajectory = np.full((len(fixtures["home"]), 3), np.nan)
+    rows = zip(
+        fixtures["home"].tolist(),
+        fixtures["away"].tolist(),
+        fixtures["home_goals"].tolist(),
+        fixtures["away_goals"].tolist(),
+        fixtures["date"].tolist(),
+    )
+
+    for i, (home, away, home_goals, away_goals, date) in enumerate(rows):
+        if home < 0 or away < 0:
+            continue
+        if dates_by_club is not None:
+            if date <= dates_by_club[home] and date <= dates_by_club[away]:
+                continue
+            dates_by_club[home] = date
+            dates_by_club[away] = date
+
+        home_elo = ratings[home]
+        away_elo = ratings[away]
+        expected_home = 1 / (10 ** (-(home_elo + hfa - away_elo) / 400) + 1)
+        if home_goals > away_goals:
+            result = 1.0
+        elif home_goals < away_goals:
+            result = 0.0
+        else:
+            result = 0.5
+        exchange = (result - expected_home) * k
+
+        if margin:
+            exp_total = base_goals
+            if tilt is not None:
+                exp_total *= tilt[home] * tilt[away]
+            exchange *= float(margin_weight(
+                home_goals, away_goals,
+                exp_total * expected_home, exp_total * (1 - expected_home),
+            ))
+        if tilt is not None:
+            tilt[home], tilt[away] = updated_tilts(
+                tilt[home], tilt[away], home_goals + away_goals, base_goals
+            )
+
+        ratings[home] = home_elo + exchange
+        ratings[away] = away_elo - exchange
+        trajectory[i] = home_elo, away_elo, exchange
+
+    if tilt is not None:
+        tilts[:] = tilt
+    if dates_by_club is not None:
+        dates_by_club = np.array(dates_by_club, dtype=np.int64)
+    return np.array(ratings), dates_by_club, trajectory
+
+
+def replay_fixtures(
+    elo_df, fixtures_df, respect_elo_dates=True, k=K_FACTOR, hfa=HFA, margin=False
+):
+    """
+    Replay played fixtures on top of the ratings in elo_df.
+
+    Args:
+        elo_df: DataFrame with Club, Elo and EloDate columns
+        fixtures_df: DataFrame with fixtures
+        respect_elo_dates: Only apply fixtures played after a club's EloDate.
+                           Set to False to replay every fixture, e.g. to get
+                           pre-match ratings for whole seasons.
+        k: K-factor of the exchange
+        hfa: Home field advantage in Elo points
+        margin: Weight the exchange by the goal margin
+
+    Returns:
+        tuple: (updated ELO DataFrame, per-fixture trajectory DataFrame with
+               pre-match home/away Elo and the exchange)
+    """
+    clubs = elo_df["Club"].tolist()
+    fixtures = played_fixture_arrays(fixtures_df, clubs)
+
+    rating_dates = None
+    if respect_elo_dates:
+        elo_dates = pd.to_datetime(elo_df["EloDate"], utc=True).dt.tz_localize(None)
+        rating_dates = elo_dates.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+    ratings, new_dates, trajectory = replay_elo(
+        elo_df["Elo"].to_numpy(dtype=float),
+        fixtures,
+        rating_dates,
+        k=k,
+        hfa=hfa,
+        margin=margin,
+    )
+
+    updated_elo = pd.DataFrame({"Club": clubs, "Elo": ratings})
+    if new_dates is None:
+        updated_elo["EloDate"] = elo_df["EloDate"].to_numpy()
+    else:
+        updated_elo["EloDate"] = pd.to_datetime(new_dates)
+
+    names = np.array(clubs + [None], dtype=object)
+    trajectory_df = pd.DataFrame({
+        "id": fixtures["id"],
+        "date": pd.to_datetime(fixtures["date"]),
+        "home": names[fixtures["home"]],
+        "away": names[fixtures["away"]],
+        "home_elo": trajectory[:, 0],
+        "away_elo": trajectory[:, 1],
+        "exchange": trajectory[:, 2],
+    })
+
+    return updated_elo, trajectory_df
+
+
+def update_elo_with_fixtures(elo_df, fixtures_df, tilts=None, context=None):
     """
     Update ELO ratings based on played fixtures after the last ELO update for each club.
     Skips matches where either club is missing from the ELO data.
     Returns a new DataFrame with updated ELOs and dates.
+
+    The K-factor and HFA come from context (default: the elo module's
+    default context). tilts is no longer used and is kept for compatibility;
+    it used to set the global tilts as a side effect, use set_tilts() or a
+    SimulationContext instead.
     """
-    
-    elo_df = elo_df.copy()
-    if tilts is not None:
-        set_tilts(tilts)
-    club_elo = {row['Club']: {'Elo': row['Elo'], 'EloDate': row['EloDate']} for _, row in elo_df.iterrows()}
-    played = fixtures_df[
-        fixtures_df['status'].isin(['FT', 'PEN'])
-    ].sort_values('date')
-    updated_teams = set()
-    for _, row in played.iterrows():
-        home, away = row['home'], row['away']
-        if home not in club_elo or away not in club_elo:
-            continue
-        date = pd.to_datetime(row['date']).tz_localize(None)
-        home_elo_date = pd.to_datetime(club_elo[home]['EloDate']).tz_localize(None)
-        away_elo_date = pd.to_datetime(club_elo[away]['EloDate']).tz_localize(None)
-        if date > home_elo_date or date > away_elo_date:
-            match = Match(
-                home=home,
-                away=away,
-                home_goals=row['home_goals'],
-                away_goals=row['away_goals'],
-                noise=False
-            )
-            match.home.elo = club_elo[home]['Elo']
-            match.away.elo = club_elo[away]['Elo']
-            match.set_result_from_goals()
-            match.apply_elo_exchange()
-            club_elo[home]['Elo'] = match.home.elo
-            club_elo[home]['EloDate'] = date
-            club_elo[away]['Elo'] = match.away.elo
-            club_elo[away]['EloDate'] = date
-            updated_teams.add(home)
-            updated_teams.add(away)
+    context = get_context(context)
+    updated_elo, trajectory = replay_fixtures(elo_df, fixtures_df,
+                                              k=context.k, hfa=context.hfa)
+
+    applied = trajectory[trajectory["exchange"].notna()]
+    updated_teams = set(applied["home"]) | set(applied["away"])
     print(f"{len(updated_teams)} teams had their ELO updated.")
-    updated_elo = pd.DataFrame([
-        {'Club': club, 'Elo': data['Elo'], 'EloDate': data['EloDate']}
-        for club, data in club_elo.items()
-    ])
+
     return updated_elo
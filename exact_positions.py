@@ -0,0 +1,341 @@
+"""
+Exact position probabilities for the last rounds of a season.
+
+With few fixtures left, the W/D/L outcome space is small enough to
+enumerate, so title and relegation odds need no Monte Carlo. The model is
+the one of simulate_season_batch() with simulate_goals=False and
+elo_updates=False: every fixture is an independent 1X2 result with the
+probabilities of Match.simulate_result() (outcome_probabilities), and a win
+counts as 2-1, a draw as 1-1, so a team's final points, goal difference
+and goals for follow from its wins and draws alone. The ELO noise per
+match is integrated out with Gauss-Hermite quadrature.
+
+Pruning keeps the enumeration small:
+- Each team's final sort key lies between losing and winning all its
+  remaining games. Teams whose range overlaps no other team's range have a
+  fixed position and are not tracked.
+- The remaining teams form groups of overlapping ranges; positions are only
+  counted within a group.
+- Per team, only fixtures of its group are enumerated, outcome by outcome,
+  merging equal states (dynamic programming). A rival is reduced to "above
+  or below" as soon as its last game is added, so states keep merging.
+"""
+
+import numpy as np
+import pandas as pd
+
+from elo import get_context
+from simulation import outcome_probabilities, season_inputs, simulate_season_batch
+
+MAX_EXACT_FIXTURES = 16  # Two rounds of a 16 team league
+QUADRATURE_NODES = 48
+
+
+def fixture_probabilities(elo, home, away, hfa=0, noise=0,
+                          nodes=QUADRATURE_NODES):
+    """
+    1X2 probabilities of fixtures with fixed ratings.
+
+    Args:
+        elo: Array with the rating of every team
+        home, away: Integer arrays with team indices of the fixtures
+        hfa: Home field advantage in ELO points
+        noise: Std. dev. of the ELO noise per match, integrated out
+        nodes: Number of Gauss-Hermite nodes used for the noise
+
+    Returns:
+        np.ndarray: (n_fixtures, 3) home win, draw and away win
+                    probabilities as drawn by simulate_season_batch()
+    """
+    elo = np.asarray(elo, dtype=float)
+    dr = elo[home] + hfa - elo[away]
+    if noise:
+        x, w = np.polynomial.hermite.hermgauss(nodes)
+        dr = dr[:, None] + np.sqrt(2) * noise * x[None, :]
+        weights = w / np.sqrt(np.pi)
+    else:
+        dr = dr[:, None]
+        weights = np.ones(1)
+
+    p_home, p_draw = outcome_probabilities(dr)
+    # The kernel draws home if roll < p_home, draw if roll < p_home + p_draw
+    p_draw = np.minimum(p_home + p_draw, 1) - p_home
+    p_home, p_draw = p_home @ weights, p_draw @ weights
+    return np.stack([p_home, p_draw, 1 - p_home - p_draw], axis=1)
+
+
+# Sort key steps of a win and a draw over a loss (see _sort_key)
+WIN_STEP = 3 * 4096 ** 2 + 2 * 4096 + 1
+DRAW_STEP = 4096 ** 2 + 4096
+
+
+def _sort_key(points, gd, gf):
+    # Same order as table_positions()
+    return (np.asarray(points, dtype=np.int64) * 4096 + gd + 2048) * 4096 + gf
+
+
+def _loss_keys(base_table, games):
+    """Sort keys if every remaining game is lost 1-2."""
+    return _sort_key(base_table["Points"],
+                     base_table["GF"] - base_table["GA"] - games,
+                     base_table["GF"] + games)
+
+
+def _groups(low, high):
+    """Teams grouped by overlapping [low, high] key ranges, best first."""
+    order = np.argsort(-high, kind="stable")
+    groups, current, floor = [], [], None
+    for team in order.tolist():
+        if current and high[team] < floor:
+            groups.append(current)
+            current = []
+        current.append(team)
+        floor = low[team] if len(current) == 1 else min(floor, low[team])
+    groups.append(current)
+    return groups
+
+
+def _fixture_order(fixtures, target):
+    """
+    The target's fixtures first, then greedily the fixture that starts the
+    fewest new teams and finishes the most, so few teams are open at once.
+    """
+    left = {}
+    for h, a in fixtures:
+        left[h] = left.get(h, 0) + 1
+        left[a] = left.get(a, 0) + 1
+
+    order, started = [], set()
+    pending = list(range(len(fixtures)))
+    first = [j for j in pending if target in fixtures[j]]
+    for j in first:
+        order.append(j)
+        started.update(fixtures[j])
+        pending.remove(j)
+
+    while pending:
+        def cost(j):
+            teams = fixtures[j]
+            new = sum(team not in started for team in teams)
+            finished = sum(left[team] == 1 for team in teams)
+            return new, -finished
+        j = min(pending, key=cost)
+        pending.remove(j)
+        order.append(j)
+        started.update(fixtures[j])
+        for team in fixtures[j]:
+            left[team] -= 1
+    return order, len(first)
+
+
+def _teams_above(target, members, fixtures, probabilities, low, games):
+    """
+    Distribution of the number of group members finishing above target.
+
+    A state packs the wins and draws of the target and of the members whose
+    games are still being added, plus the count of finished members above
+    the target, into one integer; outcomes add constants and merging equal
+    states is a 1-D np.unique. A member is compared with the target as soon
+    as its last game is added, and its digits are reused by later members.
+
+    Returns:
+        np.ndarray: Probability of 0 .. len(members) - 1 teams above target
+    """
+    order, n_first = _fixture_order(fixtures, target)
+
+    # Steps during which each team's wins and draws are needed
+    first_step, last_step = {}, {}
+    for step, j in enumerate(order):
+        for team in fixtures[j]:
+            if team in members:
+                first_step.setdefault(team, step)
+                last_step[team] = max(step, n_first - 1)
+    if target in first_step:
+        last_step[target] = len(order)
+
+    # Share digit slots between teams that are never open at the same time
+    slot_of, slot_radix, slot_free = {}, [], []
+    for team in sorted(first_step, key=first_step.get):
+        free = [s for s in range(len(slot_radix)) if slot_free[s] < first_step[team]]
+        if free:
+            slot = free[0]
+        else:
+            slot = len(slot_radix)
+            slot_radix.append(1)
+            slot_free.append(-1)
+        slot_of[team] = slot
+        slot_radix[slot] = max(slot_radix[slot], int(games[team]) + 1)
+        slot_free[slot] = last_step[team]
+
+    digits = np.array(np.repeat(slot_radix, 2).tolist() + [len(members)],
+                      dtype=np.int64)
+    if np.sum(np.log2(digits)) > 62:
+        raise ValueError("Too many fixtures left to solve exactly")
+    strides = np.cumprod(np.concatenate([[1], digits[:-1]]))
+    count_stride = int(strides[-1])
+
+    def wins_draws(codes, team):
+        if team not in slot_of:
+            return 0, 0
+        slot = slot_of[team]
+        radix = slot_radix[slot]
+        return (codes // strides[2 * slot] % radix,
+                codes // strides[2 * slot + 1] % radix)
+
+    def stride(team, draw):
+        return int(strides[2 * slot_of[team] + draw]) if team in slot_of else 0
+
+    def retire(codes, teams):
+        # Compare finished members with the (final) target and drop them
+        t_wins, t_draws = wins_draws(codes, target)
+        target_key = low[target] + t_wins * WIN_STEP + t_draws * DRAW_STEP
+        for team in teams:
+            wins, draws = wins_draws(codes, team)
+            key = low[team] + wins * WIN_STEP + draws * DRAW_STEP
+            above = (key > target_key) | ((key == target_key) & (team < target))
+            codes = (codes - wins * stride(team, 0) - draws * stride(team, 1)
+                     + above * count_stride)
+        return codes
+
+    retire_at = {}
+    for team in members:
+        if team != target:
+            retire_at.setdefault(last_step.get(team, n_first - 1), []).append(team)
+
+    codes = np.zeros(1, dtype=np.int64)
+    probs = np.ones(1)
+    codes = retire(codes, retire_at.get(-1, []))
+    for step, j in enumerate(order):
+        h, a = fixtures[j]
+        p = probabilities[j]
+        increments = np.array([
+            stride(h, 0),
+            stride(h, 1) + stride(a, 1),
+            stride(a, 0),
+        ], dtype=np.int64)
+        outcomes = np.flatnonzero(p > 0)
+        codes = (codes[None, :] + increments[outcomes, None]).ravel()
+        probs = (p[outcomes, None] * probs[None, :]).ravel()
+        codes = retire(codes, retire_at.get(step, []))
+        codes, inverse = np.unique(codes, return_inverse=True)
+        probs = np.bincount(inverse.ravel(), weights=probs)
+
+    return np.bincount(codes // count_stride, weights=probs,
+                       minlength=len(members))
+
+
+def exact_position_matrix(home, away, probabilities, base_table):
+    """
+    Exact position probabilities of the remaining fixtures.
+
+    Args:
+        home, away: Integer arrays with team indices of the fixtures
+        probabilities: (n_fixtures, 3) 1X2 probabilities, see
+                       fixture_probabilities()
+        base_table: Dict of STATS -> array per team from played games
+
+    Returns:
+        np.ndarray: (n_teams, n_teams) matrix of team x position
+                    probabilities (positions ascending)
+    """
+    home = np.asarray(home, dtype=np.int64)
+    away = np.asarray(away, dtype=np.int64)
+    probabilities = np.asarray(probabilities, dtype=float)
+    base_table = {stat: np.asarray(values, dtype=np.int64)
+                  for stat, values in base_table.items()}
+    n_teams = len(base_table["Points"])
+    games = np.bincount(np.concatenate([home, away]), minlength=n_teams)
+
+    low = _loss_keys(base_table, games)
+    groups = _groups(low, low + games * WIN_STEP)
+
+    matrix = np.zeros((n_teams, n_teams))
+    offset = 0
+    for group in groups:
+        members = sorted(group)
+        if len(members) > 1:
+            # Only fixtures of group members can change the order within it
+            in_group = np.isin(home, members) | np.isin(away, members)
+            fixtures = list(zip(home[in_group].tolist(), away[in_group].tolist()))
+            for target in members:
+                above = _teams_above(target, members, fixtures,
+                                     probabilities[in_group], low, games)
+                matrix[target, offset:offset + len(members)] = above
+        else:
+            matrix[members[0], offset] = 1.0
+        offset += len(members)
+
+    return matrix
+
+
+def exact_position_probabilities(fixtures_df, season=2025, cutoff_date=None,
+                                 context=None, max_fixtures=MAX_EXACT_FIXTURES):
+    """
+    Exact position probabilities of the rest of a season.
+
+    Ratings and model parameters (hfa, noise) come from context (default:
+    the elo module's default context). Ratings stay fixed, as in
+    simulate_season() with simulate_goals=False and elo_updates=False.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        season: Season to solve
+        cutoff_date: Only fixtures up to this date are played
+        context: SimulationContext with ratings and parameters
+        max_fixtures: Raise ValueError above this many remaining fixtures
+
+    Returns:
+        DataFrame: teams x positions probabilities
+    """
+    context = get_context(context)
+    inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+    if len(inputs["home"]) > max_fixtures:
+        raise ValueError(
+            f"{len(inputs['home'])} fixtures left, exact solving is limited "
+            f"to {max_fixtures}"
+        )
+
+    return _exact_frame(inputs, context)
+
+
+def _exact_frame(inputs, context):
+    probabilities = fixture_probabilities(inputs["elo"], inputs["home"],
+                                          inputs["away"], context.hfa,
+                                          context.noise)
+    matrix = exact_position_matrix(inputs["home"], inputs["away"],
+                                   probabilities, inputs["base_table"])
+    teams = inputs["teams"]
+    return pd.DataFrame(matrix, index=teams, columns=range(1, len(teams) + 1))
+
+
+def position_probabilities(fixtures_df, n_simulations=100000, season=2025,
+                           cutoff_date=None, context=None,
+                           max_exact_fixtures=MAX_EXACT_FIXTURES, seed=None):
+    """
+    Position probabilities, exact when at most max_exact_fixtures fixtures
+    are left and simulated (with the same fixed-rating 1X2 model) otherwise.
+
+    Returns:
+        DataFrame: teams x positions probabilities
+    """
+    context = get_context(context)
+    inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+    n_fixtures = len(inputs["home"])
+    if n_fixtures <= max_exact_fixtures:
+        print(f"{n_fixtures} fixtures left, solving exactly")
+        return _exact_frame(inputs, context)
+
+    print(f"{n_fixtures} fixtures left, simulating {n_simulations} seasons")
+    batch = simulate_season_batch(
+        inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+        inputs["base_table"], n_simulations, hfa=context.hfa,
+        base_goals=context.base_goals, simulate_goals=False,
+        elo_updates=False, noise=context.noise, k=context.k,
+        rng=np.random.default_rng(seed),
+    )
+    teams = inputs["teams"]
+    counts = np.zeros((len(teams), len(teams)))
+    np.add.at(counts, (np.tile(np.arange(len(teams)), n_simulations),
+                       batch["Position"].ravel() - 1), 1)
+    return pd.DataFrame(counts / n_simulations, index=teams,
+                        columns=range(1, len(teams) + 1))
@@ -0,0 +1,249 @@
+"""
+Columnar export of simulation results.
+
+Writes the season summary, the position probability matrix and the
+per-simulation distributions as Arrow tables with fixed schemas, to Parquet
+or Arrow IPC files. Run metadata (seed, number of simulations, parameters
+and input hashes) is stored in the schema metadata of every file, so each
+file describes the run it came from. Unlike build_season_summary(), all
+values stay numeric (no "GF-GA" strings or rounded percentages).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from clubs import get_registry
+from simulation import STATS
+from simulation_cache import input_hash
+from table import table_positions
+
+SCHEMA_VERSION = 1
+METADATA_KEY = b"simulation"
+
+SUMMARY_SCHEMA = pa.schema([
+    ("team", pa.string()),
+    ("team_id", pa.int32()),
+    ("games", pa.float64()),
+    ("wins", pa.float64()),
+    ("draws", pa.float64()),
+    ("losses", pa.float64()),
+    ("gf", pa.float64()),
+    ("ga", pa.float64()),
+    ("gd", pa.float64()),
+    ("points", pa.float64()),
+    ("points_std", pa.float64()),
+    ("position", pa.float64()),
+])
+
+POSITIONS_SCHEMA = pa.schema([
+    ("team", pa.string()),
+    ("team_id", pa.int32()),
+    ("position", pa.int16()),
+    ("probability", pa.float64()),
+])
+
+DISTRIBUTIONS_SCHEMA = pa.schema([
+    ("simulation", pa.int32()),
+    ("team", pa.string()),
+    ("team_id", pa.int32()),
+    ("wins", pa.int16()),
+    ("draws", pa.int16()),
+    ("losses", pa.int16()),
+    ("gf", pa.int16()),
+    ("ga", pa.int16()),
+    ("points", pa.int16()),
+    ("position", pa.int16()),
+])
+
+TABLES = {
+    "summary": SUMMARY_SCHEMA,
+    "positions": POSITIONS_SCHEMA,
+    "distributions": DISTRIBUTIONS_SCHEMA,
+}
+
+FORMATS = ("parquet", "arrow")
+
+
+def run_metadata(n_simulations, seed=None, params=None, inputs=None, **extra):
+    """
+    Metadata describing a simulation run.
+
+    Args:
+        n_simulations: Number of simulated seasons
+        seed: Random seed of the run
+        params: Dict of model parameters, e.g. hfa, k and simulate_goals
+        inputs: Dict of input name -> DataFrame (or other picklable value),
+                stored as content hashes
+        **extra: Any further JSON serializable fields, e.g. season
+
+    Returns:
+        dict: JSON serializable metadata
+    """
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "created": pd.Timestamp.now(tz="UTC").isoformat(),
+        "n_simulations": int(n_simulations),
+        "seed": seed,
+        "params": params or {},
+        "input_hashes": {
+            name: input_hash({name: value})
+            for name, value in (inputs or {}).items()
+        },
+        **extra,
+    }
+
+
+def tracker_arrays(stats_tracker):
+    """
+    Per-simulation arrays from a stats_tracker.
+
+    Returns:
+        tuple: (teams list, dict of STATS and "Position" ->
+               (n_simulations, n_teams) arrays)
+    """
+    teams = list(stats_tracker)
+    batch = {
+        stat: np.array([stats_tracker[team][stat] for team in teams],
+                       dtype=np.int64).T
+        for stat in STATS
+    }
+    batch["Position"] = table_positions(
+        batch["Points"], batch["GF"] - batch["GA"], batch["GF"]
+    )
+    return teams, batch
+
+
+def _team_ids(teams, registry=None):
+    if registry is None:
+        registry = get_registry()
+    ids = registry.ids
+    return pa.array([ids.get(team, -1) for team in teams], pa.int32())
+
+
+def summary_table(teams, batch, registry=None):
+    """Expected values per team, SUMMARY_SCHEMA."""
+    games = batch["Wins"] + batch["Draws"] + batch["Losses"]
+    columns = {
+        "team": pa.array(teams, pa.string()),
+        "team_id": _team_ids(teams, registry),
+        "games": games.mean(axis=0),
+        "wins": batch["Wins"].mean(axis=0),
+        "draws": batch["Draws"].mean(axis=0),
+        "losses": batch["Losses"].mean(axis=0),
+        "gf": batch["GF"].mean(axis=0),
+        "ga": batch["GA"].mean(axis=0),
+        "gd": (batch["GF"] - batch["GA"]).mean(axis=0),
+        "points": batch["Points"].mean(axis=0),
+        "points_std": batch["Points"].std(axis=0),
+        "position": batch["Position"].mean(axis=0),
+    }
+    table = pa.table(columns, schema=SUMMARY_SCHEMA)
+    order = np.argsort(-table["points"].to_numpy(), kind="stable")
+    return table.take(order)
+
+
+def positions_table(teams, batch, registry=None):
+    """Position probabilities in long format, one row per team and position."""
+    n_simulations, n_teams = batch["Position"].shape
+    counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+    np.add.at(counts, (np.tile(np.arange(n_teams), n_simulations),
+                       batch["Position"].ravel() - 1), 1)
+
+    return pa.table({
+        "team": pa.array(np.repeat(np.array(teams, dtype=object), n_teams),
+                         pa.string()),
+        "team_id": pa.array(np.repeat(_team_ids(teams, registry).to_numpy(), n_teams),
+                            pa.int32()),
+        "position": np.tile(np.arange(1, n_teams + 1), n_teams).astype(np.int16),
+        "probability": (counts / n_simulations).ravel(),
+    }, schema=POSITIONS_SCHEMA)
+
+
+def distributions_table(teams, batch, registry=None):
+    """Every simulated final table, one row per simulation and team."""
+    n_simulations, n_teams = batch["Position"].shape
+    columns = {
+        "simulation": np.repeat(np.arange(n_simulations, dtype=np.int32),
+                                n_teams),
+        "team": pa.array(np.tile(np.array(teams, dtype=object), n_simulations),
+                         pa.string()),
+        "team_id": pa.array(np.tile(_team_ids(teams, registry).to_numpy(), n_simulations),
+                            pa.int32()),
+    }
+    for stat in STATS + ["Position"]:
+        columns[stat.lower()] = batch[stat].ravel().astype(np.int16)
+    return pa.table(columns, schema=DISTRIBUTIONS_SCHEMA)
+
+
+def export_results(stats_tracker, metadata, output_dir="results",
+                   fmt="parquet", distributions=True, registry=None):
+    """
+    Export simulation results as columnar files.
+
+    Args:
+        stats_tracker: stats_tracker from simulate_season()
+        metadata: Run metadata, see run_metadata()
+        output_dir: Directory for the files
+        fmt: 'parquet' or 'arrow' (Arrow IPC, memory-mappable)
+        distributions: Also write every simulated final table
+        registry: Club registry for the team ids (default: the shared
+                  registry), e.g. League.registry
+
+    Returns:
+        dict: Mapping of table names to file paths
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    teams, batch = tracker_arrays(stats_tracker)
+    tables = {
+        "summary": summary_table(teams, batch, registry),
+        "positions": positions_table(teams, batch, registry),
+    }
+    if distributions:
+        tables["distributions"] = distributions_table(teams, batch, registry)
+
+    schema_metadata = {METADATA_KEY: json.dumps(metadata, default=str).encode()}
+    paths = {}
+    for name, table in tables.items():
+        table = table.replace_schema_metadata(schema_metadata)
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        partial = f"{path}.partial"
+        if fmt == "parquet":
+            pq.write_table(table, partial)
+        else:
+            feather.write_feather(table, partial, compression="uncompressed")
+        os.replace(partial, path)
+        paths[name] = path
+
+    print(f"Exported {', '.join(tables)} to {output_dir}")
+    return paths
+
+
+def load_results(output_dir="results", fmt="parquet", names=None):
+    """
+    Load exported results.
+
+    Returns:
+        tuple: (dict of table name -> pyarrow.Table, metadata dict)
+    """
+    tables, metadata = {}, None
+    for name in names or TABLES:
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        if not os.path.exists(path):
+            continue
+        if fmt == "parquet":
+            table = pq.read_table(path)
+        else:
+            table = feather.read_table(path, memory_map=True)
+        if metadata is None:
+            metadata = json.loads(table.schema.metadata[METADATA_KEY])
+        tables[name] = table.replace_schema_metadata(None)
+    return tables, metadata
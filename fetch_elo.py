@@ -1,26 +1,42 @@
 import pandas as pd
 import requests
 import os
+import time
 from io import StringIO
-from const import CLUBS
+from clubs import get_registry
+from metrics import METRICS, record_response
 
 
-def fetch_elo_data(cache_file="elo_latest.parquet", force_refresh=False):
-    """Fetch ELO data for all clubs and return as DataFrame"""
+def fetch_elo_data(cache_file="elo_latest.parquet", force_refresh=False,
+                   registry=None):
+    """
+    Fetch ELO data for all clubs and return as DataFrame.
+
+    registry (default: the shared club registry) decides which clubs are
+    fetched and maps their names.
+    """
 
     if not force_refresh and os.path.exists(cache_file):
         print(f"Loading ELO data from cache: {cache_file}")
-        return pd.read_parquet(cache_file)
+        METRICS.inc("ingest_cache_total", source="clubelo", result="hit")
+        with METRICS.timer("ingest_parquet_seconds", source="clubelo", op="read"):
+            return pd.read_parquet(cache_file)
+    METRICS.inc("ingest_cache_total", source="clubelo", result="miss")
+    start = time.perf_counter()
 
     # Initialize list to store results
     print("Fetching the latest ELO data from ClubELO API")
     results = []
+    if registry is None:
+        registry = get_registry()
     
-    for clubs in CLUBS.values():
+    for variant in registry.variants("clubelo").values():
         try:
             # Remove spaces from club name for the API URL
-            club_name_no_spaces = clubs[0].replace(" ", "")
-            r = requests.get(f"http://api.clubelo.com/{club_name_no_spaces}")
+            club_name_no_spaces = variant.replace(" ", "")
+            with METRICS.timer("ingest_request_seconds", source="clubelo"):
+                r = requests.get(f"http://api.clubelo.com/{club_name_no_spaces}")
+            record_response(r, "clubelo")
             club_data = StringIO(r.text)
             df_club = pd.read_csv(club_data, sep=",")
             
@@ -51,19 +67,81 @@ def fetch_elo_data(cache_file="elo_latest.parquet", force_refresh=False):
             })
             
         except Exception as e:
-            print(f"Error processing club {clubs[0]}: {e}")
+            print(f"Error processing club {variant}: {e}")
+            METRICS.inc("ingest_request_errors_total", source="clubelo")
             continue
     
     # Convert results to DataFrame
     df_elo = pd.DataFrame(results)
     
     # Standardise club names
-    variant_to_standard = {
-        variant: standard for standard, variants in CLUBS.items() for variant in variants
-    }
-    df_elo["Club"] = df_elo["Club"].apply(lambda x: variant_to_standard.get(x, x))
+    df_elo["Club"] = registry.normalize(df_elo["Club"], source="clubelo")
 
-    df_elo.to_parquet(cache_file)
+    with METRICS.timer("ingest_parquet_seconds", source="clubelo", op="write"):
+        df_elo.to_parquet(cache_file)
     print(f"ELO data fetched and cached to {cache_file}")
+    METRICS.inc("ingest_rows_total", len(df_elo), source="clubelo")
+    METRICS.observe("ingest_duration_seconds", time.perf_counter() - start,
+                    source="clubelo")
+    METRICS.set("ingest_last_success_timestamp", time.time(), source="clubelo")
     
     return df_elo
+
+
+def fetch_elo_on_date(date, cache_file=None, force_refresh=False,
+                      registry=None):
+    """
+    Fetch the ELO ratings of all clubs as they were on a date.
+
+    Uses the ClubELO date endpoint (one request for all clubs), e.g. for
+    backtests that must not start from ratings that already contain the
+    results being forecast.
+
+    Args:
+        date: Date of the ratings
+        cache_file: Parquet cache (default: elo_<date>.parquet)
+        force_refresh: Fetch even if the cache exists
+        registry: Club registry deciding which clubs are kept and mapping
+                  their names (default: the shared registry)
+
+    Returns:
+        DataFrame: Club, Elo and EloDate (the date the rating was valid from)
+    """
+    day = pd.Timestamp(date).strftime("%Y-%m-%d")
+    if cache_file is None:
+        cache_file = f"elo_{day}.parquet"
+
+    if not force_refresh and os.path.exists(cache_file):
+        print(f"Loading ELO data from cache: {cache_file}")
+        METRICS.inc("ingest_cache_total", source="clubelo", result="hit")
+        with METRICS.timer("ingest_parquet_seconds", source="clubelo", op="read"):
+            return pd.read_parquet(cache_file)
+    METRICS.inc("ingest_cache_total", source="clubelo", result="miss")
+
+    if registry is None:
+        registry = get_registry()
+
+    print(f"Fetching ELO data as of {day} from ClubELO API")
+    with METRICS.timer("ingest_request_seconds", source="clubelo"):
+        r = requests.get(f"http://api.clubelo.com/{day}")
+    record_response(r, "clubelo")
+    r.raise_for_status()
+    df_day = pd.read_csv(StringIO(r.text), sep=",")
+
+    variants = set(registry.variants("clubelo").values())
+    df_day = df_day[df_day["Club"].isin(variants)]
+    df_elo = pd.DataFrame({
+        "Club": registry.normalize(df_day["Club"], source="clubelo"),
+        "Elo": df_day["Elo"].to_numpy(dtype=float),
+        "EloDate": pd.to_datetime(df_day["From"]).to_numpy(),
+    }).reset_index(drop=True)
+
+    missing = variants - set(df_day["Club"])
+    if missing:
+        print(f"No ELO rating on {day} for: {', '.join(sorted(missing))}")
+
+    with METRICS.timer("ingest_parquet_seconds", source="clubelo", op="write"):
+        df_elo.to_parquet(cache_file)
+    METRICS.inc("ingest_rows_total", len(df_elo), source="clubelo")
+    print(f"ELO data fetched and cached to {cache_file}")
+    return df_elo
@@ -0,0 +1,283 @@
+"""
+Fitting of the match model to historical fixtures.
+
+Evaluates the log-likelihood and Brier score of the model behind
+Match.simulate_result and Match.simulate_goals over every played fixture in
+one vectorized computation, so HFA, the K-factor, the ELO noise, the mean
+goals and the draw model constants can be grid searched in seconds.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from backtest import check_starting_ratings, starting_ratings
+from const import DRAW_MODEL, ELO_NOISE, HFA, K_FACTOR, MEAN_GOALS
+from elo_update import played_fixture_arrays
+from fixtures import fit_tilts
+
+DEFAULT_PARAMS = {
+    "hfa": HFA,
+    "k": K_FACTOR,
+    "noise": ELO_NOISE,
+    "mean_goals": MEAN_GOALS,
+    "draw_base": DRAW_MODEL["base"],
+    "draw_slope": DRAW_MODEL["slope"],
+    "draw_floor": DRAW_MODEL["floor"],
+    "draw_cap": DRAW_MODEL["cap"],
+}
+
+MAX_GOALS = 10  # Goals per team considered when deriving 1X2 from scorelines
+
+
+def prepare_history(fixtures_df, elo_df=None, tilts=None, burn_in=1):
+    """
+    Pre-parse the played fixtures used for fitting.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        elo_df: DataFrame with Club, Elo and EloDate columns, used as starting
+                ratings (default: the ClubELO ratings of the day before the
+                first played fixture, see backtest.starting_ratings()). All
+                ratings must predate the first played fixture, later ones
+                already include results that are scored. Clubs without a
+                rating start at the lowest rating in elo_df.
+        tilts: Dict of team tilts (default: fit_tilts(fixtures_df))
+        burn_in: Number of leading seasons replayed but not scored, so the
+                 starting ratings have settled
+
+    Returns:
+        dict: Fixture arrays plus "ratings", "tilt" (tilt_home * tilt_away
+              per fixture) and "scored" (mask of fixtures to score)
+    """
+    played = fixtures_df[fixtures_df["status"].isin(["FT", "PEN"])]
+    if played.empty:
+        raise ValueError("No played fixtures to fit on")
+    if elo_df is None:
+        elo_df = starting_ratings(fixtures_df, played["season"].unique())
+    first_played = pd.to_datetime(played["date"], utc=True).min()
+    check_starting_ratings(elo_df, first_played.normalize(),
+                           "the first played fixture")
+
+    clubs = list(dict.fromkeys(
+        elo_df["Club"].tolist() + played["home"].tolist() + played["away"].tolist()
+    ))
+    ratings = elo_df.set_index("Club")["Elo"].reindex(clubs)
+    ratings = ratings.fillna(elo_df["Elo"].min()).to_numpy(dtype=float)
+
+    history = played_fixture_arrays(played, clubs)
+    history["ratings"] = ratings
+
+    if tilts is None:
+        tilts = fit_tilts(fixtures_df)
+    tilt = np.array([tilts.get(club, 1) for club in clubs])
+    history["tilt"] = tilt[history["home"]] * tilt[history["away"]]
+
+    seasons = played.sort_values("date", kind="stable")["season"].astype(int)
+    first_scored = sorted(seasons.unique())[min(burn_in, seasons.nunique() - 1)]
+    history["scored"] = seasons.to_numpy() >= first_scored
+
+    return history
+
+
+def replay_elo_differences(history, k, hfa):
+    """
+    Pre-match ELO differences for many (k, hfa) pairs at once.
+
+    Runs the ClubELO exchange over the history once, with one rating vector
+    per parameter pair.
+
+    Returns:
+        np.ndarray: (n_pairs, n_fixtures) array of home ELO + hfa - away ELO
+    """
+    k = np.atleast_1d(np.asarray(k, dtype=float))
+    hfa = np.atleast_1d(np.asarray(hfa, dtype=float))
+    ratings = np.repeat(history["ratings"][:, None], len(k), axis=1)
+
+    home_goals = history["home_goals"]
+    away_goals = history["away_goals"]
+    result = np.where(home_goals > away_goals, 1.0,
+                      np.where(home_goals < away_goals, 0.0, 0.5))
+
+    dr = np.empty((len(k), len(result)))
+    for i, (home, away) in enumerate(zip(history["home"].tolist(),
+                                         history["away"].tolist())):
+        dr[:, i] = ratings[home] + hfa - ratings[away]
+        exchange = (result[i] - 1 / (10 ** (-dr[:, i] / 400) + 1)) * k
+        ratings[home] += exchange
+        ratings[away] -= exchange
+
+    return dr
+
+
+def _normal_nodes(n_nodes):
+    """Gauss-Hermite nodes and weights for a standard normal."""
+    nodes, weights = np.polynomial.hermite_e.hermegauss(n_nodes)
+    return nodes, weights / weights.sum()
+
+
+def _poisson_log_pmf(goals, mu, log_factorial):
+    return goals * np.log(mu) - mu - log_factorial[goals]
+
+
+def result_probabilities(dr, params, n_nodes=9):
+    """
+    Home/draw/away probabilities of Match.simulate_result.
+
+    Args:
+        dr: Array of ELO differences (home + hfa - away) without noise
+        params: Dict with noise and draw model parameters
+        n_nodes: Quadrature nodes used to integrate over the ELO noise
+
+    Returns:
+        np.ndarray: Probabilities with a trailing axis of size 3
+    """
+    nodes, weights = _normal_nodes(n_nodes)
+    noisy = dr[..., None] + params["noise"] * nodes
+    expected = 1 / (10 ** (-noisy / 400) + 1)
+
+    p_draw = np.clip(params["draw_base"] - params["draw_slope"] * np.abs(noisy),
+                     params["draw_floor"], params["draw_cap"])
+    p_draw = np.maximum(0.10, p_draw)
+    p_home = np.clip(expected - p_draw / 2, 0, 1)
+    p_away = np.clip(1 - p_home - p_draw, 0, 1)
+
+    probabilities = np.stack([p_home, p_draw, p_away], axis=-1)
+    return np.einsum("...jr,j->...r", probabilities, weights)
+
+
+def goal_model(dr, tilt, home_goals, away_goals, params, n_nodes=9):
+    """
+    Scoreline log-likelihood and 1X2 probabilities of Match.simulate_goals.
+
+    Returns:
+        tuple: (log-likelihood per fixture, probabilities with a trailing
+               axis of size 3)
+    """
+    nodes, weights = _normal_nodes(n_nodes)
+    noisy = dr[..., None] + params["noise"] * nodes
+    expected = 1 / (10 ** (-noisy / 400) + 1)
+    total = (tilt * params["mean_goals"])[..., None]
+    mu_home = np.maximum(total * expected, 1e-12)
+    mu_away = np.maximum(total * (1 - expected), 1e-12)
+
+    max_goals = max(MAX_GOALS, int(home_goals.max()), int(away_goals.max()))
+    log_factorial = np.concatenate(
+        [[0.0], np.cumsum(np.log(np.arange(1, max_goals + 1)))]
+    )
+
+    log_score = (
+        _poisson_log_pmf(home_goals[:, None], mu_home, log_factorial)
+        + _poisson_log_pmf(away_goals[:, None], mu_away, log_factorial)
+    )
+    peak = log_score.max(axis=-1, keepdims=True)
+    log_likelihood = (peak[..., 0]
+                      + np.log(np.exp(log_score - peak) @ weights))
+
+    goals = np.arange(MAX_GOALS + 1)
+    pmf_home = np.exp(_poisson_log_pmf(goals, mu_home[..., None], log_factorial))
+    pmf_away = np.exp(_poisson_log_pmf(goals, mu_away[..., None], log_factorial))
+    cdf_home = np.cumsum(pmf_home, axis=-1)
+    p_draw = (pmf_home * pmf_away).sum(axis=-1)
+    p_home = (pmf_away * (1 - cdf_home)).sum(axis=-1)
+    p_away = 1 - p_home - p_draw
+
+    probabilities = np.stack([p_home, p_draw, p_away], axis=-1)
+    return log_likelihood, np.einsum("...jr,j->...r", probabilities, weights)
+
+
+def _scores(probabilities, outcome):
+    observed = np.eye(3)[outcome]
+    log_loss = -np.log(np.maximum(
+        np.take_along_axis(probabilities, outcome[:, None], axis=-1)[..., 0],
+        1e-12,
+    ))
+    brier = ((probabilities - observed) ** 2).sum(axis=-1)
+    return log_loss.mean(axis=-1), brier.mean(axis=-1)
+
+
+def evaluate(history, params_list, n_nodes=9):
+    """
+    Score many parameter sets against the history.
+
+    Args:
+        history: Output of prepare_history()
+        params_list: List of parameter dicts (missing keys use
+                     DEFAULT_PARAMS)
+        n_nodes: Quadrature nodes used to integrate over the ELO noise
+
+    Returns:
+        DataFrame: One row per parameter set with the parameters,
+                   result_log_loss/result_brier (simulate_result model) and
+                   for the simulate_goals model goals_log_loss (of the exact
+                   scoreline), goals_result_log_loss and goals_brier (of the
+                   1X2 result)
+    """
+    params_df = pd.DataFrame([{**DEFAULT_PARAMS, **p} for p in params_list])
+
+    pairs = params_df[["k", "hfa"]].drop_duplicates().reset_index(drop=True)
+    dr_by_pair = replay_elo_differences(history, pairs["k"], pairs["hfa"])
+    pair_index = pd.MultiIndex.from_frame(pairs).get_indexer(
+        pd.MultiIndex.from_frame(params_df[["k", "hfa"]])
+    )
+
+    scored = history["scored"]
+    home_goals = history["home_goals"][scored]
+    away_goals = history["away_goals"][scored]
+    tilt = history["tilt"][scored]
+    outcome = np.where(home_goals > away_goals, 0,
+                       np.where(home_goals == away_goals, 1, 2))
+
+    rows = []
+    for i, params in enumerate(params_df.to_dict("records")):
+        dr = dr_by_pair[pair_index[i]][scored]
+        result_log_loss, result_brier = _scores(
+            result_probabilities(dr, params, n_nodes), outcome
+        )
+        log_likelihood, goal_probabilities = goal_model(
+            dr, tilt, home_goals, away_goals, params, n_nodes
+        )
+        goals_result_log_loss, goals_brier = _scores(goal_probabilities,
+                                                     outcome)
+        rows.append({
+            "result_log_loss": result_log_loss,
+            "result_brier": result_brier,
+            "goals_log_loss": -log_likelihood.mean(),
+            "goals_result_log_loss": goals_result_log_loss,
+            "goals_brier": goals_brier,
+        })
+
+    return pd.concat([params_df, pd.DataFrame(rows)], axis=1)
+
+
+def grid_search(fixtures_df, elo_df=None, grid=None, tilts=None, burn_in=1,
+                sort_by="result_log_loss"):
+    """
+    Evaluate every combination of the parameter values in grid.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        elo_df: DataFrame with starting ELO ratings dated before the first
+                played fixture (default: see prepare_history())
+        grid: Dict of parameter name -> list of values, e.g.
+              {"hfa": [40, 60, 80], "k": [15, 20, 25]}
+        tilts: Dict of team tilts (default: fit_tilts(fixtures_df))
+        burn_in: Number of leading seasons replayed but not scored
+        sort_by: Score column to sort on (lower is better)
+
+    Returns:
+        DataFrame: All combinations with their scores, best first
+    """
+    if not grid:
+        raise ValueError("grid needs at least one parameter")
+    history = prepare_history(fixtures_df, elo_df, tilts, burn_in)
+    names = list(grid)
+    params_list = [dict(zip(names, values))
+                   for values in itertools.product(*grid.values())]
+
+    print(f"Evaluating {len(params_list)} parameter sets on "
+          f"{int(history['scored'].sum())} fixtures")
+    results = evaluate(history, params_list)
+
+    return results.sort_values(sort_by).reset_index(drop=True)
@@ -1,139 +1,269 @@
 import os
-from collections import defaultdict
+import time
 
+import numpy as np
 import pandas as pd
 import requests
 from dotenv import load_dotenv
 
-from const import CLUBS, SEASONS
+from clubs import get_registry
+from const import ELITESERIEN, SEASONS
+from metrics import METRICS, record_response
 
 
-def get_fixtures(seasons=SEASONS, cache_file="fixtures.parquet", force_refresh=False):
+FIXTURES_URL = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
+MAX_IDS_PER_REQUEST = 20  # api-football limit of the ids parameter
+
+
+def _api_headers():
+    load_dotenv()
+    return {
+        "X-RapidAPI-Key": os.getenv("RAPID_API_KEY"),
+        "X-RapidAPI-Host": "api-football-v1.p.rapidapi.com",
+    }
+
+
+def _request_fixtures(url, headers, params, session=None):
+    try:
+        with METRICS.timer("ingest_request_seconds", source="api-football"):
+            response = (session or requests).get(url, headers=headers,
+                                                  params=params)
+    except requests.RequestException:
+        METRICS.inc("ingest_request_errors_total", source="api-football")
+        raise
+    record_response(response, "api-football")
+    return response.json()
+
+
+def _parse_fixtures(data, season=None):
+    """Fixture rows of an api-football response (season from the response if None)."""
+    matches = []
+
+    for match in data["response"]:
+        matches.append(
+            {
+                "id": match["fixture"]["id"],
+                "season": match["league"]["season"] if season is None else season,
+                "date": match["fixture"]["date"],
+                "home": match["teams"]["home"]["name"],
+                "home_goals": match["goals"]["home"],
+                "away": match["teams"]["away"]["name"],
+                "away_goals": match["goals"]["away"],
+                "venue": match["fixture"]["venue"]["name"],
+                "status": match["fixture"]["status"]["short"],
+                "round": match["league"].get("round"),
+            }
+        )
+
+    return pd.DataFrame(matches)
+
+
+def _clean_fixtures(fixtures, registry):
+    int_columns = ["id", "season", "home_goals", "away_goals"]
+    fixtures[int_columns] = fixtures[int_columns].astype("Int64")
+    fixtures["date"] = pd.to_datetime(fixtures["date"], errors="coerce")
+
+    # Fix club names
+    fixtures["home"] = registry.normalize(fixtures["home"], source="api")
+    fixtures["away"] = registry.normalize(fixtures["away"], source="api")
+    return fixtures
+
+
+def get_fixtures(seasons=SEASONS, cache_file="fixtures.parquet", force_refresh=False,
+                 league=ELITESERIEN, registry=None, url=FIXTURES_URL):
     
     """
     Fetch fixtures for the specified seasons from the API.
     Returns a DataFrame with fixture data.
+
+    league is the api-football league id; registry (default: the shared
+    club registry) maps the club names. url can point to a stub API.
     """
+    if registry is None:
+        registry = get_registry()
 
     if not force_refresh and os.path.exists(cache_file):
         print(f"Loading fixtures from cache: {cache_file}")
-        return pd.read_parquet(cache_file)
-    
-    print("Fetching the fixtures from api-football")
-
-    load_dotenv()
-    api_key = os.getenv("RAPID_API_KEY")
-    url = "https://api-football-v1.p.rapidapi.com/v3/fixtures"
+        METRICS.inc("ingest_cache_total", source="api-football", result="hit")
+        with METRICS.timer("ingest_parquet_seconds", source="api-football",
+                           op="read"):
+            fixtures = pd.read_parquet(cache_file)
+        return registry.add_codes(fixtures)
+    METRICS.inc("ingest_cache_total", source="api-football", result="miss")
+    start = time.perf_counter()
 
-    headers = {
-        "X-RapidAPI-Key": api_key,
-        "X-RapidAPI-Host": "api-football-v1.p.rapidapi.com",
-    }
+    print("Fetching the fixtures from api-football")
 
+    headers = _api_headers()
     fixtures = pd.DataFrame()
 
     for season in seasons:
-        querystring = {"league": "103", "season": season}  # Eliteserien
-
-        response = requests.get(url, headers=headers, params=querystring)
-        data = response.json()
-
-        matches = []
-
-        for match in data["response"]:
-            date = match["fixture"]["date"]
-            id = match["fixture"]["id"]
-            status = match["fixture"]["status"]["short"]
-            venue = match["fixture"]["venue"]["name"]
-            home_goals = match["goals"]["home"]
-            away_goals = match["goals"]["away"]
-            home = match["teams"]["home"]["name"]
-            away = match["teams"]["away"]["name"]
-
-            matches.append(
-                {
-                    "id": id,
-                    "season": season,
-                    "date": date,
-                    "home": home,
-                    "home_goals": home_goals,
-                    "away": away,
-                    "away_goals": away_goals,
-                    "venue": venue,
-                    "status": status,
-                }
-            )
+        querystring = {"league": str(league), "season": season}
+        data = _request_fixtures(url, headers, querystring)
 
         # Add to DataFrame
-        fixtures = pd.concat([fixtures, pd.DataFrame(matches)], ignore_index=True)
+        fixtures = pd.concat([fixtures, _parse_fixtures(data, season)],
+                             ignore_index=True)
 
     # Clean the data
-    int_columns = ["id", "season", "home_goals", "away_goals"]
-    fixtures[int_columns] = fixtures[int_columns].astype("Int64")
-    fixtures["date"] = pd.to_datetime(fixtures["date"], errors="coerce")
+    fixtures = _clean_fixtures(fixtures, registry)
 
-    # Fix club names
-    variant_to_standard = {
-        variant: standard for standard, variants in CLUBS.items() for variant in variants
-    }
-    fixtures["home"] = fixtures["home"].apply(lambda x: variant_to_standard.get(x, x))
-    fixtures["away"] = fixtures["away"].apply(lambda x: variant_to_standard.get(x, x))
-
-    fixtures.to_parquet(cache_file)
+    with METRICS.timer("ingest_parquet_seconds", source="api-football", op="write"):
+        fixtures.to_parquet(cache_file)
     print(f"Fixtures fetched successfully and cached to {cache_file}.")
+    METRICS.inc("ingest_rows_total", len(fixtures), source="api-football")
+    METRICS.observe("ingest_duration_seconds", time.perf_counter() - start,
+                    source="api-football")
+    METRICS.set("ingest_last_success_timestamp", time.time(),
+                source="api-football")
 
-    return fixtures
+    return registry.add_codes(fixtures)
 
 
-def compute_initial_tilts(fixtures_df, base_goals=False, max_matches=50):
+def fetch_fixture_updates(ids, registry=None, url=FIXTURES_URL, session=None):
+    """
+    Fetch the current state of specific fixtures.
 
-    # Mean goals
-    if not base_goals:
-        base_goals = fixtures_df.home_goals.mean() + fixtures_df.away_goals.mean()
+    Uses the ids parameter of the fixtures endpoint, so polling a matchday
+    costs one request per MAX_IDS_PER_REQUEST fixtures instead of one per
+    season.
+
+    Args:
+        ids: Fixture ids
+        registry: Club registry mapping the names (default: shared registry)
+        url: Fixtures endpoint, can point to a stub API
+        session: Optional requests.Session to use
+
+    Returns:
+        DataFrame: Fixture rows like get_fixtures(), without club codes
+    """
+    if registry is None:
+        registry = get_registry()
+    ids = [int(i) for i in ids]
+    if not ids:
+        return pd.DataFrame()
+
+    headers = _api_headers()
+    parts = []
+    for first in range(0, len(ids), MAX_IDS_PER_REQUEST):
+        batch = ids[first:first + MAX_IDS_PER_REQUEST]
+        querystring = {"ids": "-".join(str(i) for i in batch)}
+        parts.append(_parse_fixtures(_request_fixtures(url, headers,
+                                                       querystring, session)))
+
+    updates = pd.concat(parts, ignore_index=True)
+    if updates.empty:
+        return updates
+    METRICS.inc("ingest_rows_total", len(updates), source="api-football")
+    return _clean_fixtures(updates, registry)
+
+
+def team_match_windows(fixtures_df, max_matches=50):
+    """
+    Most recent played matches per team as flat arrays.
 
-    team_matches = defaultdict(list)
+    Every played fixture appears twice, once for each team. Only the latest
+    max_matches per team are kept.
 
-    # 1. Build up a history per team from played games
+    Returns:
+        tuple: (teams, team, opponent, total_goals) where team and opponent
+               are indices into the teams list
+    """
     played = fixtures_df.dropna(subset=["home_goals", "away_goals"])
 
-    for _, row in played.iterrows():
-        home = row["home"]
-        away = row["away"]
-        total_goals = row["home_goals"] + row["away_goals"]
-        date = row["date"]
+    codes, teams = pd.factorize(pd.concat([played["home"], played["away"]]))
+    n = len(played)
+    team = codes
+    opponent = np.concatenate([codes[n:], codes[:n]])
+    total_goals = (played["home_goals"] + played["away_goals"]).to_numpy(dtype=float)
+    total_goals = np.concatenate([total_goals, total_goals])
+    dates = pd.to_datetime(played["date"], utc=True).to_numpy(dtype="datetime64[ns]")
+    dates = np.concatenate([dates, dates]).astype(np.int64)
 
-        # Append match info to both home and away teams
-        team_matches[home].append((away, total_goals, "home", date))
-        team_matches[away].append((home, total_goals, "away", date))
+    # Latest first within each team, then cut to the window
+    order = np.lexsort((-dates, team))
+    team, opponent, total_goals = team[order], opponent[order], total_goals[order]
+    first = np.searchsorted(team, np.arange(len(teams)))
+    rank = np.arange(len(team)) - first[team]
+    recent = rank < max_matches
 
-    # 2. Estimate tilt per team
-    team_tilt_raw = {}
-    for team, matches in team_matches.items():
-        # Sort by date (latest first), then take last max_matches
-        matches = sorted(matches, key=lambda x: x[3], reverse=True)[:max_matches]
+    return list(teams), team[recent], opponent[recent], total_goals[recent]
 
-        tilt_product_sum = 0
-        count = 0
 
-        for opponent, total_goals, loc, _ in matches:
-            if opponent not in team_matches:
-                continue  # skip incomplete data
+def _default_tilts(fixtures_df):
+    # Tilt 1.0 for every club, used before any game has been played
+    clubs = pd.unique(fixtures_df[["home", "away"]].to_numpy().ravel())
+    return {club: 1.0 for club in clubs}
 
-            # crude approx: assume opponent has tilt = 1 during initialization
-            opp_tilt = 1
 
-            if loc == "home":
-                # total_goals = team_tilt * opp_tilt * base_goals
-                tilt_estimate = total_goals / (opp_tilt * base_goals)
-            else:  # away
-                tilt_estimate = total_goals / (opp_tilt * base_goals)
+def _has_played(fixtures_df):
+    return fixtures_df[["home_goals", "away_goals"]].notna().all(axis=1).any()
 
-            tilt_product_sum += tilt_estimate
-            count += 1
 
-        if count > 0:
-            team_tilt_raw[team] = max(0.5, min(2.0, tilt_product_sum / count))
-        else:
-            team_tilt_raw[team] = 1.0  # fallback
+def _mean_goals(fixtures_df, base_goals):
+    if not base_goals:
+        base_goals = fixtures_df.home_goals.mean() + fixtures_df.away_goals.mean()
+    return float(base_goals)
 
-    return team_tilt_raw
+
+def compute_initial_tilts(fixtures_df, base_goals=False, max_matches=50):
+    """
+    Quick tilt estimate per team, assuming every opponent has tilt 1.
+
+    See fit_tilts() for mutually consistent tilts.
+    """
+    if not _has_played(fixtures_df):
+        return _default_tilts(fixtures_df)
+    base_goals = _mean_goals(fixtures_df, base_goals)
+    teams, team, _, total_goals = team_match_windows(fixtures_df, max_matches)
+
+    count = np.bincount(team, minlength=len(teams))
+    estimate = np.bincount(team, total_goals / base_goals, minlength=len(teams))
+    tilt = np.clip(estimate / np.maximum(count, 1), 0.5, 2.0)
+    tilt[count == 0] = 1.0  # fallback
+
+    return dict(zip(teams, tilt.tolist()))
+
+
+def fit_tilts(fixtures_df, base_goals=False, max_matches=50, tol=1e-6,
+              max_iter=100):
+    """
+    Solve for all team tilts at once.
+
+    Finds the fixed point of tilt = mean(total_goals / (opp_tilt * base_goals))
+    over each team's latest max_matches games, i.e. the relation
+    total_goals = tilt_home * tilt_away * base_goals used by simulate_goals,
+    with tilts clamped to 0.5-2.0.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        base_goals: Mean total goals per match (default: from fixtures_df)
+        max_matches: Number of most recent matches used per team
+        tol: Stop when no tilt changes by more than this
+        max_iter: Maximum number of iterations
+
+    Returns:
+        dict: Mapping of team names to tilts (1.0 for every team when no
+              games have been played yet)
+    """
+    if not _has_played(fixtures_df):
+        return _default_tilts(fixtures_df)
+    base_goals = _mean_goals(fixtures_df, base_goals)
+    teams, team, opponent, total_goals = team_match_windows(fixtures_df,
+                                                            max_matches)
+
+    count = np.maximum(np.bincount(team, minlength=len(teams)), 1)
+    ratio = total_goals / base_goals
+    tilt = np.ones(len(teams))
+
+    for _ in range(max_iter):
+        target = np.bincount(team, ratio / tilt[opponent],
+                             minlength=len(teams)) / count
+        # Geometric damping; the plain update oscillates between x and c/x
+        new_tilt = np.clip(np.sqrt(tilt * target), 0.5, 2.0)
+        converged = np.max(np.abs(new_tilt - tilt)) < tol
+        tilt = new_tilt
+        if converged:
+            break
+
+    return dict(zip(teams, tilt.tolist()))
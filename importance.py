@@ -0,0 +1,140 @@
+"""
+Importance sampling of rare season outcomes.
+
+Probabilities like a top club being relegated are 0 in a normal run. Here
+the season is simulated with biased ratings that make the target event
+common (e.g. the club 150 ELO points weaker), and every simulated season is
+weighted by the likelihood ratio of its match outcomes under the real and
+the biased ratings, replayed with sensitivity.replay_log_likelihood(). The
+weighted estimates are unbiased and come with standard errors.
+"""
+
+import numpy as np
+import pandas as pd
+
+from const import ZONES
+from elo import get_context
+from sensitivity import replay_log_likelihood
+from simulation import season_inputs, simulate_season_batch
+from table import zone_bounds, zone_probabilities
+
+DEFAULT_BIAS = 150  # ELO points the target club is shifted towards the event
+
+
+def simulate_season_weighted(fixtures_df, bias, n_simulations=10000,
+                             season=2025, seed=None, cutoff_date=None,
+                             hfa=None, base_goals=None,
+                             simulate_goals=True, elo_updates=True,
+                             margin=False, tilt_updates=False,
+                             noise=None, context=None):
+    """
+    Simulate the rest of a season with biased ratings.
+
+    Ratings, tilts and the model parameters come from context (default: the
+    elo module's default context, see set_elo_df()/set_tilts()); hfa,
+    base_goals and noise override it.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        bias: Dict of club -> ELO shift used for sampling only
+        n_simulations: Number of simulated seasons
+
+    Returns:
+        tuple: (teams list, batch dict as from simulate_season_batch(),
+               (n_simulations,) likelihood ratio weights with mean 1 in
+               expectation)
+    """
+    context = get_context(context)
+    noise = context.noise if noise is None else noise
+    inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+    teams = inputs["teams"]
+    shift = np.zeros(len(teams))
+    for club, delta in bias.items():
+        shift[teams.index(club)] = delta
+
+    params = {
+        "hfa": context.hfa if hfa is None else hfa,
+        "base_goals": context.base_goals if base_goals is None else base_goals,
+        "simulate_goals": simulate_goals,
+        "elo_updates": elo_updates,
+        "margin": margin,
+        "tilt_updates": tilt_updates,
+        "k": context.k,
+    }
+    biased_elo = inputs["elo"] + shift
+    batch = simulate_season_batch(
+        inputs["home"], inputs["away"], biased_elo, inputs["tilt"],
+        inputs["base_table"], n_simulations, noise=noise,
+        rng=np.random.default_rng(seed), keep_outcomes=True, **params,
+    )
+
+    log_likelihood = replay_log_likelihood(
+        batch, inputs["home"], inputs["away"], biased_elo, inputs["tilt"],
+        np.stack([-shift, np.zeros(len(teams))]), **params,
+    )
+    weights = np.exp(log_likelihood[0] - log_likelihood[1])
+    return teams, batch, weights
+
+
+def weighted_zone_probabilities(teams, batch, weights, zones=ZONES):
+    """
+    Weighted zone probabilities with standard errors.
+
+    Returns:
+        DataFrame: One row per team, a probability and an SE column (in
+                   percent) per zone
+    """
+    n_simulations = len(weights)
+    hits = zone_probabilities(np.eye(len(teams))[batch["Position"] - 1], zones)
+    weighted = weights[:, None, None] * hits
+    probability = weighted.mean(axis=0) * 100
+    se = weighted.std(axis=0, ddof=1) / np.sqrt(n_simulations) * 100
+
+    columns = {}
+    for i, zone in enumerate(zones):
+        columns[zone] = probability[:, i]
+        columns[f"{zone} SE"] = se[:, i]
+    return pd.DataFrame(columns, index=pd.Index(teams, name="Team"))
+
+
+def effective_sample_size(weights):
+    """Kish effective sample size of importance weights."""
+    return weights.sum() ** 2 / (weights ** 2).sum()
+
+
+def rare_event_probability(fixtures_df, club, zone, bias=None,
+                           n_simulations=10000, **kwargs):
+    """
+    Probability that club finishes in zone, by importance sampling.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        club: Club of the event, e.g. "Bodø/Glimt"
+        zone: (first, last) position, negative counts from the bottom,
+              e.g. (-2, -1) for relegation
+        bias: ELO shift of club while sampling (default: DEFAULT_BIAS
+              towards the zone, down for zones in the bottom half of the
+              table, up otherwise)
+        n_simulations: Number of simulated seasons
+        **kwargs: Passed on to simulate_season_weighted()
+
+    Returns:
+        dict: probability and se (in percent) and ess
+    """
+    if bias is None:
+        season_df = fixtures_df[fixtures_df.season == kwargs.get("season", 2025)]
+        n_teams = len(pd.unique(season_df[["home", "away"]].to_numpy().ravel()))
+        first, last = zone_bounds(zone, n_teams)
+        bottom_half = first + last > n_teams + 1
+        bias = -DEFAULT_BIAS if bottom_half else DEFAULT_BIAS
+
+    teams, batch, weights = simulate_season_weighted(
+        fixtures_df, {club: bias}, n_simulations, **kwargs
+    )
+    table = weighted_zone_probabilities(teams, batch, weights,
+                                        {"event": tuple(zone)})
+    return {
+        "probability": float(table.loc[club, "event"]),
+        "se": float(table.loc[club, "event SE"]),
+        "ess": float(effective_sample_size(weights)),
+    }
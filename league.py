@@ -0,0 +1,145 @@
+"""
+League configuration and multi-league simulation.
+
+A League bundles everything that used to be Eliteserien specific: the
+api-football league id, home field advantage, mean goals, table zones and
+the club name map. simulate_leagues() forecasts many leagues in one batch on
+a shared process pool, starting the leagues with the most remaining work
+first so the pool stays busy until the end.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from clubs import ClubRegistry
+from const import CLUB_SOURCES, LEAGUES, ZONES
+from elo import SimulationContext
+from fetch_elo import fetch_elo_data
+from fixtures import fit_tilts, get_fixtures
+from simulation import simulate_season
+
+
+class League:
+
+    def __init__(self, key, name, api_id, hfa, mean_goals, zones=ZONES,
+                 clubs=None, seasons=None):
+        self.key = key
+        self.name = name
+        self.api_id = api_id
+        self.hfa = hfa
+        self.mean_goals = mean_goals
+        self.zones = dict(zones)
+        self.clubs = dict(clubs or {})
+        self.seasons = list(seasons or [])
+        self.registry = ClubRegistry(self.clubs, CLUB_SOURCES)
+
+    def __repr__(self):
+        return f"League({self.key!r}, api_id={self.api_id})"
+
+    @classmethod
+    def from_config(cls, key, config=None):
+        """League from a LEAGUES entry (or an explicit config dict)."""
+        config = LEAGUES[key] if config is None else config
+        return cls(key, **config)
+
+    def context(self, elo_df, tilts=None):
+        """SimulationContext with the league's HFA and mean goals."""
+        return SimulationContext(elo_df, tilts, hfa=self.hfa,
+                                 base_goals=self.mean_goals)
+
+    def fixtures(self, cache_file=None, force_refresh=False):
+        """Fixtures of the league's seasons, see fixtures.get_fixtures()."""
+        return get_fixtures(
+            self.seasons,
+            cache_file=cache_file or f"fixtures_{self.key}.parquet",
+            force_refresh=force_refresh,
+            league=self.api_id,
+            registry=self.registry,
+        )
+
+    def elo(self, cache_file=None, force_refresh=False):
+        """Latest ClubELO ratings of the league's clubs."""
+        return fetch_elo_data(
+            cache_file=cache_file or f"elo_{self.key}.parquet",
+            force_refresh=force_refresh,
+            registry=self.registry,
+        )
+
+
+def load_leagues(keys=None):
+    """
+    League objects for the LEAGUES entries in keys (default: all).
+
+    Every league has its own club registry (League.registry); pass it on to
+    export_results() and the logo functions so ids and logo classes match
+    the league's clubs.
+    """
+    return [League.from_config(key) for key in (keys or LEAGUES)]
+
+
+def remaining_fixtures(fixtures_df, season):
+    """Number of unplayed fixtures with a date in a season."""
+    season_df = fixtures_df[fixtures_df.season == season]
+    return int((~season_df["status"].isin(["FT", "PEN"])
+                & season_df["date"].notna()).sum())
+
+
+def _simulate_league(task):
+    league, season, fixtures_df, elo_df, tilts, n_simulations, seed = task
+    results = simulate_season(
+        fixtures_df, n_simulations=n_simulations, season=season,
+        verbose=False, seed=seed, context=league.context(elo_df, tilts),
+    )
+    return league.key, results
+
+
+def simulate_leagues(leagues, season, n_simulations=1000, inputs=None,
+                     max_workers=None, seed=0, force_refresh=False):
+    """
+    Simulate the rest of a season for many leagues on one process pool.
+
+    Leagues are submitted longest first (remaining fixtures x simulations),
+    so idle workers always pick up the largest job left and small leagues
+    fill the gaps at the end.
+
+    Args:
+        leagues: List of League objects
+        season: Season to simulate
+        n_simulations: Simulated seasons per league
+        inputs: Optional dict of league key -> (fixtures_df, elo_df, tilts);
+                missing leagues are loaded with League.fixtures()/elo()
+        max_workers: Worker processes (default: number of CPUs)
+        seed: Base random seed; each league gets its own
+        force_refresh: Refresh the fixture and ELO caches of loaded leagues
+
+    Returns:
+        dict: Mapping of league keys to (stats_tracker, position_counts)
+    """
+    inputs = dict(inputs or {})
+    tasks = []
+    for i, league in enumerate(leagues):
+        if league.key not in inputs:
+            fixtures_df = league.fixtures(force_refresh=force_refresh)
+            inputs[league.key] = (fixtures_df,
+                                  league.elo(force_refresh=force_refresh),
+                                  fit_tilts(fixtures_df))
+        fixtures_df, elo_df, tilts = inputs[league.key]
+        tasks.append((league, season, fixtures_df, elo_df, tilts,
+                      n_simulations, seed + i))
+
+    work = {task[0].key: remaining_fixtures(task[2], season) * n_simulations
+            for task in tasks}
+    tasks.sort(key=lambda task: work[task[0].key], reverse=True)
+    print(f"Simulating {len(tasks)} leagues, "
+          f"{sum(work.values()) // n_simulations} remaining fixtures")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_simulate_league, task) for task in tasks]
+        for future in as_completed(futures):
+            key, result = future.result()
+            results[key] = result
+            print(f"Finished {key} ({len(results)}/{len(tasks)})")
+
+    # Keep the order the leagues were given in
+    return {league.key: results[league.key] for league in leagues}
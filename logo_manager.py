@@ -6,18 +6,40 @@ and visualizations.
 """
 
 import os
+import io
+import re
+import json
 import base64
+import shutil
+import hashlib
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import urllib.parse
 
+from PIL import Image
 
-def get_logo_urls():
+from clubs import get_registry
+from const import ELITESERIEN, SEASONS
+from metrics import METRICS, record_response
+
+LOGO_EXTENSIONS = ['svg', 'png', 'jpg', 'jpeg']
+THUMBNAILS_DIR = '.thumbs'
+MANIFEST_FILE = 'manifest.json'
+THUMBNAIL_SCALE = 2  # Thumbnail pixels per display pixel (sharp on HiDPI)
+
+# (path, size) -> ((inode, mtime, file size), data URI)
+_logo_cache = {}
+
+
+def get_logo_urls(league=ELITESERIEN, season=SEASONS[-1], registry=None):
     """
-    Get logo URLs for all Eliteserien teams from Football API.
+    Get logo URLs for all teams of a league and season from Football API.
     """
     from api_logo_fetcher import get_team_logos_from_api
-    api_logos = get_team_logos_from_api()
+    api_logos = get_team_logos_from_api(league, season, registry)
     if api_logos:
         print(f"Using {len(api_logos)} logos from football API")
         return api_logos
@@ -25,6 +47,120 @@ def get_logo_urls():
         raise Exception("Could not fetch logos from Football API")
 
 
+def _logo_path(team_name, url, logos_dir):
+    safe_name = urllib.parse.quote(team_name, safe='')
+    extension = url.split('.')[-1].lower()
+    if extension not in ['png', 'jpg', 'jpeg', 'svg']:
+        extension = 'png'
+    return os.path.join(logos_dir, f"{safe_name}.{extension}")
+
+
+def load_manifest(logos_dir='logos'):
+    """Logo manifest: team name -> url, path, etag, last_modified, sha256."""
+    manifest_path = os.path.join(logos_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, logos_dir='logos'):
+    manifest_path = os.path.join(logos_dir, MANIFEST_FILE)
+    partial = f"{manifest_path}.partial"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(partial, manifest_path)
+
+
+def request_logo(team_name, url, entry=None, session=None, timeout=10):
+    """
+    Conditionally request a logo.
+
+    Sends If-None-Match / If-Modified-Since from the manifest entry when the
+    logo file is still on disk.
+
+    Returns:
+        tuple: (team_name, response), response is None if the request failed
+    """
+    headers = {}
+    if entry and entry.get('url') == url and os.path.exists(entry.get('path', '')):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        with METRICS.timer("ingest_request_seconds", source="logos"):
+            response = (session or requests).get(url, headers=headers,
+                                                  timeout=timeout)
+        record_response(response, "logos")
+        if response.status_code != 304:
+            response.raise_for_status()
+        METRICS.inc("ingest_cache_total", source="logos",
+                    result="hit" if response.status_code == 304 else "miss")
+        return team_name, response
+    except Exception as e:
+        print(f"Failed to download logo for {team_name}: {e}")
+        METRICS.inc("ingest_request_errors_total", source="logos")
+        return team_name, None
+
+
+def _file_sha256(path):
+    """SHA-256 of a file, None if it does not exist."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _store_logo(team_name, url, response, entry, logos_dir, by_hash,
+                registry=None):
+    """Write a downloaded logo unless the same content is already on disk."""
+    if response.status_code == 304:
+        return entry, 'unchanged'
+
+    if registry is None:
+        registry = get_registry()
+    content = response.content
+    sha256 = hashlib.sha256(content).hexdigest()
+    filepath = _logo_path(team_name, url, logos_dir)
+    new_entry = {
+        'id': registry.ids.get(team_name),
+        'url': url,
+        'path': filepath,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': sha256,
+    }
+
+    if entry and entry.get('sha256') == sha256 and os.path.exists(filepath):
+        return new_entry, 'unchanged'
+
+    # filepath gets new content, so it no longer serves its old hash
+    for known in [known for known, path in by_hash.items() if path == filepath]:
+        del by_hash[known]
+
+    # Identical content is stored once and linked for the other teams. The
+    # source is re-hashed, it may have been rewritten since it was recorded.
+    source = by_hash.get(sha256)
+    if source and source != filepath and _file_sha256(source) == sha256:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        try:
+            os.link(source, filepath)
+        except OSError:
+            shutil.copyfile(source, filepath)
+        return new_entry, 'deduplicated'
+
+    partial = f"{filepath}.partial"
+    with open(partial, 'wb') as f:
+        f.write(content)
+    os.replace(partial, filepath)
+    by_hash[sha256] = filepath
+    return new_entry, 'downloaded'
+
+
 def download_logo(team_name, url, logos_dir='logos'):
     """
     Download a team logo from URL and save it locally.
@@ -37,107 +173,269 @@ def download_logo(team_name, url, logos_dir='logos'):
     Returns:
         str: Path to the downloaded logo file, or None if failed
     """
-    try:
-        # Create safe filename
-        safe_name = urllib.parse.quote(team_name, safe='')
-        extension = url.split('.')[-1].lower()
-        if extension not in ['png', 'jpg', 'jpeg', 'svg']:
-            extension = 'png'
-        
-        filename = f"{safe_name}.{extension}"
-        filepath = os.path.join(logos_dir, filename)
-        
-        # Download the logo
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # Save to file
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"Downloaded logo for {team_name}")
-        return filepath
-        
-    except Exception as e:
-        print(f"Failed to download logo for {team_name}: {e}")
+    _, response = request_logo(team_name, url)
+    if response is None:
         return None
 
+    entry, _ = _store_logo(team_name, url, response, None, logos_dir, {})
+    print(f"Downloaded logo for {team_name}")
+    return entry['path']
 
-def download_all_logos(fetch_logos=False, logos_dir='logos'):
+
+def _thread_session(local, session_factory, sessions, lock):
+    # requests.Session is not guaranteed to be thread-safe: one per thread
+    if not hasattr(local, 'session'):
+        local.session = session_factory()
+        with lock:
+            sessions.append(local.session)
+    return local.session
+
+
+def _request_in_thread(team_name, url, entry, local, session_factory,
+                       sessions, lock):
+    session = _thread_session(local, session_factory, sessions, lock)
+    return request_logo(team_name, url, entry, session)
+
+
+def download_all_logos(fetch_logos=False, logos_dir='logos', logo_urls=None,
+                       max_workers=8, session_factory=requests.Session,
+                       registry=None, league=ELITESERIEN, season=SEASONS[-1]):
     """
-    Download all Eliteserien team logos.
+    Download all team logos.
+
+    All logos are requested in parallel with conditional requests, so a
+    refresh only transfers logos that changed. Files with identical content
+    are stored once.
     
     Args:
         fetch_logos: Whether to actually fetch logos (False by default)
         logos_dir: Directory to save logos in
+        logo_urls: Mapping of team names to logo URLs (default: from the
+                   Football API)
+        max_workers: Number of concurrent downloads
+        session_factory: Callable returning a requests.Session; every
+                         download thread gets its own session
+        registry: Club registry for the ids and, without fetch_logos, the
+                  clubs to look up (default: the shared registry)
+        league: api-football league id the logo URLs are fetched for
+        season: Season the logo URLs are fetched for
     
     Returns:
         dict: Mapping of team names to local logo file paths
     """
     # Create logos directory if it doesn't exist
     Path(logos_dir).mkdir(exist_ok=True)
+    if registry is None:
+        registry = get_registry()
     
     if not fetch_logos:
         print("⏭️  Skipping logo download (fetch_logos=False)")
-        # Return existing logos if available
+        # Return existing logos for every club in the registry
         existing_logos = {}
-        team_names = [
-            'Bodø/Glimt', 'Viking', 'Brann', 'Tromsø', 'Rosenborg',
-            'Molde', 'Sandefjord', 'KFUM Oslo', 'Vålerenga',
-            'Fredrikstad', 'Kristiansund', 'Sarpsborg 08',
-            'Ham-Kam', 'Bryne', 'Strømsgodset', 'Haugesund'
-        ]
-        for team_name in team_names:
-            safe_name = urllib.parse.quote(team_name, safe='')
-            for ext in ['svg', 'png', 'jpg', 'jpeg']:
-                filepath = os.path.join(logos_dir, f"{safe_name}.{ext}")
-                if os.path.exists(filepath):
-                    existing_logos[team_name] = filepath
-                    break
+        for team_name in registry.names:
+            filepath = find_logo(team_name, logos_dir)
+            if filepath:
+                existing_logos[team_name] = filepath
         return existing_logos
     
     print("🔄 Fetching logos from Football API...")
-    logo_urls = get_logo_urls()
+    start = time.perf_counter()
+    if logo_urls is None:
+        logo_urls = get_logo_urls(league, season, registry)
+
+    manifest = load_manifest(logos_dir)
+    by_hash = {
+        entry['sha256']: entry['path'] for entry in manifest.values()
+        if entry.get('sha256') and os.path.exists(entry.get('path', ''))
+    }
+
+    local, sessions, lock = threading.local(), [], threading.Lock()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_request_in_thread, team_name, url,
+                            manifest.get(team_name), local, session_factory,
+                            sessions, lock)
+                for team_name, url in logo_urls.items()
+            ]
+            responses = [future.result() for future in futures]
+    finally:
+        for session in sessions:
+            session.close()
+
     logo_paths = {}
-    
-    for team_name, url in logo_urls.items():
-        path = download_logo(team_name, url, logos_dir)
-        if path:
-            logo_paths[team_name] = path
+    outcomes = {'downloaded': 0, 'unchanged': 0, 'deduplicated': 0}
+    for team_name, response in responses:
+        if response is None:
+            continue
+        entry, outcome = _store_logo(team_name, logo_urls[team_name], response,
+                                     manifest.get(team_name), logos_dir,
+                                     by_hash, registry)
+        manifest[team_name] = entry
+        logo_paths[team_name] = entry['path']
+        outcomes[outcome] += 1
+
+    save_manifest(manifest, logos_dir)
+    if outcomes['downloaded'] or outcomes['deduplicated']:
+        clear_logo_cache()
+    for outcome, count in outcomes.items():
+        METRICS.inc("logo_downloads_total", count, outcome=outcome)
+    METRICS.observe("ingest_duration_seconds", time.perf_counter() - start,
+                    source="logos")
+    METRICS.set("ingest_last_success_timestamp", time.time(), source="logos")
+    print(f"Logos: {outcomes['downloaded']} downloaded, "
+          f"{outcomes['unchanged']} unchanged, "
+          f"{outcomes['deduplicated']} deduplicated")
     
     return logo_paths
 
 
-def get_logo_base64(team_name, logos_dir='logos'):
+def find_logo(team_name, logos_dir='logos'):
+    """
+    Path of a team's logo file, or None if there is none.
+
+    Args:
+        team_name: Name of the team
+        logos_dir: Directory containing logo files
+
+    Returns:
+        str: Path to the logo file
+    """
+    safe_name = urllib.parse.quote(team_name, safe='')
+    for ext in LOGO_EXTENSIONS:
+        filepath = os.path.join(logos_dir, f"{safe_name}.{ext}")
+        if os.path.exists(filepath):
+            return filepath
+    return None
+
+
+def _thumbnail_bytes(filepath, size, source_mtime):
+    """
+    PNG thumbnail of a logo, cached on disk next to the logos and rebuilt
+    when the source file is newer.
+    """
+    logos_dir, filename = os.path.split(filepath)
+    thumbs_dir = os.path.join(logos_dir, THUMBNAILS_DIR)
+    thumb_path = os.path.join(
+        thumbs_dir, f"{os.path.splitext(filename)[0]}-{size}.png"
+    )
+
+    if (os.path.exists(thumb_path)
+            and os.stat(thumb_path).st_mtime_ns >= source_mtime):
+        with open(thumb_path, 'rb') as f:
+            return f.read()
+
+    with Image.open(filepath) as image:
+        image = image.convert('RGBA')
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', optimize=True)
+
+    Path(thumbs_dir).mkdir(exist_ok=True)
+    with open(thumb_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    return buffer.getvalue()
+
+
+def get_logo_base64(team_name, logos_dir='logos', size=None):
     """
     Get a team logo as base64 encoded string for HTML embedding.
-    
+
+    Encoded logos are kept in memory until the logo file changes.
+
     Args:
         team_name: Name of the team
         logos_dir: Directory containing logo files
-    
+        size: Display size in pixels. Raster logos are shrunk to a
+              thumbnail of THUMBNAIL_SCALE x size; None embeds the file as is.
+
     Returns:
         str: Base64 encoded logo data, or None if not found
     """
     try:
-        # Try different extensions
-        safe_name = urllib.parse.quote(team_name, safe='')
-        for ext in ['svg', 'png', 'jpg', 'jpeg']:
-            filepath = os.path.join(logos_dir, f"{safe_name}.{ext}")
-            if os.path.exists(filepath):
-                with open(filepath, 'rb') as f:
-                    encoded = base64.b64encode(f.read()).decode()
-                    if ext == 'svg':
-                        return f"data:image/svg+xml;base64,{encoded}"
-                    else:
-                        return f"data:image/{ext};base64,{encoded}"
-        return None
+        filepath = find_logo(team_name, logos_dir)
+        if filepath is None:
+            return None
+
+        stat = os.stat(filepath)
+        mtime = stat.st_mtime_ns
+        # Replaced or re-linked files change inode, mtime or size
+        version = (stat.st_ino, mtime, stat.st_size)
+        key = (filepath, size)
+        cached = _logo_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        ext = filepath.rsplit('.', 1)[-1]
+        if size is None or ext == 'svg':
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        else:
+            data = _thumbnail_bytes(filepath, size * THUMBNAIL_SCALE, mtime)
+            ext = 'png'
+
+        encoded = base64.b64encode(data).decode()
+        if ext == 'svg':
+            logo_data = f"data:image/svg+xml;base64,{encoded}"
+        else:
+            logo_data = f"data:image/{ext};base64,{encoded}"
+
+        _logo_cache[key] = (version, logo_data)
+        return logo_data
     except Exception as e:
         print(f"Error getting logo for {team_name}: {e}")
         return None
 
 
-def create_logo_html(team_name, size=20, logos_dir='logos'):
+def clear_logo_cache():
+    """Forget all encoded logos, e.g. after logos were replaced on disk."""
+    _logo_cache.clear()
+
+
+def logo_class(team_name, registry=None):
+    """CSS class name for a team's logo (ids from registry, default shared)."""
+    if registry is None:
+        registry = get_registry()
+    if team_name in registry:
+        return f"logo-{registry.ids[team_name]}"
+    return "logo-" + re.sub(r'[^a-zA-Z0-9_-]', '_', team_name)
+
+
+def create_logo_css(team_names, size=20, logos_dir='logos', registry=None):
+    """
+    Create a <style> block that defines every team logo once.
+
+    Use together with create_logo_html(..., embed=False), so a table with
+    many rows carries each logo a single time.
+
+    Args:
+        team_names: Teams to define logos for
+        size: Size of the logos in pixels
+        logos_dir: Directory containing logo files
+        registry: Club registry for the class names (default: the shared
+                  registry), the same as passed to create_logo_html()
+
+    Returns:
+        str: HTML style block
+    """
+    rules = [
+        ".team-logo { display: inline-block; background-size: contain; "
+        "background-repeat: no-repeat; background-position: center; "
+        "vertical-align: middle; }"
+    ]
+    # Only teams with a logo get a size, so spans of the others stay empty
+    for team_name in dict.fromkeys(team_names):
+        logo_data = get_logo_base64(team_name, logos_dir, size=size)
+        if logo_data:
+            rules.append(f".{logo_class(team_name, registry)} {{ width: {size}px; "
+                         f"height: {size}px; margin-right: 5px; "
+                         f"background-image: url({logo_data}); }}")
+
+    return "<style>\n" + "\n".join(rules) + "\n</style>"
+
+
+def create_logo_html(team_name, size=20, logos_dir='logos', embed=True,
+                     registry=None):
     """
     Create HTML img tag for a team logo.
     
@@ -145,11 +443,22 @@ def create_logo_html(team_name, size=20, logos_dir='logos'):
         team_name: Name of the team
         size: Size of the logo in pixels
         logos_dir: Directory containing logo files
+        embed: Inline the logo as a data URI. With False the logo is
+               referenced by CSS class without touching the logo files,
+               see create_logo_css(); teams without a logo render as an
+               empty span.
+        registry: Club registry for the CSS class (default: the shared
+                  registry)
     
     Returns:
         str: HTML img tag, or team name if logo not found
     """
-    logo_data = get_logo_base64(team_name, logos_dir)
+    if not embed:
+        return (f'<span style="white-space: nowrap;">'
+                f'<span class="team-logo {logo_class(team_name, registry)}"></span>'
+                f'{team_name}</span>')
+
+    logo_data = get_logo_base64(team_name, logos_dir, size=size)
     if logo_data:
         # Add white-space: nowrap to prevent wrapping
         style = ("vertical-align: middle; margin-right: 5px; "
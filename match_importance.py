@@ -0,0 +1,172 @@
+"""
+Match importance of the remaining fixtures.
+
+One batch is simulated with every fixture's result kept. For each fixture
+the simulated seasons are grouped by its result (home win, draw, away win)
+and the zone probabilities are computed per group, all fixtures in one
+matrix product, so no conditional re-simulation is needed. A fixture's
+importance for a club and zone is the expected change of the zone
+probability, i.e. the distance between the conditional and the overall
+probability weighted by how often each result happens. Results seen in
+fewer than min_count simulations are left out of the swing, whose extremes
+would otherwise be sampling noise.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from const import ZONES
+from elo import get_context
+from simulation import season_inputs, simulate_season_batch
+from table import zone_probabilities
+
+RESULTS = ["Home win", "Draw", "Away win"]
+MIN_RESULT_COUNT = 100  # Simulations a result needs to count in the swing
+
+
+def conditional_zone_probabilities(batch, n_teams, zones=ZONES):
+    """
+    Zone probabilities given each fixture's result.
+
+    Args:
+        batch: Output of simulate_season_batch(..., keep_outcomes=True)
+        n_teams: Number of teams
+        zones: Dict of zone name -> (first, last) position
+
+    Returns:
+        tuple: ((n_fixtures, 3, n_teams, n_zones) conditional probabilities,
+               NaN where a result never happened, and (n_fixtures, 3)
+               result frequencies)
+    """
+    home_goals, away_goals = batch["HomeGoals"], batch["AwayGoals"]
+    n_simulations, n_fixtures = home_goals.shape
+    result = np.where(home_goals > away_goals, 0,
+                      np.where(home_goals == away_goals, 1, 2))
+
+    # (n_simulations, n_fixtures * 3) result indicators
+    indicators = np.zeros((n_simulations, n_fixtures, 3))
+    np.put_along_axis(indicators, result[..., None], 1, axis=-1)
+    indicators = indicators.reshape(n_simulations, -1)
+
+    # (n_simulations, n_teams * n_zones) zone indicators
+    hits = zone_probabilities(np.eye(n_teams)[batch["Position"] - 1], zones)
+    hits = hits.reshape(n_simulations, -1)
+
+    counts = indicators.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        conditional = (indicators.T @ hits) / counts[:, None]
+
+    return (conditional.reshape(n_fixtures, 3, n_teams, len(zones)),
+            (counts / n_simulations).reshape(n_fixtures, 3))
+
+
+def result_impact(conditional, frequencies):
+    """
+    Expected absolute change of every zone probability by a fixture.
+
+    Args:
+        conditional: (n_fixtures, 3, n_teams, n_zones) conditional
+                     probabilities, see conditional_zone_probabilities()
+        frequencies: (n_fixtures, 3) result frequencies
+
+    Returns:
+        np.ndarray: (n_fixtures, n_teams, n_zones) sum over the results of
+                    frequency * |conditional - overall probability|
+    """
+    weights = frequencies[:, :, None, None]
+    conditional = np.nan_to_num(conditional)  # Results that never happened
+    overall = (weights * conditional).sum(axis=1, keepdims=True)
+    return (weights * np.abs(conditional - overall)).sum(axis=1)
+
+
+def match_importance(fixtures_df, n_simulations=10000, season=2025,
+                     zones=ZONES, seed=None, cutoff_date=None,
+                     simulate_goals=True, elo_updates=True, margin=False,
+                     tilt_updates=False, context=None, rank_by=None,
+                     clubs=None, min_count=MIN_RESULT_COUNT):
+    """
+    Importance of every remaining fixture for every club and zone.
+
+    Ratings, tilts and model parameters come from context (default: the elo
+    module's default context).
+
+    Zones overlap (the winner is also in the CL places), so fixtures are
+    ranked on one zone at a time and never on a sum over zones or clubs.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        n_simulations: Number of simulated seasons
+        zones: Dict of zone name -> (first, last) position
+        rank_by: Zone the ranking is sorted by (default: the first zone)
+        clubs: Clubs whose importance is ranked (default: every team)
+        min_count: Simulations a result needs to count in the swing
+
+    Returns:
+        tuple: (ranking DataFrame with one row per fixture: per zone the
+               largest expected change of a club's probability, most
+               important in rank_by first, and details DataFrame with one
+               row per fixture, team and zone: the zone probability after
+               each result, the swing between the best and worst result
+               and the expected change, all in percent)
+    """
+    rank_by = list(zones)[0] if rank_by is None else rank_by
+    if rank_by not in zones:
+        raise ValueError(f"Unknown zone: {rank_by}")
+
+    context = get_context(context)
+    inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+    teams = inputs["teams"]
+    batch = simulate_season_batch(
+        inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+        inputs["base_table"], n_simulations, hfa=context.hfa,
+        base_goals=context.base_goals, simulate_goals=simulate_goals,
+        elo_updates=elo_updates, margin=margin, tilt_updates=tilt_updates,
+        noise=context.noise, k=context.k, rng=np.random.default_rng(seed),
+        keep_outcomes=True,
+    )
+
+    conditional, frequencies = conditional_zone_probabilities(
+        batch, len(teams), zones
+    )
+    impact = result_impact(conditional, frequencies)
+    frequent = (frequencies * n_simulations >= min_count)[:, :, None, None]
+    frequent_conditional = np.where(frequent, conditional, np.nan)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        # All-NaN slices: fixtures without two frequent results
+        warnings.simplefilter("ignore", RuntimeWarning)
+        swing = (np.nanmax(frequent_conditional, axis=1)
+                 - np.nanmin(frequent_conditional, axis=1))
+
+    fixtures = inputs["fixtures"]
+    n_fixtures, n_teams, n_zones = swing.shape
+    index = pd.MultiIndex.from_product(
+        [range(n_fixtures), teams, list(zones)], names=["fixture", "Team", "Zone"]
+    )
+    details = pd.DataFrame(
+        {result: conditional[:, i].ravel() * 100
+         for i, result in enumerate(RESULTS)},
+        index=index,
+    )
+    details["Swing"] = swing.ravel() * 100
+    details["Impact"] = impact.ravel() * 100
+    details = details.reset_index()
+    details = fixtures.join(details.set_index("fixture"), how="right")
+    details = details.reset_index(drop=True)
+
+    # Per fixture and zone: the club whose probability moves the most
+    clubs = teams if clubs is None else list(clubs)
+    selected = impact[:, [teams.index(club) for club in clubs]]
+    ranking = fixtures.copy()
+    for i, result in enumerate(RESULTS):
+        ranking[f"{result} (%)"] = frequencies[:, i] * 100
+    for z, zone in enumerate(zones):
+        ranking[zone] = selected[:, :, z].max(axis=1) * 100
+    top = selected[:, :, list(zones).index(rank_by)].argmax(axis=1)
+    ranking["Importance"] = ranking[rank_by]
+    ranking["Top team"] = [clubs[j] for j in top]
+    ranking = ranking.sort_values("Importance", ascending=False,
+                                  kind="stable").reset_index(drop=True)
+
+    return ranking, details
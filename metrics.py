@@ -0,0 +1,200 @@
+"""
+Operational metrics of the data refresh pipeline.
+
+A small in-process registry of counters, gauges and histograms with labels,
+used to instrument the ingest functions (fetch_elo_data, get_fixtures,
+download_all_logos): request latency, bytes transferred, cache hits and
+misses, rows ingested, parquet I/O time and remaining API quota. Metrics
+are written as a Prometheus text file (for the node exporter's textfile
+collector) and as a JSON summary.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# name -> (type, help)
+DEFINITIONS = {
+    "ingest_request_seconds": ("histogram", "Latency of HTTP requests"),
+    "ingest_request_errors_total": ("counter", "Failed HTTP requests"),
+    "ingest_bytes_total": ("counter", "Bytes received over HTTP"),
+    "ingest_cache_total": ("counter", "Cache lookups by result (hit/miss)"),
+    "ingest_rows_total": ("counter", "Rows ingested"),
+    "ingest_parquet_seconds": ("histogram", "Parquet read/write time"),
+    "ingest_duration_seconds": ("histogram", "Duration of a whole refresh"),
+    "ingest_last_success_timestamp": ("gauge", "Unix time of the last refresh"),
+    "api_quota_remaining": ("gauge", "Requests left in the API quota"),
+    "logo_downloads_total": ("counter", "Logo downloads by outcome"),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters, gauges and histograms."""
+
+    def __init__(self, definitions=DEFINITIONS, buckets=LATENCY_BUCKETS):
+        self.definitions = dict(definitions)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _check(self, name, kind):
+        defined = self.definitions.get(name, (kind, ""))[0]
+        if defined != kind:
+            raise ValueError(f"{name} is a {defined}, not a {kind}")
+        self.definitions.setdefault(name, (kind, ""))
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        self._check(name, "counter")
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        self._check(name, "gauge")
+        with self._lock:
+            self._values[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a histogram."""
+        self._check(name, "histogram")
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._values.setdefault(
+                key, {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get(self, name, **labels):
+        """Current value of a metric (None if it was never recorded)."""
+        with self._lock:
+            value = self._values.get((name, _label_key(labels)))
+            return dict(value) if isinstance(value, dict) else value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0])
+            values = [(key, dict(v) if isinstance(v, dict) else v)
+                      for key, v in values]
+
+        lines, described = [], set()
+        for (name, key), value in values:
+            kind, help_text = self.definitions[name]
+            if name not in described:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {value}")
+                continue
+            for bound, count in zip(self.buckets, value["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        JSON serializable summary: per metric its type and one entry per
+        label set, histograms with count, sum and mean, plus cache hit
+        ratios per source.
+        """
+        with self._lock:
+            values = list(self._values.items())
+
+        summary = {}
+        for (name, key), value in sorted(values, key=lambda item: item[0]):
+            kind = self.definitions[name][0]
+            entry = summary.setdefault(name, {"type": kind, "values": []})
+            labels = dict(key)
+            if kind == "histogram":
+                entry["values"].append({
+                    "labels": labels,
+                    "count": value["count"],
+                    "sum": value["sum"],
+                    "mean": value["sum"] / value["count"] if value["count"] else None,
+                })
+            else:
+                entry["values"].append({"labels": labels, "value": value})
+
+        ratios = {}
+        for (name, key), value in values:
+            if name == "ingest_cache_total":
+                labels = dict(key)
+                counts = ratios.setdefault(labels.get("source"), {"hit": 0, "miss": 0})
+                counts[labels.get("result")] = counts.get(labels.get("result"), 0) + value
+        summary["cache_hit_ratio"] = {
+            source: counts["hit"] / (counts["hit"] + counts["miss"])
+            for source, counts in ratios.items() if counts["hit"] + counts["miss"]
+        }
+        return summary
+
+    def write(self, prometheus_file="metrics.prom", json_file="metrics.json"):
+        """Write the Prometheus text file and the JSON summary atomically."""
+        for path, content in [(prometheus_file, self.prometheus_text()),
+                              (json_file, json.dumps(self.summary(), indent=2))]:
+            if path is None:
+                continue
+            partial = f"{path}.partial"
+            with open(partial, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(partial, path)
+
+
+# Registry used by the ingest functions
+METRICS = Metrics()
+
+
+def record_response(response, source):
+    """Bytes and remaining quota (RapidAPI rate limit headers) of a response."""
+    METRICS.inc("ingest_bytes_total", len(response.content), source=source)
+    remaining = response.headers.get("x-ratelimit-requests-remaining")
+    if remaining is not None:
+        try:
+            METRICS.set("api_quota_remaining", int(remaining), source=source)
+        except ValueError:
+            pass
+
+
+def write_metrics(prometheus_file="metrics.prom", json_file="metrics.json"):
+    """Write the ingest metrics, see Metrics.write()."""
+    METRICS.write(prometheus_file, json_file)
@@ -0,0 +1,269 @@
+"""
+Kickoff-aware refresh of fixtures, ratings and simulations.
+
+Instead of refetching every season on a fixed schedule, the scheduler reads
+kickoff times and statuses from the cached fixtures and only polls the
+fixtures whose kickoff window has passed but that are not finished yet,
+by id in as few requests as possible. It sleeps until the next kickoff
+window otherwise. Whenever a poll brings new (or corrected) results, the
+ELO state is updated incrementally (load_elo_state) and the season is
+re-simulated.
+
+The clock and the fixtures endpoint are injectable, so a whole matchday can
+be replayed against a stub API with SimulatedClock.
+"""
+
+import os
+import time
+
+import pandas as pd
+
+from clubs import get_registry
+from elo import get_context
+from elo_state import load_elo_state
+from elo_update import PLAYED_STATUSES
+from export import export_results, run_metadata
+from fetch_elo import fetch_elo_data
+from fixtures import FIXTURES_URL, fetch_fixture_updates
+from simulation import simulate_season
+
+RESULT_DELAY = pd.Timedelta(minutes=110)  # Kickoff to final whistle
+POLL_INTERVAL = pd.Timedelta(minutes=15)
+GIVE_UP_AFTER = pd.Timedelta(days=2)  # Postponed games get a new date later
+UPDATE_COLUMNS = ["date", "status", "home_goals", "away_goals", "venue"]
+
+
+class SystemClock:
+    """Wall clock in UTC."""
+
+    def now(self):
+        return pd.Timestamp.now(tz="UTC")
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """Clock that only advances when slept on, for tests and replays."""
+
+    def __init__(self, start):
+        self.time = pd.Timestamp(start)
+        if self.time.tzinfo is None:
+            self.time = self.time.tz_localize("UTC")
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += pd.Timedelta(seconds=seconds)
+
+
+def _kickoffs(fixtures_df):
+    return pd.to_datetime(fixtures_df["date"], utc=True)
+
+
+def due_fixtures(fixtures_df, now, result_delay=RESULT_DELAY,
+                 give_up_after=GIVE_UP_AFTER):
+    """
+    Fixtures that should have finished by now but have no final result.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        now: Current time (tz-aware)
+        result_delay: Time from kickoff until a result is expected
+        give_up_after: Stop polling fixtures this long after kickoff
+
+    Returns:
+        DataFrame: The due fixtures
+    """
+    kickoff = _kickoffs(fixtures_df)
+    finished = fixtures_df["status"].isin(PLAYED_STATUSES)
+    due = (~finished & kickoff.notna() & (kickoff + result_delay <= now)
+           & (kickoff + give_up_after > now))
+    return fixtures_df[due.to_numpy()]
+
+
+def next_poll(fixtures_df, now, result_delay=RESULT_DELAY,
+              poll_interval=POLL_INTERVAL, give_up_after=GIVE_UP_AFTER):
+    """
+    When to poll next: after poll_interval while fixtures are due, else
+    when the next kickoff window passes (None when nothing is left).
+    """
+    if len(due_fixtures(fixtures_df, now, result_delay, give_up_after)):
+        return now + poll_interval
+
+    kickoff = _kickoffs(fixtures_df)
+    finished = fixtures_df["status"].isin(PLAYED_STATUSES).to_numpy()
+    upcoming = kickoff[~finished] + result_delay
+    upcoming = upcoming[upcoming > now]
+    return upcoming.min() if len(upcoming) else None
+
+
+def merge_updates(fixtures_df, updates):
+    """
+    Apply polled fixture rows to fixtures_df.
+
+    Returns:
+        tuple: (updated fixtures DataFrame, ids whose result changed: newly
+               finished, corrected or no longer finished)
+    """
+    fixtures_df = fixtures_df.copy()
+    if updates.empty:
+        return fixtures_df, []
+
+    rows = pd.Index(fixtures_df["id"]).get_indexer(updates["id"])
+    updates = updates[rows >= 0]
+    rows = rows[rows >= 0]
+    before = fixtures_df.iloc[rows]
+
+    was_played = before["status"].isin(PLAYED_STATUSES).to_numpy()
+    now_played = updates["status"].isin(PLAYED_STATUSES).to_numpy()
+    same = (before["status"].to_numpy() == updates["status"].to_numpy())
+    for column in ["home_goals", "away_goals"]:
+        old = before[column].to_numpy(dtype=float, na_value=float("nan"))
+        new = updates[column].to_numpy(dtype=float, na_value=float("nan"))
+        same &= (old == new) | ((old != old) & (new != new))
+    changed = (was_played | now_played) & ~same
+
+    for column in UPDATE_COLUMNS:
+        position = fixtures_df.columns.get_loc(column)
+        values = updates[column].to_numpy()
+        if column == "date":
+            values = pd.to_datetime(values, utc=True)
+        fixtures_df.iloc[rows, position] = values
+
+    return fixtures_df, updates.loc[changed, "id"].tolist()
+
+
+class RefreshScheduler:
+    """
+    Polls finished fixtures around their kickoff times and refreshes
+    ratings and simulations when results come in.
+
+    Args:
+        fixtures_file: Fixtures cache written by get_fixtures()
+        on_results: Callable(fixtures_df, changed_ids) run after new
+                    results (default: update_and_simulate)
+        clock: Object with now() and sleep(seconds) (default: SystemClock)
+        url: Fixtures endpoint, can point to a stub API
+        registry: Club registry (default: the shared registry)
+        season: Season to re-simulate
+        n_simulations: Simulations per refresh
+        elo_file: ClubELO cache used to seed a new ELO state
+        state_file: ELO state file, see load_elo_state()
+        log_file: ELO log file, see load_elo_state()
+        output_dir: Directory for the exported simulation results
+        context: SimulationContext for tilts and model parameters (default:
+                 the elo module's default context)
+        session: Optional requests.Session to use
+    """
+
+    def __init__(self, fixtures_file="fixtures.parquet", on_results=None,
+                 clock=None, url=FIXTURES_URL, registry=None, season=2025,
+                 n_simulations=10000, elo_file="elo_latest.parquet",
+                 state_file="elo_state.parquet", log_file="elo_log.parquet",
+                 output_dir="results", context=None, session=None,
+                 result_delay=RESULT_DELAY, poll_interval=POLL_INTERVAL,
+                 give_up_after=GIVE_UP_AFTER):
+        self.fixtures_file = fixtures_file
+        self.on_results = on_results or self.update_and_simulate
+        self.clock = clock or SystemClock()
+        self.url = url
+        self.registry = registry or get_registry()
+        self.season = season
+        self.n_simulations = n_simulations
+        self.elo_file = elo_file
+        self.state_file = state_file
+        self.log_file = log_file
+        self.output_dir = output_dir
+        self.context = context
+        self.session = session
+        self.result_delay = result_delay
+        self.poll_interval = poll_interval
+        self.give_up_after = give_up_after
+
+    def load_fixtures(self):
+        return pd.read_parquet(self.fixtures_file)
+
+    def save_fixtures(self, fixtures_df):
+        partial = f"{self.fixtures_file}.partial"
+        fixtures_df.to_parquet(partial)
+        os.replace(partial, self.fixtures_file)
+
+    def poll(self):
+        """
+        Poll the due fixtures once, save them and refresh on new results.
+
+        Returns:
+            tuple: (fixtures DataFrame, list of changed fixture ids)
+        """
+        fixtures_df = self.load_fixtures()
+        due = due_fixtures(fixtures_df, self.clock.now(), self.result_delay,
+                           self.give_up_after)
+        if due.empty:
+            return fixtures_df, []
+
+        print(f"Polling {len(due)} fixtures")
+        updates = fetch_fixture_updates(due["id"], self.registry, self.url,
+                                        self.session)
+        fixtures_df, changed = merge_updates(fixtures_df, updates)
+        self.save_fixtures(fixtures_df)
+
+        if changed:
+            print(f"{len(changed)} new results")
+            self.on_results(self.registry.add_codes(fixtures_df.copy()), changed)
+        return fixtures_df, changed
+
+    def update_and_simulate(self, fixtures_df, changed_ids):
+        """Apply the new results to the ELO state and re-simulate the season."""
+        elo_df = fetch_elo_data(self.elo_file, registry=self.registry)
+        state = load_elo_state(elo_df, fixtures_df, self.state_file,
+                               self.log_file)
+        context = get_context(self.context).replace(elo_df=state.ratings)
+
+        seed = int(self.clock.now().timestamp())
+        stats_tracker, _ = simulate_season(
+            fixtures_df, self.n_simulations, season=self.season, seed=seed,
+            context=context, verbose=False,
+        )
+        metadata = run_metadata(
+            self.n_simulations, seed,
+            params={"hfa": context.hfa, "k": context.k, "noise": context.noise,
+                    "base_goals": context.base_goals},
+            inputs={"fixtures": fixtures_df, "elo": state.ratings},
+            season=self.season,
+            trigger_ids=[int(i) for i in changed_ids],
+        )
+        export_results(stats_tracker, metadata, self.output_dir,
+                       distributions=False, registry=self.registry)
+        print(f"Simulation results refreshed in {self.output_dir}")
+        return stats_tracker
+
+    def run(self, until=None, max_polls=None):
+        """
+        Poll and sleep until the season is done, until a time (UTC if
+        naive) or a number of polls.
+
+        Returns:
+            int: Number of polls made
+        """
+        if until is not None:
+            until = pd.Timestamp(until)
+            if until.tzinfo is None:
+                until = until.tz_localize("UTC")
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            fixtures_df, _ = self.poll()
+            polls += 1
+
+            now = self.clock.now()
+            wake = next_poll(fixtures_df, now, self.result_delay,
+                             self.poll_interval, self.give_up_after)
+            if wake is None:
+                print("No fixtures left to poll")
+                break
+            if until is not None and wake > until:
+                break
+            print(f"Next poll at {wake}")
+            self.clock.sleep((wake - now).total_seconds())
+        return polls
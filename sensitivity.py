@@ -0,0 +1,197 @@
+"""
+Sensitivity of season forecasts to club ratings.
+
+Instead of re-simulating the season for every perturbed rating, one batch is
+simulated with its per-fixture ELO noise (zero without noise) and goals
+kept. Given the noise, every simulated season is a deterministic function
+of its match outcomes, which are random draws with or without noise, so
+the season's likelihood under a shifted rating can be replayed exactly.
+Weighting the simulated seasons by the likelihood ratio gives the forecast
+under the shifted rating (importance reweighting). A sensitivity table for
+every club costs one simulation plus one cheap replay.
+"""
+
+import numpy as np
+import pandas as pd
+
+from const import HFA, K_FACTOR, MEAN_GOALS, ZONES
+from elo import expected_score, get_context, margin_weight, updated_tilts
+from simulation import outcome_probabilities, season_inputs, simulate_season_batch
+from table import zone_probabilities
+
+
+def replay_log_likelihood(batch, home, away, elo, tilt, shifts, hfa=HFA,
+                          base_goals=MEAN_GOALS, simulate_goals=True,
+                          elo_updates=True, margin=False, tilt_updates=False,
+                          k=K_FACTOR):
+    """
+    Log-likelihood of every simulated season under shifted ratings.
+
+    Args:
+        batch: Output of simulate_season_batch(..., keep_outcomes=True)
+        home, away, elo, tilt: Kernel inputs the batch was simulated with
+        shifts: (n_shifts, n_teams) array of rating offsets
+        Other arguments: The model settings the batch was simulated with
+
+    Returns:
+        np.ndarray: (n_shifts, n_simulations) log-likelihoods, up to a
+                    constant per simulation that cancels in likelihood ratios
+    """
+    shifts = np.atleast_2d(np.asarray(shifts, dtype=float))
+    n_simulations = batch["HomeGoals"].shape[0]
+    ratings = (np.asarray(elo, dtype=float)[None, None, :]
+               + shifts[:, None, :]).repeat(n_simulations, axis=1)
+    tilts = np.repeat(np.asarray(tilt, dtype=float)[None, :], n_simulations,
+                      axis=0)
+    log_likelihood = np.zeros(ratings.shape[:2])
+
+    for j, (h, a) in enumerate(zip(np.asarray(home).tolist(),
+                                   np.asarray(away).tolist())):
+        home_goals = batch["HomeGoals"][:, j].astype(float)
+        away_goals = batch["AwayGoals"][:, j].astype(float)
+        dr = ratings[:, :, h] + hfa - ratings[:, :, a] + batch["Noise"][:, j]
+        expected = expected_score(dr)
+        exp_total = tilts[:, h] * tilts[:, a] * base_goals
+
+        with np.errstate(divide="ignore"):
+            if simulate_goals:
+                log_likelihood += (home_goals * np.log(exp_total * expected)
+                                   - exp_total * expected
+                                   + away_goals * np.log(exp_total * (1 - expected))
+                                   - exp_total * (1 - expected))
+            else:
+                p_home, p_draw = outcome_probabilities(dr)
+                p_result = np.where(home_goals > away_goals, p_home,
+                                    np.where(home_goals == away_goals, p_draw,
+                                             1 - p_home - p_draw))
+                log_likelihood += np.log(p_result)
+
+        if elo_updates:
+            result = (home_goals > away_goals) + 0.5 * (home_goals == away_goals)
+            exchange = (result - expected) * k
+            if margin and simulate_goals:
+                exchange *= margin_weight(home_goals, away_goals,
+                                          exp_total * expected,
+                                          exp_total * (1 - expected))
+            ratings[:, :, h] += exchange
+            ratings[:, :, a] -= exchange
+
+        if tilt_updates:
+            tilts[:, h], tilts[:, a] = updated_tilts(
+                tilts[:, h], tilts[:, a], home_goals + away_goals, base_goals
+            )
+
+    return log_likelihood
+
+
+def reweighted_zone_probabilities(batch, inputs, shifts, params, zones=ZONES,
+                                  block=16):
+    """
+    Zone probabilities of every team under each rating shift.
+
+    Returns:
+        tuple: ((n_shifts, n_teams, n_zones) probabilities, (n_shifts,)
+               effective sample sizes)
+    """
+    shifts = np.atleast_2d(np.asarray(shifts, dtype=float))
+    n_teams = len(inputs["teams"])
+    # (n_simulations, n_teams, n_zones) indicator of finishing in each zone
+    hits = zone_probabilities(np.eye(n_teams)[batch["Position"] - 1], zones)
+
+    baseline = replay_log_likelihood(
+        batch, inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+        np.zeros((1, n_teams)), **params,
+    )
+    probabilities, ess = [], []
+    for start in range(0, len(shifts), block):
+        log_ratio = replay_log_likelihood(
+            batch, inputs["home"], inputs["away"], inputs["elo"],
+            inputs["tilt"], shifts[start:start + block], **params,
+        ) - baseline
+        weights = np.exp(log_ratio - log_ratio.max(axis=1, keepdims=True))
+        weights /= weights.sum(axis=1, keepdims=True)
+        probabilities.append(np.einsum("sn,ntz->stz", weights, hits))
+        ess.append(1 / (weights ** 2).sum(axis=1))
+
+    return np.concatenate(probabilities), np.concatenate(ess)
+
+
+def elo_sensitivity(fixtures_df, deltas=(-25, 25), clubs=None,
+                    n_simulations=10000, season=2025, zones=ZONES, seed=None,
+                    cutoff_date=None, hfa=None, base_goals=None,
+                    simulate_goals=True, elo_updates=True, margin=False,
+                    tilt_updates=False, noise=None, context=None):
+    """
+    Zone probabilities when a club's rating is shifted, from one simulation.
+
+    Ratings, tilts and the model parameters come from context (default: the
+    elo module's default context, see set_elo_df()/set_tilts()); hfa,
+    base_goals and noise override it.
+    Large shifts on few simulations give a low effective sample size (ESS),
+    which is reported per shift.
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        deltas: Rating shifts in ELO points applied to each club
+        clubs: Clubs to shift (default: every team in the season)
+        n_simulations: Number of simulated seasons
+        zones: Dict of zone name -> (first, last) position
+
+    Returns:
+        DataFrame: Index (Club, Delta, Team), one column per zone in percent
+                   plus ESS; Delta 0 is the unshifted forecast
+    """
+    context = get_context(context)
+    noise = context.noise if noise is None else noise
+
+    inputs = season_inputs(fixtures_df, cutoff_date, season, context=context)
+    teams = inputs["teams"]
+    params = {
+        "hfa": context.hfa if hfa is None else hfa,
+        "base_goals": context.base_goals if base_goals is None else base_goals,
+        "simulate_goals": simulate_goals,
+        "elo_updates": elo_updates,
+        "margin": margin,
+        "tilt_updates": tilt_updates,
+        "k": context.k,
+    }
+    batch = simulate_season_batch(
+        inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+        inputs["base_table"], n_simulations, noise=noise,
+        rng=np.random.default_rng(seed), keep_outcomes=True, **params,
+    )
+
+    clubs = teams if clubs is None else list(clubs)
+    deltas = [0] + [delta for delta in deltas if delta != 0]
+    keys = [(club, delta) for club in clubs for delta in deltas]
+    shifts = np.zeros((len(keys), len(teams)))
+    for i, (club, delta) in enumerate(keys):
+        shifts[i, teams.index(club)] = delta
+
+    probabilities, ess = reweighted_zone_probabilities(
+        batch, inputs, shifts, params, zones
+    )
+
+    index = pd.MultiIndex.from_tuples(
+        [(club, delta, team) for club, delta in keys for team in teams],
+        names=["Club", "Delta", "Team"],
+    )
+    result = pd.DataFrame(probabilities.reshape(-1, len(zones)) * 100,
+                          index=index, columns=list(zones))
+    result["ESS"] = np.repeat(ess, len(teams))
+    return result
+
+
+def elo_derivatives(fixtures_df, step=1, **kwargs):
+    """
+    Change in zone probability (percentage points) per ELO point of each
+    club's rating, by central differences on one reweighted simulation.
+
+    Returns:
+        DataFrame: Index (Club, Team), one column per zone
+    """
+    sensitivity = elo_sensitivity(fixtures_df, deltas=(-step, step), **kwargs)
+    sensitivity = sensitivity.drop(columns="ESS")
+    up = sensitivity.xs(step, level="Delta")
+    down = sensitivity.xs(-step, level="Delta")
+    return (up - down) / (2 * step)
@@ -5,21 +5,28 @@ import numpy as np
 import pandas as pd
 from tqdm.notebook import tqdm
 
-from const import HFA
-from elo import Match
-from table import build_league_table
+from const import ELO_NOISE, HFA, K_FACTOR, MEAN_GOALS
+from elo import (
+    Match,
+    draw_probability,
+    get_context,
+    expected_score,
+    margin_weight,
+    updated_tilts,
+)
+from table import Standings, table_positions
 
 tqdm.pandas()
 
-position_counts = defaultdict(lambda: defaultdict(int))
-
-
-def simulate_match(home, away, n=1000, hfa=HFA, simulate_goals=True):
+def simulate_match(home, away, n=1000, hfa=None, simulate_goals=True,
+                   context=None, seed=None):
+    context = get_context(context)
+    rng = np.random.default_rng(seed)
     results = {"home": 0, "draw": 0, "away": 0}
     scores = defaultdict(int)
 
     for _ in range(n):
-        match = Match(home, away, home_advantage=hfa)
+        match = Match(home, away, home_advantage=hfa, context=context, rng=rng)
         if simulate_goals:
             match.simulate_goals()
             result = (match.home_goals, match.away_goals)
@@ -45,14 +52,159 @@ def simulate_match(home, away, n=1000, hfa=HFA, simulate_goals=True):
     return results
 
 
-def simulate_season(
-    fixtures_df,
-    n_simulations=1000,
-    cutoff_date=None,
-    season=2025,
+STATS = ["Wins", "Draws", "Losses", "GF", "GA", "Points"]
+
+
+def outcome_probabilities(dr):
+    """Home win and draw probabilities of a 1X2 result, for arrays of dr."""
+    p_draw = np.maximum(0.10, draw_probability(dr))
+    p_home = np.clip(expected_score(dr) - p_draw / 2, 0, 1)
+    return p_home, p_draw
+
+
+def simulate_season_batch(
+    home,
+    away,
+    elo,
+    tilt,
+    base_table,
+    n_simulations,
+    hfa=HFA,
+    base_goals=MEAN_GOALS,
     simulate_goals=True,
     elo_updates=True,
+    margin=False,
+    tilt_updates=False,
+    noise=ELO_NOISE,
+    k=K_FACTOR,
+    rng=None,
+    keep_outcomes=False,
 ):
+    """
+    Simulate the remaining fixtures of a season for many seasons at once.
+
+    Fixtures are simulated in order, each one for all simulations in a
+    single array operation, so ELO and tilt updates carry over from one
+    fixture to the next within every simulated season.
+
+    Args:
+        home, away: Integer arrays with team indices of the fixtures
+        elo, tilt: Arrays with the rating and tilt of every team
+        base_table: Dict of STATS -> array per team from played games,
+                    e.g. Standings.arrays()
+        n_simulations: Number of seasons to simulate
+        hfa: Home field advantage in ELO points
+        base_goals: Mean total goals per match
+        simulate_goals: Simulate scorelines (Poisson) instead of 1X2 results
+        elo_updates: Apply the ELO exchange after every simulated match
+        margin: Weight the ELO exchange by goal margin (needs simulate_goals)
+        tilt_updates: Evolve team tilts after every simulated match
+        noise: Std. dev. of the ELO noise per match
+        k: K-factor of the ELO exchange
+        rng: numpy Generator (default: a fresh one)
+        keep_outcomes: Also return the ELO noise and the goals of every
+                       simulated fixture, e.g. for sensitivity.py
+
+    Returns:
+        dict: STATS and "Position" -> (n_simulations, n_teams) arrays, with
+              keep_outcomes also "Noise", "HomeGoals" and "AwayGoals" ->
+              (n_simulations, n_fixtures) arrays
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    table = {
+        stat: np.repeat(np.asarray(base_table[stat], dtype=np.int32)[None, :],
+                        n_simulations, axis=0)
+        for stat in STATS
+    }
+    ratings = np.repeat(np.asarray(elo, dtype=float)[None, :], n_simulations, axis=0)
+    tilts = np.repeat(np.asarray(tilt, dtype=float)[None, :], n_simulations, axis=0)
+    if keep_outcomes:
+        n_fixtures = len(home)
+        outcomes = {
+            "Noise": np.zeros((n_simulations, n_fixtures)),
+            "HomeGoals": np.zeros((n_simulations, n_fixtures), dtype=np.int16),
+            "AwayGoals": np.zeros((n_simulations, n_fixtures), dtype=np.int16),
+        }
+
+    for j, (h, a) in enumerate(zip(np.asarray(home).tolist(),
+                                   np.asarray(away).tolist())):
+        dr = ratings[:, h] + hfa - ratings[:, a]
+        if noise:
+            epsilon = rng.normal(0, noise, n_simulations)
+            dr += epsilon
+            if keep_outcomes:
+                outcomes["Noise"][:, j] = epsilon
+        expected = expected_score(dr)
+
+        exp_total = tilts[:, h] * tilts[:, a] * base_goals
+        if simulate_goals:
+            home_goals = rng.poisson(exp_total * expected)
+            away_goals = rng.poisson(exp_total * (1 - expected))
+        else:
+            p_home, p_draw = outcome_probabilities(dr)
+            roll = rng.random(n_simulations)
+            home_goals = np.where(roll < p_home, 2, 1)
+            away_goals = np.where(roll < p_home + p_draw, 1, 2)
+        if keep_outcomes:
+            outcomes["HomeGoals"][:, j] = home_goals
+            outcomes["AwayGoals"][:, j] = away_goals
+
+        home_win = home_goals > away_goals
+        away_win = home_goals < away_goals
+        draw = ~(home_win | away_win)
+
+        table["Wins"][:, h] += home_win
+        table["Wins"][:, a] += away_win
+        table["Draws"][:, h] += draw
+        table["Draws"][:, a] += draw
+        table["Losses"][:, h] += away_win
+        table["Losses"][:, a] += home_win
+        table["GF"][:, h] += home_goals
+        table["GF"][:, a] += away_goals
+        table["GA"][:, h] += away_goals
+        table["GA"][:, a] += home_goals
+        table["Points"][:, h] += 3 * home_win + draw
+        table["Points"][:, a] += 3 * away_win + draw
+
+        if elo_updates:
+            result = home_win + 0.5 * draw
+            exchange = (result - expected) * k
+            if margin and simulate_goals:
+                exchange *= margin_weight(home_goals, away_goals,
+                                          exp_total * expected,
+                                          exp_total * (1 - expected))
+            ratings[:, h] += exchange
+            ratings[:, a] -= exchange
+
+        if tilt_updates:
+            tilts[:, h], tilts[:, a] = updated_tilts(
+                tilts[:, h], tilts[:, a], home_goals + away_goals, base_goals
+            )
+
+    table["Position"] = table_positions(
+        table["Points"], table["GF"] - table["GA"], table["GF"]
+    )
+    if keep_outcomes:
+        table.update(outcomes)
+
+    return table
+
+
+def season_inputs(fixtures_df, cutoff_date=None, season=2025, standings=None,
+                  context=None):
+    """
+    Kernel inputs for simulating the rest of a season.
+
+    Ratings and tilts come from context (default: the elo module's default
+    context, see set_elo_df()/set_tilts()).
+
+    Returns:
+        dict: teams, home, away, elo, tilt and base_table as passed to
+              simulate_season_batch(), the fixtures to simulate (id, date,
+              home, away) and the number of played games
+    """
     if cutoff_date is None:
         cutoff_date = datetime.max.replace(tzinfo=timezone.utc)
 
@@ -66,79 +218,99 @@ def simulate_season(
         & (fixtures_df["date"] <= cutoff_date)
     ]
 
-    stats_tracker = defaultdict(
-        lambda: {
-            "Wins": [],
-            "Draws": [],
-            "Losses": [],
-            "GF": [],
-            "GA": [],
-            "Points": [],
-        }
-    )
+    if standings is None:
+        standings = Standings.from_fixtures(played)
 
-    position_counts = defaultdict(lambda: defaultdict(int))
+    # Teams in order of appearance, which also breaks exact ties
+    teams = pd.unique(np.concatenate([
+        np.array(standings.teams, dtype=object),
+        to_simulate[["home", "away"]].to_numpy().ravel(),
+    ]))
+    team_index = pd.Index(teams, dtype=object)
 
-    # Save original ELO dataframe if we're doing ELO updates
-    original_elo_df = None
-    if elo_updates:
-        from elo import elo_df
-        original_elo_df = elo_df.copy()
+    context = get_context(context)
 
-    print(
-        f"{len(played)} games have been played. Starting {n_simulations} "
-        f"simulations of {len(to_simulate)} games."
-    )
+    return {
+        "teams": list(teams),
+        "home": team_index.get_indexer(to_simulate["home"]),
+        "away": team_index.get_indexer(to_simulate["away"]),
+        "elo": context.ratings(teams),
+        "tilt": np.array([context.tilt(team) for team in teams], dtype=float),
+        "base_table": standings.arrays(teams),
+        "fixtures": to_simulate[["id", "date", "home", "away"]].reset_index(drop=True),
+        "n_played": len(played),
+    }
 
-    for _ in tqdm(range(n_simulations), desc="Simulating seasons", leave=True):
-        # Restore original ELO dataframe at the start of each simulation
-        if elo_updates:
-            from elo import set_elo_df
-            set_elo_df(original_elo_df.copy())
-
-        simulated_fixtures = played.copy()
-
-        for _, row in to_simulate.iterrows():
-            match = Match(row["home"], row["away"])
-            if simulate_goals:
-                match.simulate_goals()
-                home_goals = match.home_goals
-                away_goals = match.away_goals
-            else:
-                match.simulate_result()
-                if match.result == "home":
-                    home_goals, away_goals = 2, 1
-                elif match.result == "away":
-                    home_goals, away_goals = 1, 2
-                else:
-                    home_goals = away_goals = 1
-
-            if elo_updates:
-                match.apply_elo_exchange()
-
-            sim_row = row.copy()
-            sim_row["home_goals"] = home_goals
-            sim_row["away_goals"] = away_goals
-            sim_row["status"] = "FT"  # Mark simulated games as finished
-
-            simulated_fixtures = pd.concat(
-                [simulated_fixtures, sim_row.to_frame().T], ignore_index=True
-            )
 
-        # Build league table and update stats
-        league_table = build_league_table(simulated_fixtures)
+def simulate_season(
+    fixtures_df,
+    n_simulations=1000,
+    cutoff_date=None,
+    season=2025,
+    simulate_goals=True,
+    elo_updates=True,
+    verbose=True,
+    margin=False,
+    tilt_updates=False,
+    hfa=None,
+    seed=None,
+    standings=None,
+    base_goals=None,
+    context=None,
+):
+    """
+    Simulate the rest of a season n_simulations times.
+
+    Pass standings (a table.Standings of the season's played games) to start
+    every simulation from that precomputed baseline instead of recounting
+    the played fixtures.
+
+    Ratings, tilts and the model parameters come from context (default: the
+    elo module's default context); hfa and base_goals override it.
+
+    Returns:
+        tuple: (stats_tracker, position_counts)
+    """
+    context = get_context(context)
+    inputs = season_inputs(fixtures_df, cutoff_date, season, standings, context)
+
+    if verbose:
+        print(
+            f"{inputs['n_played']} games have been played. Starting "
+            f"{n_simulations} simulations of {len(inputs['home'])} games."
+        )
+
+    batch = simulate_season_batch(
+        inputs["home"],
+        inputs["away"],
+        inputs["elo"],
+        inputs["tilt"],
+        inputs["base_table"],
+        n_simulations,
+        hfa=context.hfa if hfa is None else hfa,
+        base_goals=context.base_goals if base_goals is None else base_goals,
+        simulate_goals=simulate_goals,
+        elo_updates=elo_updates,
+        margin=margin,
+        tilt_updates=tilt_updates,
+        noise=context.noise,
+        k=context.k,
+        rng=np.random.default_rng(seed),
+    )
+
+    return batch_to_trackers(batch, inputs["teams"])
 
-        for _, row in league_table.iterrows():
-            team = row["Team"]
-            stats_tracker[team]["Wins"].append(row["Wins"])
-            stats_tracker[team]["Draws"].append(row["Draws"])
-            stats_tracker[team]["Losses"].append(row["Losses"])
-            stats_tracker[team]["GF"].append(row["GF"])
-            stats_tracker[team]["GA"].append(row["GA"])
-            stats_tracker[team]["Points"].append(row["Points"])
 
-            position = row["Position"]
-            position_counts[team][position] += 1
+def batch_to_trackers(batch, teams):
+    """Convert simulate_season_batch arrays to (stats_tracker, position_counts)."""
+    stats_tracker = {
+        team: {stat: batch[stat][:, i].tolist() for stat in STATS}
+        for i, team in enumerate(teams)
+    }
+    position_counts = {}
+    for i, team in enumerate(teams):
+        positions, counts = np.unique(batch["Position"][:, i], return_counts=True)
+        position_counts[team] = dict(zip(positions.tolist(), counts.tolist()))
 
     return stats_tracker, position_counts
 
@@ -10,9 +10,13 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from const import ZONES
+from table import zone_probabilities
+
 
 def create_comprehensive_table(table_mean, position_probs, stats_tracker,
-                               current_table, elo_df):
+                               current_table, elo_df, zones=ZONES,
+                               points_std=None):
     """
     Create a comprehensive table with all requested metrics.
 
@@ -23,123 +27,53 @@ def create_comprehensive_table(table_mean, position_probs, stats_tracker,
         stats_tracker: Dict with simulation statistics for each team
         current_table: DataFrame with current league table
         elo_df: DataFrame with ELO ratings (Club, Elo columns)
+        zones: Dict of column name -> (first, last) position, negative
+               positions count from the bottom (default: const.ZONES)
+        points_std: Optional Series of points std. dev. per team, used
+                    instead of computing it from stats_tracker
 
     Returns:
         DataFrame: Comprehensive table with all metrics
     """
-    # Start with the expected points table
-    summary_df = table_mean[['Team', 'Exp Points']].copy()
-    
-    # Rename columns to Norwegian
-    summary_df = summary_df.rename(columns={
-        'Team': 'Lag',
-        'Exp Points': 'Forventede poeng'
-    })
+    # Start with the expected points table and join the ELO ratings once
+    summary_df = table_mean[['Team', 'Position', 'Exp Points']].merge(
+        elo_df[['Club', 'Elo']].drop_duplicates('Club'),
+        left_on='Team', right_on='Club', how='left'
+    )
+    teams = summary_df['Team']
+    n_teams = len(summary_df)
 
-    # Add current ELO ratings
-    elo_ratings = []
-    for team in summary_df['Lag']:
-        team_elo_query = elo_df[elo_df['Club'] == team]['Elo']
-        team_elo = team_elo_query.iloc[0] if len(team_elo_query) > 0 else 0
-        elo_ratings.append(team_elo)
-    summary_df['Current ELO'] = elo_ratings
-
-    # Add probabilities for different positions
-    # Champion (1st place only)
-    if 1 in position_probs.columns:
-        champion_prob = position_probs[1].reindex(summary_df['Lag'],
-                                                  fill_value=0).values
-    else:
-        champion_prob = pd.Series(0.0, index=summary_df.index)
-    summary_df['Vinner (%)'] = champion_prob
-
-    # Champions League (1st and 2nd place)
-    cl_prob = pd.Series(0.0, index=summary_df.index)
-    for pos in [1, 2]:
-        if pos in position_probs.columns:
-            reindexed = position_probs[pos].reindex(summary_df['Lag'],
-                                                    fill_value=0)
-            cl_prob += reindexed.values
-    summary_df['CL (%)'] = cl_prob
-
-    # Europe League (1st, 2nd, or 3rd place - cumulative)
-    europe_prob = pd.Series(0.0, index=summary_df.index)
-    for pos in [1, 2, 3]:
-        if pos in position_probs.columns:
-            reindexed = position_probs[pos].reindex(summary_df['Lag'],
-                                                    fill_value=0)
-            europe_prob += reindexed.values
-    summary_df['Europa League (%)'] = europe_prob
-
-    # Conference League (1st, 2nd, 3rd, or 4th place - cumulative)
-    conference_prob = pd.Series(0.0, index=summary_df.index)
-    for pos in [1, 2, 3, 4]:
-        if pos in position_probs.columns:
-            reindexed = position_probs[pos].reindex(summary_df['Lag'],
-                                                    fill_value=0)
-            conference_prob += reindexed.values
-    summary_df['Conference League (%)'] = conference_prob
-
-    # Relegation (15th and 16th place)
-    rel_prob = pd.Series(0.0, index=summary_df.index)
-    for pos in [15, 16]:
-        if pos in position_probs.columns:
-            reindexed = position_probs[pos].reindex(summary_df['Lag'],
-                                                    fill_value=0)
-            rel_prob += reindexed.values
-    summary_df['Nedrykk (%)'] = rel_prob
+    # Zone probabilities from cumulative position probabilities
+    position_matrix = position_probs.reindex(
+        index=teams, columns=range(1, n_teams + 1), fill_value=0
+    ).fillna(0).to_numpy(dtype=float)
+    zone_probs = zone_probabilities(position_matrix, zones)
+    zone_df = pd.DataFrame(zone_probs, columns=list(zones)).round(1)
 
     # Calculate under/overperformance (expected final position vs ELO ranking)
-    # First, create ELO ranking for ONLY Eliteserien teams
-    eliteserien_teams = summary_df['Lag'].tolist()
-    elo_subset = elo_df[elo_df['Club'].isin(eliteserien_teams)]
-    elo_ranking = elo_subset[['Club', 'Elo']].copy()
-    elo_ranking = elo_ranking.sort_values('Elo', ascending=False)
-    elo_ranking = elo_ranking.reset_index(drop=True)
-    elo_ranking['ELO_Rank'] = range(1, len(elo_ranking) + 1)
-
-    # Merge to get ELO ranking for each team
-    elo_rank_dict = dict(zip(elo_ranking['Club'], elo_ranking['ELO_Rank']))
-
-    # Calculate position difference (ELO rank - expected final position)
     # Positive = expected to finish better than ELO ranking suggests
     # Negative = expected to finish worse than ELO ranking suggests
-    position_diff_data = []
-    for team in summary_df['Lag']:
-        elo_rank = elo_rank_dict.get(team, 16)  # Default to last if not found
-        team_data = table_mean[table_mean['Team'] == team]['Position']
-        expected_pos = team_data.iloc[0]
-        diff = elo_rank - expected_pos  # Positive = outperforming ELO
-        position_diff_data.append(diff)
-
-    summary_df['Posisjon diff'] = position_diff_data
+    elo_rank = summary_df['Elo'].rank(ascending=False, method='first')
+    elo_rank = elo_rank.fillna(n_teams)  # Default to last if not found
+    position_diff = elo_rank - summary_df['Position']
 
     # Calculate uncertainty (standard deviation of points)
-    uncertainty_data = []
-    for team in summary_df['Lag']:
-        if team in stats_tracker and len(stats_tracker[team]['Points']) > 0:
-            points_std = np.std(stats_tracker[team]['Points'])
-            uncertainty_data.append(points_std)
-        else:
-            uncertainty_data.append(0.0)
-
-    summary_df['Usikkerhet'] = uncertainty_data
-
-    # Round all percentage columns and ensure no NaN values
-    prob_columns = ['Vinner (%)', 'CL (%)',
-                    'Europa League (%)', 'Conference League (%)',
-                    'Nedrykk (%)']
-    for col in prob_columns:
-        summary_df[col] = summary_df[col].fillna(0).round(1)
-
-    # Round other numeric columns and handle NaN
-    summary_df['Forventede poeng'] = (summary_df['Forventede poeng']
-                                      .fillna(0).round(1))
-    elo_series = pd.Series(elo_ratings).fillna(0).round(0).astype(int)
-    summary_df['Nåværende ELO'] = elo_series
-    pos_diff_series = pd.Series(position_diff_data).fillna(0)
-    summary_df['Posisjon diff'] = pos_diff_series.round(0).astype(int)
-    summary_df['Usikkerhet'] = pd.Series(uncertainty_data).fillna(0).round(2)
+    if points_std is None:
+        points_std = points_std_from_tracker(stats_tracker)
+    uncertainty = points_std.reindex(teams).fillna(0).to_numpy()
+
+    summary_df = pd.concat([
+        pd.DataFrame({
+            'Lag': teams,
+            'Nåværende ELO': summary_df['Elo'].fillna(0).round(0).astype(int),
+            'Forventede poeng': summary_df['Exp Points'].fillna(0).round(1),
+        }),
+        zone_df,
+        pd.DataFrame({
+            'Posisjon diff': position_diff.fillna(0).round(0).astype(int),
+            'Usikkerhet': np.round(uncertainty, 2),
+        }),
+    ], axis=1)
 
     # Sort by expected points (descending)
     summary_df = summary_df.sort_values('Forventede poeng', ascending=False)
@@ -148,19 +82,19 @@ def create_comprehensive_table(table_mean, position_probs, stats_tracker,
     # Add rank column
     summary_df.insert(0, 'Plass', range(1, len(summary_df) + 1))
 
-    # Reorder columns: Rank, Team, Current ELO, Exp Points,
-    # then probabilities, then performance metrics
-    column_order = [
-        'Plass', 'Lag', 'Nåværende ELO', 'Forventede poeng',
-        'Vinner (%)', 'CL (%)', 'Europa League (%)',
-        'Conference League (%)', 'Nedrykk (%)',
-        'Posisjon diff', 'Usikkerhet'
-    ]
-    summary_df = summary_df[column_order]
-
     return summary_df
 
 
+def points_std_from_tracker(stats_tracker):
+    """Points standard deviation per team from a stats tracker, in one pass."""
+    teams = [team for team, stats in stats_tracker.items() if stats['Points']]
+    if not teams:
+        return pd.Series(dtype=float)
+    points = np.array([stats_tracker[team]['Points'] for team in teams],
+                      dtype=float)
+    return pd.Series(points.std(axis=1), index=teams)
+
+
 def create_season_dashboard(table_mean, position_probs, stats_tracker,
                             current_table, elo_df, season=2025):
     """
@@ -239,30 +173,22 @@ def plot_table_comparison(ax, current_table, expected_table, elo_df):
     ax.grid(True, alpha=0.3)
 
 
-def plot_position_uncertainty(ax, stats_tracker):
+def plot_position_uncertainty(ax, stats_tracker, points_std=None):
     """Show how certain the model is about each team's final position."""
-    uncertainties = []
-    for team, stats in stats_tracker.items():
-        points_std = np.std(stats['Points'])
-        uncertainties.append({'Team': team, 'Points_Std': points_std})
-
-    uncertainty_df = pd.DataFrame(uncertainties)
+    if points_std is None:
+        points_std = points_std_from_tracker(stats_tracker)
+    uncertainty_df = pd.DataFrame({'Team': points_std.index,
+                                   'Points_Std': points_std.to_numpy()})
     uncertainty_df = uncertainty_df.sort_values('Points_Std', ascending=True)
 
     y_pos = np.arange(len(uncertainty_df))
-    bars = ax.barh(y_pos, uncertainty_df['Points_Std'])
 
     # Color bars based on uncertainty level
-    for i, bar in enumerate(bars):
-        std_val = uncertainty_df.iloc[i]['Points_Std']
-        q75 = uncertainty_df['Points_Std'].quantile(0.75)
-        q25 = uncertainty_df['Points_Std'].quantile(0.25)
-        if std_val > q75:
-            bar.set_color('red')
-        elif std_val < q25:
-            bar.set_color('green')
-        else:
-            bar.set_color('orange')
+    std_values = uncertainty_df['Points_Std'].to_numpy()
+    q25, q75 = np.quantile(std_values, [0.25, 0.75])
+    colors = np.where(std_values > q75, 'red',
+                      np.where(std_values < q25, 'green', 'orange'))
+    ax.barh(y_pos, std_values, color=colors)
 
     ax.set_yticks(y_pos)
     ax.set_yticklabels(uncertainty_df['Team'])
@@ -335,6 +261,9 @@ def create_dashboard_figures(table_mean, position_probs, stats_tracker,
     """
     Create all dashboard figures for easy access.
 
+    Figures are rendered lazily the first time they are looked up, so only
+    the charts that are actually used cost anything.
+
     Args:
         table_mean: DataFrame with expected final table
         position_probs: DataFrame with position probabilities
@@ -343,39 +272,18 @@ def create_dashboard_figures(table_mean, position_probs, stats_tracker,
         elo_df: DataFrame with ELO ratings
 
     Returns:
-        dict: Dictionary with all figure objects
+        LazyFigures: Mapping of 'dashboard', 'social_media',
+                     'position_comparison' and 'uncertainty' to figures
     """
-    figures = {}
-
-    # Main dashboard
-    figures['dashboard'] = create_season_dashboard(
-        table_mean, position_probs, stats_tracker, current_table, elo_df
-    )
-
-    # Social media friendly version
-    figures['social_media'] = create_social_media_chart(
-        position_probs, table_mean,
-        chart_type="simplified_dashboard",
-        stats_tracker=stats_tracker,
-        current_table=current_table,
-        elo_df=elo_df
-    )
-
-    # Individual charts
-    figures['position_comparison'] = create_social_media_chart(
-        position_probs, table_mean,
-        chart_type="position_comparison",
-        current_table=current_table,
-        elo_df=elo_df
-    )
-
-    figures['uncertainty'] = create_social_media_chart(
-        position_probs, table_mean,
-        chart_type="position_uncertainty",
-        stats_tracker=stats_tracker
-    )
-
-    return figures
+    from visualization import LazyFigures
+
+    return LazyFigures({
+        'table_mean': table_mean,
+        'position_probs': position_probs,
+        'stats_tracker': stats_tracker,
+        'current_table': current_table,
+        'elo_df': elo_df,
+    })
 
 
 def setup_logos(fetch_logos=False):
@@ -429,11 +337,12 @@ def display_comprehensive_analysis(comprehensive_table,
         display_table = comprehensive_table.copy()
 
         try:
-            from logo_manager import create_logo_html
+            from logo_manager import create_logo_css, create_logo_html
 
-            # Replace team names with logo + name HTML
+            # Define each logo once as a CSS class and reference it per row
+            logo_css = create_logo_css(display_table['Lag'], size=20)
             display_table['Lag'] = display_table['Lag'].apply(
-                lambda team: create_logo_html(team, size=20)
+                lambda team: create_logo_html(team, size=20, embed=False)
             )
 
             # Create minimal CSS to prevent wrapping in team column
@@ -452,6 +361,7 @@ def display_comprehensive_analysis(comprehensive_table,
                 padding: 4px 8px;
             }}
             </style>
+            {logo_css}
             {html_table}
             """
 
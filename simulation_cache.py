@@ -0,0 +1,176 @@
+"""
+Content-addressed cache of season simulations.
+
+Results are stored under a hash of everything the simulation depends on:
+the fixtures left to play, the standings, ratings, tilts, model parameters
+and seed. Simulations are run in chunks of chunk_size, chunk i on its own
+random stream spawned from the seed, so asking for more simulations only
+runs the chunks that are missing. A last chunk that is only partly needed
+is simulated (and cached) at the size asked for, like distributed.py does,
+instead of padding it to a whole chunk. The simulations for a given n are
+the same however the cache was filled; the whole chunks are shared with
+every larger n.
+"""
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from elo import get_context
+from simulation import (
+    STATS,
+    batch_to_trackers,
+    season_inputs,
+    simulate_season_batch,
+)
+
+CHUNK_SIZE = 1000  # Not above the default request, so nothing is padded
+
+
+def simulation_key(inputs, params, seed, chunk_size=CHUNK_SIZE):
+    """Content hash of the kernel inputs, parameters, seed and chunk size."""
+    digest = hashlib.sha256()
+    digest.update(repr((sorted(params.items()), seed, chunk_size)).encode())
+    digest.update(repr(list(inputs["teams"])).encode())
+    for name in ["home", "away", "elo", "tilt"]:
+        digest.update(np.ascontiguousarray(inputs[name]).tobytes())
+    for stat in STATS:
+        digest.update(np.asarray(inputs["base_table"][stat],
+                                 dtype=np.int64).tobytes())
+    return digest.hexdigest()[:32]
+
+
+def input_hash(inputs, *extra):
+    """Content hash of named inputs (DataFrames or picklable values) and extras."""
+    digest = hashlib.sha256()
+    for key in sorted(inputs):
+        value = inputs[key]
+        digest.update(key.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(pickle.dumps(list(value.columns)))
+            digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        else:
+            digest.update(pickle.dumps(value))
+    for value in extra:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def _chunk_path(cache_dir, key, chunk, size, chunk_size):
+    if size == chunk_size:
+        return os.path.join(cache_dir, key, f"chunk-{chunk:05d}.npz")
+    # A partial chunk is not a prefix of the whole one, so keep them apart
+    return os.path.join(cache_dir, key, f"chunk-{chunk:05d}-{size}.npz")
+
+
+def _save_chunk(path, batch):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.partial"
+    with open(partial, "wb") as f:
+        np.savez(f, **{stat: batch[stat].astype(np.int16)
+                       for stat in STATS + ["Position"]})
+    os.replace(partial, path)
+
+
+def _load_chunk(path):
+    with np.load(path) as data:
+        return {stat: data[stat] for stat in data.files}
+
+
+def cached_batch(inputs, n_simulations, params, seed=0, cache_dir="sim_cache",
+                 chunk_size=CHUNK_SIZE, verbose=True):
+    """
+    First n_simulations of the chunked simulation, from cache where possible.
+
+    Args:
+        inputs: Kernel inputs, see simulation.season_inputs()
+        n_simulations: Number of simulated seasons
+        params: Keyword arguments for simulate_season_batch()
+        seed: Seed of the SeedSequence the chunk streams are spawned from
+        cache_dir: Cache directory
+        chunk_size: Simulations per chunk
+
+    Returns:
+        dict: STATS and "Position" -> (n_simulations, n_teams) arrays
+    """
+    key = simulation_key(inputs, params, seed, chunk_size)
+    n_chunks = -(-n_simulations // chunk_size)
+    sizes = [min(chunk_size, n_simulations - chunk * chunk_size)
+             for chunk in range(n_chunks)]
+
+    chunks, missing = [], []
+    for chunk, size in enumerate(sizes):
+        path = _chunk_path(cache_dir, key, chunk, size, chunk_size)
+        if os.path.exists(path):
+            chunks.append(_load_chunk(path))
+        else:
+            chunks.append(None)
+            missing.append(chunk)
+
+    if verbose:
+        print(f"{n_chunks - len(missing)} of {n_chunks} chunks cached, "
+              f"simulating {sum(sizes[chunk] for chunk in missing)} seasons")
+
+    for chunk in missing:
+        rng = np.random.default_rng(np.random.SeedSequence(seed,
+                                                           spawn_key=(chunk,)))
+        batch = simulate_season_batch(
+            inputs["home"], inputs["away"], inputs["elo"], inputs["tilt"],
+            inputs["base_table"], sizes[chunk], rng=rng, **params,
+        )
+        _save_chunk(_chunk_path(cache_dir, key, chunk, sizes[chunk],
+                                chunk_size), batch)
+        chunks[chunk] = batch
+
+    return {
+        stat: np.concatenate([chunk[stat] for chunk in chunks])
+        for stat in STATS + ["Position"]
+    }
+
+
+def simulate_season_cached(
+    fixtures_df,
+    n_simulations=1000,
+    cutoff_date=None,
+    season=2025,
+    simulate_goals=True,
+    elo_updates=True,
+    verbose=True,
+    margin=False,
+    tilt_updates=False,
+    hfa=None,
+    seed=0,
+    standings=None,
+    base_goals=None,
+    context=None,
+    cache_dir="sim_cache",
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    simulate_season() with a disk cache.
+
+    Unchanged inputs return stored simulations instantly; raising
+    n_simulations only simulates the extra chunks (and a new partial last
+    chunk).
+
+    Returns:
+        tuple: (stats_tracker, position_counts)
+    """
+    context = get_context(context)
+    inputs = season_inputs(fixtures_df, cutoff_date, season, standings, context)
+    params = {
+        "hfa": context.hfa if hfa is None else hfa,
+        "base_goals": context.base_goals if base_goals is None else base_goals,
+        "simulate_goals": simulate_goals,
+        "elo_updates": elo_updates,
+        "margin": margin,
+        "tilt_updates": tilt_updates,
+        "noise": context.noise,
+        "k": context.k,
+    }
+    batch = cached_batch(inputs, n_simulations, params, seed, cache_dir,
+                         chunk_size, verbose)
+    return batch_to_trackers(batch, inputs["teams"])
@@ -1,86 +1,264 @@
-from collections import defaultdict
-
+import numpy as np
 import pandas as pd
 
+COLUMNS = ["Games", "Wins", "Draws", "Losses", "GF", "GA", "Points"]
+
+SNAPSHOT_DTYPE = np.dtype([
+    ("points", np.int32),
+    ("gd", np.int32),
+    ("gf", np.int32),
+    ("position", np.int32),
+])
+
+
+class Standings:
+    """
+    League standings that are updated in place, one result at a time.
+
+    Seed it once from played fixtures, copy() it cheaply, and add or retract
+    results without recounting the season.
+    """
+
+    def __init__(self, teams=()):
+        self.teams = []
+        self._index = {}
+        self._stats = np.zeros((0, len(COLUMNS)), dtype=np.int64)
+        for team in teams:
+            self._team(team)
+
+    @classmethod
+    def from_fixtures(cls, results_df):
+        """Standings from the completed matches in results_df."""
+        results_df = results_df[results_df["status"].isin(["FT", "PEN"])]
+        pairs = results_df[["home", "away"]].to_numpy()
+        standings = cls(pd.unique(pairs.ravel()))
+        standings.add_results(
+            [standings._index[team] for team in pairs[:, 0]],
+            [standings._index[team] for team in pairs[:, 1]],
+            results_df["home_goals"].to_numpy(dtype=np.int64),
+            results_df["away_goals"].to_numpy(dtype=np.int64),
+        )
+        return standings
+
+    def copy(self):
+        standings = Standings()
+        standings.teams = list(self.teams)
+        standings._index = dict(self._index)
+        standings._stats = self._stats.copy()
+        return standings
+
+    def _team(self, team):
+        index = self._index.get(team)
+        if index is None:
+            index = len(self.teams)
+            self._index[team] = index
+            self.teams.append(team)
+            self._stats = np.vstack(
+                [self._stats, np.zeros((1, len(COLUMNS)), dtype=np.int64)]
+            )
+        return index
+
+    def add_result(self, home, away, home_goals, away_goals, sign=1):
+        """Add one result (sign=-1 retracts it)."""
+        home, away = self._team(home), self._team(away)
+        self._stats[home] += sign * _result_row(home_goals, away_goals)
+        self._stats[away] += sign * _result_row(away_goals, home_goals)
+
+    def remove_result(self, home, away, home_goals, away_goals):
+        """Retract a result that was added before, e.g. a corrected score."""
+        self.add_result(home, away, home_goals, away_goals, sign=-1)
+
+    def add_results(self, home, away, home_goals, away_goals, sign=1):
+        """Add many results given as team index arrays."""
+        home, away = np.asarray(home, dtype=int), np.asarray(away, dtype=int)
+        home_goals = np.asarray(home_goals, dtype=np.int64)
+        away_goals = np.asarray(away_goals, dtype=np.int64)
+        np.add.at(self._stats, home, sign * _result_rows(home_goals, away_goals))
+        np.add.at(self._stats, away, sign * _result_rows(away_goals, home_goals))
+
+    def arrays(self, teams=None):
+        """
+        Column name -> array per team, in the order of teams (default: the
+        standings' own order). Teams without results get zeros.
+        """
+        if teams is None:
+            stats = self._stats
+        else:
+            stats = np.zeros((len(teams), len(COLUMNS)), dtype=np.int64)
+            for i, team in enumerate(teams):
+                if team in self._index:
+                    stats[i] = self._stats[self._index[team]]
+        return {column: stats[:, i].copy() for i, column in enumerate(COLUMNS)}
+
+    def to_frame(self):
+        """League table in the format of build_league_table()."""
+        df_table = pd.DataFrame(self._stats, columns=COLUMNS)
+        df_table.insert(0, "Team", self.teams)
+        df_table["GD"] = df_table["GF"] - df_table["GA"]
+        df_table = df_table.sort_values(
+            ["Points", "GD", "GF"], ascending=False, kind="stable"
+        ).reset_index(drop=True)
+        df_table["Goals"] = df_table["GF"].astype(str) + "-" + df_table["GA"].astype(str)
+        df_table.insert(0, "Position", range(1, len(df_table) + 1))
+
+        df_table["GD"] = df_table["GD"].apply(lambda x: f"+{x}" if x > 0 else str(x))
+
+        df_table = df_table[
+            [
+                "Position",
+                "Team",
+                "Games",
+                "Wins",
+                "Draws",
+                "Losses",
+                "Goals",
+                "GD",
+                "Points",
+                "GF",
+                "GA",
+            ]
+        ]
+
+        return df_table
+
+
+def _result_row(goals_for, goals_against):
+    win = goals_for > goals_against
+    draw = goals_for == goals_against
+    return np.array([1, win, draw, goals_for < goals_against, goals_for,
+                     goals_against, 3 * win + draw], dtype=np.int64)
+
+
+def _result_rows(goals_for, goals_against):
+    win = goals_for > goals_against
+    draw = goals_for == goals_against
+    return np.stack([np.ones_like(goals_for), win, draw,
+                     goals_for < goals_against, goals_for, goals_against,
+                     3 * win + draw], axis=1).astype(np.int64)
 
-def build_league_table(results_df):
 
-    # 1. Filter only completed matches
+def table_positions(points, gd, gf):
+    """
+    Positions from points, goal difference and goals for, ranked along the
+    last axis. Exact ties keep team order.
+    """
+    key = (np.asarray(points, dtype=np.int64) * 4096 + gd + 2048) * 4096 + gf
+    order = np.argsort(-key, axis=-1, kind="stable")
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order,
+                      np.broadcast_to(np.arange(1, key.shape[-1] + 1), key.shape),
+                      axis=-1)
+    return positions
+
+
+def zone_bounds(zone, n_teams):
+    """(first, last) 1-based positions of a zone; negative counts from the bottom."""
+    first, last = zone
+    if first < 0:
+        first += n_teams + 1
+    if last < 0:
+        last += n_teams + 1
+    return first, last
+
+
+def zone_probabilities(position_matrix, zones):
+    """
+    Probability of finishing in each zone.
+
+    Args:
+        position_matrix: (..., n_positions) array of position probabilities
+        zones: Dict of zone name -> (first, last) position
+
+    Returns:
+        np.ndarray: (..., n_zones) array, zones in dict order
+    """
+    position_matrix = np.asarray(position_matrix, dtype=float)
+    n_teams = position_matrix.shape[-1]
+    cumulative = np.cumsum(position_matrix, axis=-1)
+    cumulative = np.concatenate(
+        [np.zeros_like(cumulative[..., :1]), cumulative], axis=-1
+    )
+    bounds = np.array([zone_bounds(zone, n_teams) for zone in zones.values()])
+    return cumulative[..., bounds[:, 1]] - cumulative[..., bounds[:, 0] - 1]
+
+
+def _matchday_codes(results_df, by=None):
+    """
+    Matchday of every result: the fixture's round when the fixtures have
+    one (api-football "Regular Season - 12"), else the calendar date (UTC).
+
+    Returns:
+        tuple: (codes array, matchdays Index in playing order)
+    """
+    dates = pd.to_datetime(results_df["date"], utc=True)
+    if by is None:
+        by = ("round" if "round" in results_df
+              and results_df["round"].notna().all() else "date")
+
+    if by == "date":
+        codes, matchdays = pd.factorize(dates.dt.normalize(), sort=True)
+        return codes, pd.DatetimeIndex(matchdays)
+
+    rounds = results_df["round"].astype(str)
+    numbers = rounds.str.extract(r"(\d+)\s*$", expand=False)
+    if numbers.notna().all():
+        order = numbers.astype(int).groupby(rounds).first()
+    else:
+        # Rounds without numbers are ordered by their typical date
+        order = dates.groupby(rounds).median()
+    matchdays = order.sort_values(kind="stable").index
+    codes = pd.Index(matchdays).get_indexer(rounds)
+    return codes, pd.Index(matchdays, name="round")
+
+
+def table_snapshots(results_df, by=None):
+    """
+    Standings after every matchday of a season in one pass.
+
+    Results are bucketed per matchday and team, and the standings are
+    cumulative sums over the matchdays. A matchday is the fixture's round
+    when the fixtures have a round column, so a round spread over several
+    days or a rearranged game counts with its round; without rounds it is
+    the calendar date (UTC).
+
+    Args:
+        results_df: DataFrame with the fixtures of one season
+        by: "round" or "date" (default: round when available)
+
+    Returns:
+        tuple: (matchdays Index of round labels, or DatetimeIndex of dates,
+               teams list, snapshots) where snapshots is a (matchdays,
+               teams) structured array with points, gd, gf and position
+               (SNAPSHOT_DTYPE)
+    """
     results_df = results_df[results_df["status"].isin(["FT", "PEN"])]
+    day_codes, matchdays = _matchday_codes(results_df, by)
+    team_codes, teams = pd.factorize(
+        results_df[["home", "away"]].to_numpy().ravel()
+    )
+    home, away = team_codes[0::2], team_codes[1::2]
+    home_goals = results_df["home_goals"].to_numpy(dtype=np.int64)
+    away_goals = results_df["away_goals"].to_numpy(dtype=np.int64)
 
-    table = defaultdict(
-        lambda: {
-            "Games": 0,
-            "Wins": 0,
-            "Draws": 0,
-            "Losses": 0,
-            "GF": 0,
-            "GA": 0,
-            "GD": 0,
-            "Points": 0,
-        }
+    per_day = np.zeros((len(matchdays), len(teams), 3), dtype=np.int64)
+    for team, goals_for, goals_against in [(home, home_goals, away_goals),
+                                           (away, away_goals, home_goals)]:
+        points = 3 * (goals_for > goals_against) + (goals_for == goals_against)
+        values = np.stack([points, goals_for - goals_against, goals_for], axis=1)
+        np.add.at(per_day, (day_codes, team), values)
+
+    cumulative = per_day.cumsum(axis=0)
+    snapshots = np.empty((len(matchdays), len(teams)), dtype=SNAPSHOT_DTYPE)
+    snapshots["points"] = cumulative[..., 0]
+    snapshots["gd"] = cumulative[..., 1]
+    snapshots["gf"] = cumulative[..., 2]
+    snapshots["position"] = table_positions(
+        cumulative[..., 0], cumulative[..., 1], cumulative[..., 2]
     )
 
-    for _, row in results_df.iterrows():
-        home, away = row["home"], row["away"]
-        hg, ag = row["home_goals"], row["away_goals"]
-
-        # Update games played
-        table[home]["Games"] += 1
-        table[away]["Games"] += 1
-
-        # Update goals
-        table[home]["GF"] += hg
-        table[home]["GA"] += ag
-        table[home]["GD"] += hg - ag
-
-        table[away]["GF"] += ag
-        table[away]["GA"] += hg
-        table[away]["GD"] += ag - hg
-
-        # Update results
-        if hg > ag:  # Home win
-            table[home]["Wins"] += 1
-            table[home]["Points"] += 3
-            table[away]["Losses"] += 1
-        elif hg < ag:  # Away win
-            table[away]["Wins"] += 1
-            table[away]["Points"] += 3
-            table[home]["Losses"] += 1
-        else:  # Draw
-            table[home]["Draws"] += 1
-            table[away]["Draws"] += 1
-            table[home]["Points"] += 1
-            table[away]["Points"] += 1
-
-    # Convert to DataFrame
-    df_table = pd.DataFrame.from_dict(table, orient="index")
-    df_table.index.name = "Team"
-    df_table = df_table.sort_values(
-        ["Points", "GD", "GF"], ascending=False
-    ).reset_index()
-    df_table["Goals"] = df_table["GF"].astype(str) + "-" + df_table["GA"].astype(str)
-    df_table.insert(0, "Position", range(1, len(df_table) + 1))
-
-    int_columns = ["Games", "Wins", "Draws", "Losses", "GD", "Points"]
-    df_table[int_columns] = df_table[int_columns].astype(int)
-
-    df_table["GD"] = df_table["GD"].apply(lambda x: f"+{x}" if x > 0 else str(x))
-
-    df_table = df_table[
-        [
-            "Position",
-            "Team",
-            "Games",
-            "Wins",
-            "Draws",
-            "Losses",
-            "Goals",
-            "GD",
-            "Points",
-            "GF",
-            "GA",
-        ]
-    ]
+    return matchdays, list(teams), snapshots
+
+
+def build_league_table(results_df):
 
-    return df_table
+    return Standings.from_fixtures(results_df).to_frame()
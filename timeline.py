@@ -0,0 +1,185 @@
+"""
+How each club's zone probabilities evolved through a season.
+
+The season is walked matchday by matchday. Ratings (ClubELO exchange with
+replay_elo, respecting the rating dates like update_elo_with_fixtures) and
+the table (Standings) are advanced incrementally with each matchday's
+results, and the rest of the season is simulated from every cutoff with
+the batched kernel. Cutoffs are simulated in parallel across a process
+pool, in chunks so 100k seasons per cutoff fit in memory.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from const import ZONES
+from elo import get_context
+from elo_update import played_fixture_arrays, replay_elo
+from simulation import simulate_season_batch
+from backtest import check_starting_ratings
+from table import Standings, _matchday_codes, zone_probabilities
+
+CHUNK_SIZE = 20000
+
+
+def _simulate_zones(task):
+    (home, away, ratings, tilt, base_table, n_simulations, zones, params,
+     seed_sequence, chunk_size) = task
+    n_teams = len(ratings)
+    counts = np.zeros((n_teams, n_teams))
+    rngs = [np.random.default_rng(s)
+            for s in seed_sequence.spawn(-(-n_simulations // chunk_size))]
+    for i, rng in enumerate(rngs):
+        size = min(chunk_size, n_simulations - i * chunk_size)
+        batch = simulate_season_batch(home, away, ratings, tilt, base_table,
+                                      size, rng=rng, **params)
+        np.add.at(counts, (np.tile(np.arange(n_teams), size),
+                           batch["Position"].ravel() - 1), 1)
+    return zone_probabilities(counts / n_simulations, zones)
+
+
+def timeline_tasks(fixtures_df, season=2025, context=None, respect_elo_dates=True,
+                   by=None):
+    """
+    Kernel inputs at every cutoff of a season.
+
+    Cutoffs are the start of the season and the end of every matchday with
+    played games. Matchdays are the ones of table.table_snapshots(): the
+    fixture's round when the fixtures have one, else the calendar day
+    (UTC), so both timelines line up.
+
+    Ratings and tilts come from context (default: the elo module's default
+    context). Its elo_df must hold ratings from before the season start,
+    e.g. backtest.starting_ratings(), or the early cutoffs would see later
+    results. The tilts are used as they are at every cutoff, so they should
+    be pre-season tilts as well (e.g. fit_tilts() on earlier seasons);
+    tilts fitted on the whole season leak its results into the forecasts.
+
+    Args:
+        by: "round" or "date" (default: round when available)
+
+    Returns:
+        tuple: (matchdays Index as from table_snapshots(), teams list, list
+               of (home, away, ratings, base_table) per cutoff: the season
+               start, then after every matchday)
+    """
+    context = get_context(context)
+    elo_df = context.elo_df
+    if elo_df is None:
+        raise ValueError("elo_df is not set. Use set_elo_df() before simulating.")
+
+    season_df = fixtures_df[(fixtures_df.season == season)
+                            & fixtures_df["date"].notna()]
+    if season_df.empty:
+        raise ValueError(f"No fixtures with a date in season {season}")
+    season_df = season_df.sort_values("date", kind="stable")
+    teams = list(pd.unique(season_df[["home", "away"]].to_numpy().ravel()))
+    team_index = pd.Index(teams, dtype=object)
+
+    elo_df = elo_df.set_index("Club")
+    missing = [team for team in teams if team not in elo_df.index]
+    if missing:
+        raise ValueError(f"No ELO rating for: {', '.join(missing)}")
+    season_start = pd.to_datetime(season_df["date"], utc=True).min().normalize()
+    check_starting_ratings(elo_df.loc[teams], season_start, "the season start")
+
+    ratings = elo_df.loc[teams, "Elo"].to_numpy(dtype=float)
+    rating_dates = None
+    if respect_elo_dates:
+        elo_dates = pd.to_datetime(elo_df.loc[teams, "EloDate"], utc=True)
+        rating_dates = (elo_dates.dt.tz_localize(None)
+                        .to_numpy(dtype="datetime64[ns]").astype(np.int64))
+
+    # Matchday of every played fixture; unplayed ones are never applied
+    played = season_df["status"].isin(["FT", "PEN"]).to_numpy()
+    codes, matchdays = _matchday_codes(season_df[played], by)
+    matchday = np.full(len(season_df), len(matchdays))
+    matchday[played] = codes
+
+    standings = Standings(teams)
+    home = team_index.get_indexer(season_df["home"])
+    away = team_index.get_indexer(season_df["away"])
+
+    tasks = []
+    for cutoff in range(len(matchdays) + 1):
+        if cutoff:
+            # Apply the results of the matchday that just ended
+            day_df = season_df[matchday == cutoff - 1]
+            results = played_fixture_arrays(day_df, teams)
+            standings.add_results(results["home"], results["away"],
+                                  results["home_goals"], results["away_goals"])
+            ratings, rating_dates, _ = replay_elo(
+                ratings, results, rating_dates, k=context.k, hfa=context.hfa
+            )
+
+        # Everything not applied yet is simulated, played or not, including
+        # postponed fixtures and games of later matchdays
+        remaining = np.flatnonzero(matchday >= cutoff)
+        tasks.append((home[remaining], away[remaining], ratings.copy(),
+                      standings.arrays(teams)))
+
+    return matchdays, teams, tasks
+
+
+def season_timeline(fixtures_df, n_simulations=10000, season=2025,
+                    zones=ZONES, seed=0, context=None, respect_elo_dates=True,
+                    simulate_goals=True, elo_updates=True, margin=False,
+                    tilt_updates=False, max_workers=None,
+                    chunk_size=CHUNK_SIZE, by=None):
+    """
+    Zone probabilities of every club after every matchday of a season.
+
+    Matchdays are the ones of table.table_snapshots(), see timeline_tasks().
+
+    Args:
+        fixtures_df: DataFrame with fixtures
+        n_simulations: Simulated seasons per cutoff
+        season: Season to walk
+        zones: Dict of zone name -> (first, last) position
+        seed: Base random seed; each cutoff gets its own stream
+        context: SimulationContext with the ratings and tilts before the
+                 season (default: the elo module's default context)
+        respect_elo_dates: Only apply results played after a club's EloDate
+        max_workers: Worker processes (default: number of CPUs, 1 runs in
+                     this process)
+        chunk_size: Simulations per kernel call, bounds memory
+        by: "round" or "date" matchdays (default: round when available)
+
+    Returns:
+        tuple: (matchdays Index as from table_snapshots(), teams list,
+               (1 + n_matchdays, n_teams, n_zones) probability array whose
+               row 0 is the season start and row i + 1 is after matchday i)
+    """
+    context = get_context(context)
+    matchdays, teams, tasks = timeline_tasks(fixtures_df, season, context,
+                                             respect_elo_dates, by)
+    tilt = np.array([context.tilt(team) for team in teams], dtype=float)
+    params = {
+        "hfa": context.hfa,
+        "base_goals": context.base_goals,
+        "simulate_goals": simulate_goals,
+        "elo_updates": elo_updates,
+        "margin": margin,
+        "tilt_updates": tilt_updates,
+        "noise": context.noise,
+        "k": context.k,
+    }
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [
+        (home, away, ratings, tilt, base_table, n_simulations, zones, params,
+         seeds[i], chunk_size)
+        for i, (home, away, ratings, base_table) in enumerate(tasks)
+    ]
+
+    print(f"Simulating {len(tasks)} cutoffs with {n_simulations} "
+          f"simulations each")
+    if max_workers == 1:
+        probabilities = [_simulate_zones(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            probabilities = list(pool.map(_simulate_zones, tasks))
+
+    return matchdays, teams, np.stack(probabilities)
@@ -0,0 +1,185 @@
+"""
+Figure pipeline for the season charts.
+
+Figures are rendered lazily, only when they are requested. Exports run in
+worker processes with the headless Agg backend and are named by a content
+hash of the inputs and of the plotting code, so republishing unchanged
+charts costs nothing and a changed chart style is re-rendered. Files of
+older versions are removed after an export.
+"""
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation_cache import input_hash
+
+# Bump when the look of the figures changes outside FIGURE_SOURCES (e.g. fonts)
+FIGURE_VERSION = 1
+# Modules whose source decides how the figures look
+FIGURE_SOURCES = ["visualization.py", "simulation_analysis.py"]
+
+FIGURE_NAMES = ["dashboard", "social_media", "position_comparison",
+                "uncertainty"]
+
+# Chart type passed to create_social_media_chart for each figure name
+CHART_TYPES = {
+    "social_media": "simplified_dashboard",
+    "position_comparison": "position_comparison",
+    "uncertainty": "position_uncertainty",
+}
+
+
+def render_figure(name, inputs):
+    """
+    Render one figure.
+
+    Args:
+        name: One of FIGURE_NAMES
+        inputs: Dict with table_mean, position_probs, stats_tracker,
+                current_table and elo_df
+
+    Returns:
+        matplotlib.figure.Figure: The figure
+    """
+    from simulation_analysis import (
+        create_season_dashboard,
+        create_social_media_chart,
+    )
+
+    if name == "dashboard":
+        return create_season_dashboard(
+            inputs["table_mean"], inputs["position_probs"],
+            inputs["stats_tracker"], inputs["current_table"], inputs["elo_df"]
+        )
+    if name not in CHART_TYPES:
+        raise ValueError(f"Unknown figure: {name}")
+
+    return create_social_media_chart(
+        inputs["position_probs"], inputs["table_mean"],
+        chart_type=CHART_TYPES[name],
+        stats_tracker=inputs["stats_tracker"],
+        current_table=inputs["current_table"],
+        elo_df=inputs["elo_df"],
+    )
+
+
+class LazyFigures(Mapping):
+    """Mapping of figure name -> figure that renders each figure on first access."""
+
+    def __init__(self, inputs, names=FIGURE_NAMES):
+        self.inputs = inputs
+        self.names = list(names)
+        self._figures = {}
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        if name not in self._figures:
+            self._figures[name] = render_figure(name, self.inputs)
+        return self._figures[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+@lru_cache(maxsize=None)
+def figure_code_version():
+    """Hash of FIGURE_VERSION, the matplotlib version and FIGURE_SOURCES."""
+    from importlib.metadata import version
+
+    digest = hashlib.sha256(repr((FIGURE_VERSION,
+                                  version("matplotlib"))).encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for source in FIGURE_SOURCES:
+        with open(os.path.join(here, source), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _prune_figures(output_dir, names, fmt, paths):
+    # Remove the exports of names that no longer match the current hash
+    current = {os.path.basename(path) for path in paths.values()}
+    pattern = re.compile(
+        rf"({'|'.join(re.escape(name) for name in names)})"
+        rf"-[0-9a-f]{{16}}\.{re.escape(fmt)}"
+    )
+    removed = 0
+    for filename in os.listdir(output_dir):
+        if pattern.fullmatch(filename) and filename not in current:
+            os.remove(os.path.join(output_dir, filename))
+            removed += 1
+    return removed
+
+
+_worker_inputs = None
+
+
+def _init_worker(inputs):
+    global _worker_inputs
+    import matplotlib
+    matplotlib.use("Agg")
+    _worker_inputs = inputs
+
+
+def _export_figure(task):
+    import matplotlib.pyplot as plt
+
+    name, path, dpi = task
+    fig = render_figure(name, _worker_inputs)
+    # Write next to the target and rename, so a crash never leaves a
+    # partial file that later looks up to date
+    partial = f"{path}.partial"
+    fig.savefig(partial, dpi=dpi, bbox_inches="tight",
+                format=os.path.splitext(path)[1][1:])
+    plt.close(fig)
+    os.replace(partial, path)
+    return name, path
+
+
+def export_figures(inputs, names=None, output_dir="figures", fmt="png",
+                   dpi=150, max_workers=None):
+    """
+    Export figures to files, skipping those that are already up to date.
+
+    Args:
+        inputs: Dict with table_mean, position_probs, stats_tracker,
+                current_table and elo_df
+        names: Figures to export (default: FIGURE_NAMES)
+        output_dir: Directory for the exported files
+        fmt: File format, e.g. 'png' or 'svg'
+        dpi: Resolution of raster formats
+        max_workers: Worker processes (default: one per figure to render)
+
+    Returns:
+        dict: Mapping of figure names to file paths
+    """
+    names = FIGURE_NAMES if names is None else names
+    os.makedirs(output_dir, exist_ok=True)
+    digest = input_hash(inputs, fmt, dpi, figure_code_version())[:16]
+
+    paths, tasks = {}, []
+    for name in names:
+        path = os.path.join(output_dir, f"{name}-{digest}.{fmt}")
+        paths[name] = path
+        if not os.path.exists(path):
+            tasks.append((name, path, dpi))
+
+    print(f"{len(names) - len(tasks)} figures up to date, rendering {len(tasks)}")
+    if tasks:
+        workers = min(len(tasks), max_workers or os.cpu_count())
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(inputs,)) as pool:
+            for name, path in pool.map(_export_figure, tasks):
+                print(f"Exported {name} to {path}")
+
+    removed = _prune_figures(output_dir, names, fmt, paths)
+    if removed:
+        print(f"Removed {removed} outdated figures")
+    return paths